@@ -0,0 +1,158 @@
+import asyncio
+import asyncpg
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# Streaming exports for /api/export/{fuente}.
+# Rows go from Postgres to the client in chunks, never as a whole result in memory:
+#   - CSV: COPY (query) TO STDOUT, each chunk forwarded as the server sends it
+#   - Parquet: a server-side cursor read in batches, one row group per batch
+# A bounded queue between the database and the response applies backpressure: a slow
+# client slows the COPY down instead of buffering the export in the backend.
+# Each export holds its own connection, outside the request pool.
+
+QUEUE_CHUNKS = 16           # CSV chunks buffered between COPY and the response
+PARQUET_BATCH_ROWS = 50000  # Rows per Parquet row group
+
+# fuente -> table, columns exported, and the columns behind the con_celular / con_email filters
+EXPORT_SOURCES = {
+    "empleados": {
+        "table": "empleados_empresas t",
+        "columns": [
+            "documento", "nombre_completo", "celular", "email", "empresa_id",
+            "cod_departamento", "cod_municipio", "zona_codigo", "puesto_codigo",
+        ],
+        "celular": "celular",
+        "email": "email",
+    },
+    "contactos": {
+        "table": "contactos_hjs t",
+        "columns": [
+            "documento", "nombre_completo", "contacto", "direccion", "barrio",
+            "municipio_texto", "cod_departamento", "cod_municipio",
+        ],
+        "celular": "contacto",
+        "email": None,
+    },
+}
+
+class ExportError(ValueError):
+    """Invalid export filter; the message is safe to return to clients."""
+
+def code_variants(code, width):
+    # Sources store codes both padded and unpadded ('08' / '8')
+    code = code.strip()
+    return [code.zfill(width), code.lstrip("0") or "0"]
+
+def build_export_query(fuente, cod_dept=None, cod_muni=None, grupo_id=None, con_celular=False, con_email=False):
+    """Returns (SQL with $n placeholders, args, exported column names)."""
+    source = EXPORT_SOURCES.get(fuente)
+    if source is None:
+        raise ExportError(f"fuente must be one of {sorted(EXPORT_SOURCES)}")
+
+    conditions, args = [], []
+    def arg(value):
+        args.append(value)
+        return f"${len(args)}"
+
+    if cod_dept:
+        conditions.append(f"t.cod_departamento = ANY({arg(code_variants(cod_dept, 2))}::text[])")
+    if cod_muni:
+        if not cod_dept:
+            raise ExportError("cod_muni needs cod_dept")
+        conditions.append(f"t.cod_municipio = ANY({arg(code_variants(cod_muni, 3))}::text[])")
+    if grupo_id is not None:
+        conditions.append(f"""doc_key(t.documento) IN (
+            SELECT doc_key(r.documento) FROM rel_contacto_grupo r WHERE r.grupo_id = {arg(grupo_id)}::int
+        )""")
+    for flag, column in ((con_celular, source["celular"]), (con_email, source["email"])):
+        if not flag:
+            continue
+        if column is None:
+            raise ExportError(f"{fuente} has no such contact column")
+        conditions.append(f"NULLIF(btrim(t.{column}), '') IS NOT NULL")
+
+    query = f"SELECT {', '.join('t.' + c for c in source['columns'])} FROM {source['table']}"
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    return query, args, source["columns"]
+
+async def stream_csv(connect_kwargs, query, args):
+    """Yields the CSV (with header) of `query` as COPY produces it."""
+    queue = asyncio.Queue(maxsize=QUEUE_CHUNKS)
+    connection = await asyncpg.connect(**connect_kwargs)
+
+    async def produce():
+        try:
+            await connection.copy_from_query(query, *args, output=queue.put, format="csv", header=True)
+        finally:
+            await queue.put(None)
+
+    producer = asyncio.ensure_future(produce())
+    try:
+        while True:
+            chunk = await queue.get()
+            if chunk is None:
+                break
+            yield chunk
+        await producer  # Surfaces COPY errors
+    finally:
+        if producer.done():
+            await connection.close()
+        else:
+            # Client gone mid-export: drop the connection, which also stops the COPY
+            producer.cancel()
+            connection.terminate()
+
+async def stream_parquet(connect_kwargs, query, args, columns):
+    """Yields a Parquet file of `query`, one row group per PARQUET_BATCH_ROWS rows.
+    All columns are strings, as in the source tables."""
+    schema = pa.schema([(c, pa.string()) for c in columns])
+    sink = ChunkSink()
+    writer = pq.ParquetWriter(sink, schema, compression="zstd")
+    connection = await asyncpg.connect(**connect_kwargs)
+    try:
+        async with connection.transaction(readonly=True):
+            cursor = await connection.cursor(query, *args)
+            while True:
+                rows = await cursor.fetch(PARQUET_BATCH_ROWS)
+                if not rows:
+                    break
+                batch = pa.record_batch(
+                    [pa.array([None if r[i] is None else str(r[i]) for r in rows], pa.string())
+                     for i in range(len(columns))],
+                    schema=schema,
+                )
+                writer.write_batch(batch)
+                yield sink.drain()
+        writer.close()
+        yield sink.drain()
+    finally:
+        await connection.close()
+
+class ChunkSink:
+    """Write-only file object for ParquetWriter; drain() hands over what was written."""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
@@ -0,0 +1,208 @@
+import asyncio
+import json
+import os
+import socket
+import traceback
+
+# Background jobs for work too slow for a request: large exports, view refreshes,
+# pipeline runs. Jobs live in the `jobs` table, so they survive restarts and any process
+# can pick them up:
+#   - a worker claims the oldest pending job of a type it handles with
+#     FOR UPDATE SKIP LOCKED, so concurrent workers never take the same job
+#   - running jobs send a heartbeat; at startup, jobs whose heartbeat went stale (their
+#     process died) go back to pending, or fail once they have used max_intentos
+#   - cancelling a running job flags it; the handler stops at its next progress() call
+# The backend runs JOB_WORKERS of them; 'pipeline' jobs are claimed by
+# `python run_pipeline.py --worker` in the ETL image instead.
+WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+POLL_SECONDS = 5
+HEARTBEAT_SECONDS = 15
+STALE_SECONDS = 120  # Heartbeat older than this: the process running the job is gone
+
+STATES = ('pendiente', 'ejecutando', 'completado', 'fallido', 'cancelado')
+
+class JobCancelled(Exception):
+    pass
+
+class JobContext:
+    """Passed to handlers: job parameters, progress reporting and cancellation checks."""
+
+    def __init__(self, queue, job):
+        self.queue = queue
+        self.job_id = job["job_id"]
+        self.params = json.loads(job["parametros"] or "{}") if isinstance(job["parametros"], str) else (job["parametros"] or {})
+
+    async def progress(self, pct=None, mensaje=None):
+        estado = await self.queue.database.fetch_val(query="""
+            UPDATE jobs SET
+                progreso = COALESCE(:pct, progreso),
+                mensaje = COALESCE(:mensaje, mensaje),
+                heartbeat_at = CURRENT_TIMESTAMP
+            WHERE job_id = :job_id
+            RETURNING estado
+        """, values={"job_id": self.job_id, "pct": pct, "mensaje": mensaje})
+        if estado == 'cancelado':
+            raise JobCancelled()
+
+    def result_path(self, extension):
+        os.makedirs(self.queue.results_dir, exist_ok=True)
+        return os.path.join(self.queue.results_dir, f"job_{self.job_id}.{extension}")
+
+class JobQueue:
+    def __init__(self, database, handlers, results_dir, external_types=()):
+        """handlers: {tipo: async fn(JobContext) -> result dict}. external_types: job types
+        accepted on submit but run by another process."""
+        self.database = database
+        self.handlers = handlers
+        self.results_dir = results_dir
+        self.types = set(handlers) | set(external_types)
+        self.worker_name = f"{socket.gethostname()}:{os.getpid()}"
+        self.wakeup = None  # Created in start(), on the server's event loop
+        self.tasks = []
+
+    async def ensure_table(self):
+        # Same definition as database/ddl.sql, for databases created before it existed
+        await self.database.execute(query="""
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id BIGSERIAL PRIMARY KEY,
+                tipo VARCHAR(50) NOT NULL,
+                parametros JSONB DEFAULT '{}',
+                estado VARCHAR(20) NOT NULL DEFAULT 'pendiente',
+                progreso NUMERIC(5, 2) DEFAULT 0,
+                mensaje TEXT,
+                resultado JSONB,
+                intentos SMALLINT NOT NULL DEFAULT 0,
+                max_intentos SMALLINT NOT NULL DEFAULT 3,
+                worker VARCHAR(100),
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                started_at TIMESTAMP,
+                heartbeat_at TIMESTAMP,
+                finished_at TIMESTAMP
+            )
+        """)
+        await self.database.execute(
+            query="CREATE INDEX IF NOT EXISTS idx_jobs_pendientes ON jobs (tipo, job_id) WHERE estado = 'pendiente'"
+        )
+
+    async def start(self, workers=WORKERS):
+        await self.ensure_table()
+        recovered = await self.database.fetch_all(query=f"""
+            UPDATE jobs SET
+                estado = CASE WHEN intentos >= max_intentos THEN 'fallido' ELSE 'pendiente' END,
+                mensaje = 'Interrumpido: el proceso que lo ejecutaba se detuvo',
+                finished_at = CASE WHEN intentos >= max_intentos THEN CURRENT_TIMESTAMP END
+            WHERE estado = 'ejecutando'
+              AND tipo = ANY(:tipos)
+              AND heartbeat_at < CURRENT_TIMESTAMP - INTERVAL '{STALE_SECONDS} seconds'
+            RETURNING job_id, estado
+        """, values={"tipos": list(self.handlers)})
+        if recovered:
+            print(f"Jobs: recovered {len(recovered)} interrupted jobs")
+        self.wakeup = asyncio.Event()
+        self.tasks = [asyncio.ensure_future(self.work()) for _ in range(workers)]
+
+    async def stop(self):
+        if not self.tasks:
+            return
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        # Jobs cut short by the shutdown are picked up again on the next start
+        await self.database.execute(query="""
+            UPDATE jobs SET estado = 'pendiente', intentos = GREATEST(intentos - 1, 0),
+                mensaje = 'Reencolado al detener el servidor'
+            WHERE estado = 'ejecutando' AND worker = :worker
+        """, values={"worker": self.worker_name})
+
+    async def submit(self, tipo, parametros=None):
+        if tipo not in self.types:
+            raise ValueError(f"tipo must be one of {sorted(self.types)}")
+        job_id = await self.database.fetch_val(
+            query="INSERT INTO jobs (tipo, parametros) VALUES (:tipo, CAST(:parametros AS JSONB)) RETURNING job_id",
+            values={"tipo": tipo, "parametros": json.dumps(parametros or {})}
+        )
+        if self.wakeup:
+            self.wakeup.set()
+        return job_id
+
+    async def cancel(self, job_id):
+        """Pending jobs are cancelled at once; running ones stop at their next progress()."""
+        return await self.database.fetch_val(query="""
+            UPDATE jobs SET
+                estado = 'cancelado',
+                finished_at = CASE WHEN estado = 'pendiente' THEN CURRENT_TIMESTAMP ELSE finished_at END
+            WHERE job_id = :job_id AND estado IN ('pendiente', 'ejecutando')
+            RETURNING job_id
+        """, values={"job_id": job_id})
+
+    async def claim(self):
+        return await self.database.fetch_one(query="""
+            UPDATE jobs SET
+                estado = 'ejecutando',
+                worker = :worker,
+                intentos = intentos + 1,
+                started_at = CURRENT_TIMESTAMP,
+                heartbeat_at = CURRENT_TIMESTAMP
+            WHERE job_id = (
+                SELECT job_id FROM jobs
+                WHERE estado = 'pendiente' AND tipo = ANY(:tipos)
+                ORDER BY job_id
+                FOR UPDATE SKIP LOCKED
+                LIMIT 1
+            )
+            RETURNING job_id, tipo, parametros
+        """, values={"worker": self.worker_name, "tipos": list(self.handlers)})
+
+    async def work(self):
+        while True:
+            try:
+                job = await self.claim()
+            except Exception as e:
+                print(f"Jobs: claim failed: {e}")
+                job = None
+            if job is None:
+                self.wakeup.clear()
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), timeout=POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self.run(job)
+
+    async def heartbeat(self, job_id):
+        while True:
+            await asyncio.sleep(HEARTBEAT_SECONDS)
+            await self.database.execute(
+                query="UPDATE jobs SET heartbeat_at = CURRENT_TIMESTAMP WHERE job_id = :job_id",
+                values={"job_id": job_id}
+            )
+
+    async def run(self, job):
+        context = JobContext(self, job)
+        beat = asyncio.ensure_future(self.heartbeat(job["job_id"]))
+        estado, mensaje, resultado = 'completado', None, None
+        try:
+            resultado = await self.handlers[job["tipo"]](context)
+        except JobCancelled:
+            estado, mensaje = 'cancelado', 'Cancelado'
+        except asyncio.CancelledError:
+            raise  # Shutdown: stop() puts the job back in the queue
+        except Exception as e:
+            traceback.print_exc()
+            estado, mensaje = 'fallido', f"{type(e).__name__}: {e}"
+        finally:
+            beat.cancel()
+
+        # A job cancelled while finishing stays cancelled
+        await self.database.execute(query="""
+            UPDATE jobs SET
+                estado = CASE WHEN estado = 'cancelado' THEN 'cancelado' ELSE :estado END,
+                progreso = CASE WHEN :estado = 'completado' THEN 100 ELSE progreso END,
+                mensaje = COALESCE(:mensaje, mensaje),
+                resultado = CAST(:resultado AS JSONB),
+                finished_at = CURRENT_TIMESTAMP
+            WHERE job_id = :job_id
+        """, values={
+            "job_id": job["job_id"], "estado": estado, "mensaje": mensaje,
+            "resultado": json.dumps(resultado, default=str) if resultado is not None else None,
+        })
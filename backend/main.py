@@ -1,9 +1,24 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query, Body
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse, FileResponse, JSONResponse
 import os
+import io
+import re
+import json
+import time
+import asyncio
+from datetime import date
 import databases
+import numpy as np
+import pandas as pd
 from pydantic import BaseModel
 from typing import List, Optional, Any
+from spatial_index import PuestoIndex
+from segments import SegmentIndex, SegmentError
+from exports import build_export_query, stream_csv, stream_parquet, ExportError
+from jobs import JobQueue, JobContext, STATES as JOB_STATES
+from response_cache import ResponseCache, open_store
+from search_norm import search_text
 
 # Database Configuration
 DB_HOST = os.getenv("DB_HOST", "db")
@@ -14,6 +29,8 @@ DB_PASS = os.getenv("DB_PASS", "postgres")
 DATABASE_URL = f"postgresql+asyncpg://{DB_USER}:{DB_PASS}@{DB_HOST}:5432/{DB_NAME}"
 
 database = databases.Database(DATABASE_URL)
+# Same database, for work holding a dedicated connection (exports)
+DB_CONNECT_KWARGS = {"host": DB_HOST, "port": 5432, "database": DB_NAME, "user": DB_USER, "password": DB_PASS}
 
 app = FastAPI(title="HJS Analytics Dashboard")
 
@@ -26,36 +43,226 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-@app.on_event("startup")
-async def startup():
+# Analytics responses, shared by all workers on the host (see response_cache.py).
+# Cleared when a new ETL run shows up in load_runs, and by the reload endpoints.
+response_cache = ResponseCache(open_store())
+
+async def data_version():
+    return await database.fetch_val(query="SELECT MAX(load_run_id) FROM load_runs")
+
+response_cache.version_source = data_version
+
+# Spatial index over puesto coordinates, built at startup and on /api/geo/index/reload
+puesto_index = PuestoIndex([])
+
+async def reload_puesto_index():
+    global puesto_index
+    query = """
+    SELECT
+        cod_departamento, cod_municipio, cod_zona, cod_puesto,
+        nom_departamento, nom_municipio, nombre_puesto, direccion_puesto,
+        mesa, latitud, longitud
+    FROM dim_divipole
+    WHERE latitud IS NOT NULL AND longitud IS NOT NULL
+    """
+    rows = await database.fetch_all(query=query)
+    # Swap in a complete index; requests in flight keep using the old one
+    puesto_index = PuestoIndex(rows)
+    return len(puesto_index)
+
+# Segment engine over segment_personas (etl/build_segments.py). Reloaded at startup, on
+# /api/segments/reload, and by count requests once a newer build shows up in segment_build
+# (checked at most every SEGMENT_CHECK_SECONDS)
+segment_index = SegmentIndex(np.empty((0, 4), np.int64), np.empty((0, 2), np.int64), {})
+segment_lock = asyncio.Lock()
+segment_checked_at = 0.0
+SEGMENT_CHECK_SECONDS = int(os.getenv("SEGMENT_CHECK_SECONDS", "60"))
+
+async def copy_ints(connection, query, columns):
+    # COPY into one buffer: millions of rows fetched as Records would take gigabytes
+    buffer = io.BytesIO()
+    await connection.copy_from_query(query, output=buffer, format="csv")
+    if not buffer.tell():
+        return np.empty((0, columns), np.int64)
+    buffer.seek(0)
+    return pd.read_csv(buffer, header=None, dtype=np.int64).to_numpy()
+
+async def reload_segment_index():
+    global segment_index
+    async with database.connection() as connection:
+        raw = connection.raw_connection
+        # One snapshot: a rebuild committing halfway through cannot mix two builds
+        async with raw.transaction(isolation="repeatable_read", readonly=True):
+            build_id = await raw.fetchval("SELECT MAX(build_id) FROM segment_build")
+            personas = await copy_ints(raw, """
+                SELECT
+                    COALESCE((cod_departamento || cod_municipio)::INTEGER, -1),
+                    COALESCE(ASCII(sexo), 0),
+                    rango_edad,
+                    fuentes
+                FROM segment_personas
+                ORDER BY segment_id
+            """, 4)
+            grupos = await copy_ints(raw, "SELECT grupo_id, segment_id FROM segment_grupos", 2)
+            names = await raw.fetch("SELECT nombre, grupo_id FROM dim_grupos")
+    segment_index = SegmentIndex(personas, grupos, {r["nombre"]: r["grupo_id"] for r in names}, build_id)
+    return len(segment_index)
+
+async def current_segment_index():
+    global segment_checked_at
+    if time.monotonic() - segment_checked_at >= SEGMENT_CHECK_SECONDS:
+        async with segment_lock:
+            if time.monotonic() - segment_checked_at >= SEGMENT_CHECK_SECONDS:
+                latest = await database.fetch_val(query="SELECT MAX(build_id) FROM segment_build")
+                if latest != segment_index.build_id:
+                    await reload_segment_index()
+                segment_checked_at = time.monotonic()
+    return segment_index
+
+# Startup runs in the background, so /health/live answers at once while /health/ready
+# stays 503 until the database is reachable, the in-memory indexes are loaded and the
+# dashboard's first-screen queries are warm (shared buffers and response cache).
+STARTUP_RETRY_MAX_SECONDS = 30
+# Tables read by the dashboard's first screen, loaded into shared buffers with pg_prewarm
+PREWARM_RELATIONS = [
+    "mv_dashboard_summary", "mv_cobertura_puesto", "mv_corporate_analytics", "mv_age_distribution",
+    "agg_empresa_empleados", "agg_empresas_mes", "agg_lideres", "agg_geo_municipio", "dim_divipole",
+]
+startup_status = {"ready": False, "stage": "starting", "error": None, "warm_seconds": None}
+startup_task = None
+
+async def connect_with_retry():
+    delay, attempt = 1, 1
+    while True:
+        try:
+            await database.connect()
+            return
+        except Exception as e:
+            startup_status["error"] = f"{type(e).__name__}: {e}"
+            print(f"DB not ready (attempt {attempt}), retrying in {delay}s... {e}")
+            await asyncio.sleep(delay)
+            delay, attempt = min(delay * 2, STARTUP_RETRY_MAX_SECONDS), attempt + 1
+
+async def prewarm_buffers():
     try:
-        await database.connect()
+        await database.execute(query="CREATE EXTENSION IF NOT EXISTS pg_prewarm")
     except Exception as e:
-        print(f"DB Connection Error: {e}")
+        print(f"Prewarm: pg_prewarm unavailable ({e}), relying on the warm-up queries")
+        return 0
+    pages = 0
+    for relation in PREWARM_RELATIONS:
+        # The table and its indexes; relations not created yet are skipped
+        pages += await database.fetch_val(query="""
+            SELECT COALESCE(SUM(pg_prewarm(r.oid)), 0) FROM (
+                SELECT to_regclass(:relation) AS oid
+                UNION ALL
+                SELECT indexrelid FROM pg_index WHERE indrelid = to_regclass(:relation)
+            ) r
+            WHERE r.oid IS NOT NULL
+        """, values={"relation": relation})
+    return pages
+
+def dashboard_requests():
+    # Same requests as the first load of frontend/app/DashboardClient.tsx
+    return [
+        (get_education_level, {}),
+        (get_sex_distribution, {}),
+        (get_top_companies, {}),
+        (get_puestos_demographics, {}),
+        (get_leader_efficiency, {}),
+        (get_company_timeline, {}),
+        (get_mesas_by_dept, {}),
+        (get_coverage_by_puesto, {"limit": 200}),
+        (get_verified_leaders, {}),
+        (get_empresas_by_dept, {}),
+        (get_contact_info, {"limit": 100}),
+    ]
+
+async def warm_start():
+    global segment_checked_at
+    await connect_with_retry()
+    startup_status.update(stage="indexes", error=None)
+    try:
+        await job_queue.start()
+    except Exception as e:
+        # Reads are still served; /api/jobs stays unavailable until a restart
+        startup_status["error"] = f"Job queue: {type(e).__name__}: {e}"
+        print(f"Job queue start failed: {e}")
+    try:
+        print(f"Spatial index: {await reload_puesto_index()} puestos")
+        print(f"Segment index: {await reload_segment_index()} persons")
+        segment_checked_at = time.monotonic()
+    except Exception as e:
+        print(f"Index load failed: {e}")
+
+    startup_status["stage"] = "warming"
+    start = time.perf_counter()
+    try:
+        print(f"Prewarm: {await prewarm_buffers()} pages loaded into shared buffers")
+    except Exception as e:
+        print(f"Prewarm failed: {e}")
+    # Through the cached endpoints: later requests, in any worker, are cache hits
+    await response_cache.check_version(force=True)
+    for endpoint, kwargs in dashboard_requests():
+        try:
+            await endpoint(**kwargs)
+        except Exception as e:
+            print(f"Warm-up of {endpoint.__name__} failed: {e}")
+    startup_status.update(ready=True, stage="ready", warm_seconds=round(time.perf_counter() - start, 2))
+    print(f"Ready: warm-up took {startup_status['warm_seconds']}s")
+
+@app.on_event("startup")
+async def startup():
+    global startup_task
+    startup_task = asyncio.ensure_future(warm_start())
 
 @app.on_event("shutdown")
 async def shutdown():
-    await database.disconnect()
+    if startup_task and not startup_task.done():
+        startup_task.cancel()
+        await asyncio.gather(startup_task, return_exceptions=True)
+    await job_queue.stop()
+    if database.is_connected:
+        await database.disconnect()
 
 @app.get("/")
 def read_root():
     return {"status": "online", "version": "1.0.0"}
 
+# Process is up (restart when this fails)
+@app.get("/health/live")
+def health_live():
+    return {"status": "alive"}
+
+# Ready for traffic: connected and warm (route traffic only when this passes)
+@app.get("/health/ready")
+async def health_ready():
+    if not startup_status["ready"]:
+        return JSONResponse(status_code=503, content=startup_status)
+    try:
+        await database.fetch_val(query="SELECT 1")
+    except Exception as e:
+        return JSONResponse(status_code=503, content={**startup_status, "ready": False, "error": str(e)})
+    return startup_status
+
 # --- ANALYTICS ENDPOINTS ---
 
 @app.get("/api/analytics/company-heatmap")
+@response_cache.cached
 async def get_company_heatmap():
     query = "SELECT * FROM mv_corporate_analytics ORDER BY total DESC"
     rows = await database.fetch_all(query=query)
     return [dict(row) for row in rows]
 
 @app.get("/api/analytics/age-distribution")
+@response_cache.cached
 async def get_age_distribution():
     query = "SELECT * FROM mv_age_distribution ORDER BY rango_edad"
     rows = await database.fetch_all(query=query)
     return [dict(row) for row in rows]
 
 @app.get("/api/analytics/coverage-by-puesto")
+@response_cache.cached
 async def get_coverage_by_puesto(limit: int = 100):
     query = """
     WITH CensoPorPuesto AS (
@@ -153,22 +360,26 @@ async def get_coverage_by_puesto(limit: int = 100):
     rows = await database.fetch_all(query=query, values={"limit": limit})
     return [dict(row) for row in rows]
 
+# Leader endpoints read agg_lideres, rebuilt by load_seguimiento (etl/leader_scorecard.py)
 @app.get("/api/analytics/verified-leaders")
-async def get_verified_leaders():
-    query = """
+@response_cache.cached
+async def get_verified_leaders(cod_dept: str = None):
+    query = f"""
     SELECT 
-        l.comuna,
+        comuna,
         COUNT(*) as total_lideres,
-        SUM(CASE WHEN l.verificado = 'SI' THEN 1 ELSE 0 END) as lideres_verificados,
-        SUM(l.meta_votos) as meta_total_votos
-    FROM lideres_campana l
-    GROUP BY l.comuna
+        COUNT(*) FILTER (WHERE verificado) as lideres_verificados,
+        SUM(meta_votos) as meta_total_votos
+    FROM agg_lideres
+    {"WHERE cod_departamento = :cod_dept" if cod_dept else ""}
+    GROUP BY comuna
     ORDER BY meta_total_votos DESC;
     """
-    rows = await database.fetch_all(query=query)
+    rows = await database.fetch_all(query=query, values={"cod_dept": cod_dept} if cod_dept else None)
     return [dict(row) for row in rows]
 
 @app.get("/api/analytics/education-level")
+@response_cache.cached
 async def get_education_level():
     query = """
     SELECT 
@@ -189,6 +400,7 @@ async def get_education_level():
     return [dict(row) for row in rows]
 
 @app.get("/api/analytics/sex-distribution")
+@response_cache.cached
 async def get_sex_distribution():
     query = """
     SELECT 
@@ -208,30 +420,46 @@ async def get_sex_distribution():
     rows = await database.fetch_all(query=query)
     return [dict(row) for row in rows]
 
+# Ranking from agg_empresa_empleados, kept up to date by the loaders
+# (etl/company_counters.py): an index scan on total_empleados, optionally per department
 @app.get("/api/analytics/top-companies")
-async def get_top_companies():
-    query = """
-    SELECT 
-        div.cod_departamento,
-        c.razon_social AS empresa,
-        c.nit,
-        c.tipo_empresa AS tipo,
-        COALESCE(div.nom_departamento, 'Desconocido') AS departamento,
-        COUNT(e.empleado_id) AS total_empleados
-    FROM core_empresas c
-    JOIN empleados_empresas e ON c.empresa_id = e.empresa_id
-    LEFT JOIN (
-        SELECT DISTINCT cod_departamento, cod_municipio, nom_departamento 
-        FROM dim_divipole
-    ) div ON c.municipio_cod = div.cod_departamento || div.cod_municipio
-    GROUP BY div.cod_departamento, c.empresa_id, c.razon_social, c.nit, c.tipo_empresa, div.nom_departamento
-    ORDER BY total_empleados DESC
-    LIMIT 50;
+@response_cache.cached
+async def get_top_companies(
+    cod_dept: str = None,
+    limit: int = Query(50, ge=1, le=1000),
+    offset: int = Query(0, ge=0),
+    incluir_sin_empleados: bool = False,
+):
+    conditions = []
+    if cod_dept:
+        conditions.append("cod_departamento = :cod_dept")
+    if not incluir_sin_empleados:
+        conditions.append("total_empleados > 0")
+    query = f"""
+    SELECT
+        cod_departamento,
+        razon_social AS empresa,
+        nit,
+        tipo_empresa AS tipo,
+        COALESCE(nom_departamento, 'Desconocido') AS departamento,
+        total_empleados,
+        hombres,
+        mujeres,
+        con_email,
+        con_celular
+    FROM agg_empresa_empleados
+    {"WHERE " + " AND ".join(conditions) if conditions else ""}
+    ORDER BY total_empleados DESC, empresa_id
+    LIMIT :limit OFFSET :offset;
     """
-    rows = await database.fetch_all(query=query)
+    values = {"limit": limit, "offset": offset}
+    if cod_dept:
+        values["cod_dept"] = cod_dept
+    rows = await database.fetch_all(query=query, values=values)
     return [dict(row) for row in rows]
 
 @app.get("/api/analytics/puestos-demographics")
+@response_cache.cached
 async def get_puestos_demographics():
     query = """
     SELECT 
@@ -255,48 +483,119 @@ async def get_puestos_demographics():
     return [dict(row) for row in rows]
 
 @app.get("/api/analytics/leader-efficiency")
-async def get_leader_efficiency():
-    query = """
+@response_cache.cached
+async def get_leader_efficiency(
+    cod_dept: str = None,
+    comuna: str = None,
+    limit: int = Query(100, ge=1, le=1000),
+):
+    conditions, values = ["meta_votos > 0"], {"limit": limit}
+    if cod_dept:
+        conditions.append("cod_departamento = :cod_dept")
+        values["cod_dept"] = cod_dept
+    if comuna:
+        conditions.append("comuna = :comuna")
+        values["comuna"] = comuna
+    query = f"""
     SELECT 
-        div.cod_departamento,
-        l.nombre_completo AS lider,
-        l.meta_votos,
-        (COALESCE(l.pendones, 0) + COALESCE(l.boletas_bingo, 0) + COALESCE(l.damas_gratis, 0)) AS total_recursos,
-        l.comuna,
-        COALESCE(div.nom_departamento, 'Desconocido') AS departamento
-    FROM lideres_campana l
-    LEFT JOIN (
-        SELECT DISTINCT cod_departamento, cod_municipio, nom_departamento 
-        FROM dim_divipole
-    ) div ON l.cod_municipio = div.cod_municipio
-    WHERE l.meta_votos > 0
-    ORDER BY total_recursos DESC
-    LIMIT 100;
+        cod_departamento,
+        nombre_completo AS lider,
+        meta_votos,
+        total_recursos,
+        votos_por_recurso,
+        comuna,
+        ranking_comuna,
+        verificado,
+        COALESCE(nom_departamento, 'Desconocido') AS departamento,
+        nom_municipio AS municipio
+    FROM agg_lideres
+    WHERE {" AND ".join(conditions)}
+    ORDER BY total_recursos DESC, lider_id
+    LIMIT :limit;
     """
-    rows = await database.fetch_all(query=query)
+    rows = await database.fetch_all(query=query, values=values)
     return [dict(row) for row in rows]
 
+# granularidad -> (date_trunc unit, period label)
+TIMELINE_GRANULARITIES = {
+    "mes": ("month", "YYYY-MM"),
+    "trimestre": ("quarter", 'YYYY-"T"Q'),
+    "anio": ("year", "YYYY"),
+}
+
+# Company creations from agg_empresas_mes, the monthly rollup rebuilt by load_empresas
+# (etl/company_counters.py). Coarser periods and the running total are summed from it,
+# so the cost follows the number of months, not the number of companies.
 @app.get("/api/analytics/company-timeline")
-async def get_company_timeline():
-    query = """
-    SELECT 
-        div.cod_departamento,
-        TO_CHAR(c.fecha_constitucion, 'YYYY') AS anio,
-        COALESCE(div.nom_departamento, 'Desconocido') AS departamento,
-        COUNT(*) AS total_empresas
-    FROM core_empresas c
-    LEFT JOIN (
-        SELECT DISTINCT cod_departamento, cod_municipio, nom_departamento 
-        FROM dim_divipole
-    ) div ON c.municipio_cod = div.cod_departamento || div.cod_municipio
-    WHERE c.fecha_constitucion IS NOT NULL
-    GROUP BY div.cod_departamento, 1, 2
-    ORDER BY 1;
+@response_cache.cached
+async def get_company_timeline(
+    granularidad: str = "anio",
+    desde: Optional[date] = None,
+    hasta: Optional[date] = None,
+    cod_dept: str = None,
+    tipo_empresa: str = None,
+    por_departamento: bool = True,
+    acumulado: bool = False,
+):
+    if granularidad not in TIMELINE_GRANULARITIES:
+        raise HTTPException(status_code=400, detail=f"granularidad must be one of {sorted(TIMELINE_GRANULARITIES)}")
+    if desde and hasta and desde > hasta:
+        raise HTTPException(status_code=400, detail="desde must not be after hasta")
+    unit, label = TIMELINE_GRANULARITIES[granularidad]
+
+    conditions, values = [], {}
+    if cod_dept:
+        conditions.append("cod_departamento = :cod_dept")
+        values["cod_dept"] = cod_dept
+    if tipo_empresa:
+        conditions.append("tipo_empresa = :tipo_empresa")
+        values["tipo_empresa"] = tipo_empresa
+    # The date range applies after the running total, which counts from the first company
+    period_filters = []
+    if desde:
+        period_filters.append(f"inicio >= DATE_TRUNC('{unit}', CAST(:desde AS TIMESTAMP))")
+        values["desde"] = desde
+    if hasta:
+        period_filters.append("inicio <= :hasta")
+        values["hasta"] = hasta
+    if por_departamento:
+        departamento = "cod_departamento, nom_departamento"
+    else:
+        departamento = "CAST(NULL AS VARCHAR) AS cod_departamento, CAST('Nacional' AS VARCHAR) AS nom_departamento"
+
+    query = f"""
+    WITH serie AS (
+        SELECT
+            CAST(DATE_TRUNC('{unit}', CAST(mes AS TIMESTAMP)) AS DATE) AS inicio,
+            {departamento},
+            SUM(total_empresas) AS total_empresas
+        FROM agg_empresas_mes
+        {"WHERE " + " AND ".join(conditions) if conditions else ""}
+        GROUP BY 1, 2, 3
+    ),
+    acumulada AS (
+        SELECT
+            *,
+            CAST(SUM(total_empresas) OVER (PARTITION BY cod_departamento ORDER BY inicio) AS BIGINT) AS total_acumulado
+        FROM serie
+    )
+    SELECT
+        cod_departamento,
+        TO_CHAR(inicio, 'YYYY') AS anio,
+        TO_CHAR(inicio, '{label}') AS periodo,
+        inicio,
+        COALESCE(nom_departamento, 'Desconocido') AS departamento,
+        {"total_acumulado" if acumulado else "total_empresas"} AS total_empresas,
+        total_empresas AS nuevas_empresas
+    FROM acumulada
+    {"WHERE " + " AND ".join(period_filters) if period_filters else ""}
+    ORDER BY inicio, cod_departamento;
     """
-    rows = await database.fetch_all(query=query)
+    rows = await database.fetch_all(query=query, values=values)
     return [dict(row) for row in rows]
 
 @app.get("/api/analytics/mesas-by-dept")
+@response_cache.cached
 async def get_mesas_by_dept(cod_dept: str = None):
     if cod_dept:
         query = """
@@ -324,6 +623,7 @@ async def get_mesas_by_dept(cod_dept: str = None):
     return [dict(row) for row in rows]
 
 @app.get("/api/analytics/empresas-by-dept")
+@response_cache.cached
 async def get_empresas_by_dept(cod_dept: str = None):
     if cod_dept:
         query = """
@@ -359,6 +659,7 @@ async def get_empresas_by_dept(cod_dept: str = None):
 
 # Drill-down: Municipalities in a department
 @app.get("/api/analytics/municipios-by-dept")
+@response_cache.cached
 async def get_municipios_by_dept(cod_dept: str):
     query = """
     SELECT 
@@ -375,6 +676,7 @@ async def get_municipios_by_dept(cod_dept: str):
 
 # Drill-down: Puestos in a municipality
 @app.get("/api/analytics/puestos-by-muni")
+@response_cache.cached
 async def get_puestos_by_muni(cod_muni: str, cod_dept: str):
     query = """
     SELECT 
@@ -393,6 +695,7 @@ async def get_puestos_by_muni(cod_muni: str, cod_dept: str):
 
 # Summary with optional department filter
 @app.get("/api/geo/summary")
+@response_cache.cached
 async def get_geo_summary(cod_dept: str = None):
     if cod_dept:
         query = """
@@ -423,8 +726,89 @@ async def get_geo_summary(cod_dept: str = None):
         row = await database.fetch_one(query=query)
     return dict(row)
 
+# Nearest voting posts to a point (in-memory grid index, no PostGIS)
+@app.get("/api/geo/nearby")
+async def get_nearby_puestos(
+    lat: float = Query(..., ge=-90, le=90),
+    lon: float = Query(..., ge=-180, le=180),
+    k: int = Query(10, ge=1, le=200),
+    max_km: Optional[float] = Query(None, gt=0)
+):
+    return puesto_index.nearby(lat, lon, k=k, max_km=max_km)
+
+# Voting posts inside a bounding box (e.g. the visible map area)
+@app.get("/api/geo/bbox")
+async def get_puestos_in_bbox(
+    min_lat: float = Query(..., ge=-90, le=90),
+    min_lon: float = Query(..., ge=-180, le=180),
+    max_lat: float = Query(..., ge=-90, le=90),
+    max_lon: float = Query(..., ge=-180, le=180),
+    limit: int = Query(1000, ge=1, le=20000)
+):
+    if min_lat > max_lat or min_lon > max_lon:
+        raise HTTPException(status_code=400, detail="min_lat/min_lon must not exceed max_lat/max_lon")
+    return puesto_index.bbox(min_lat, min_lon, max_lat, max_lon, limit=limit)
+
+# Map coloring: metric -> SQL over agg_geo_municipio (whitelisted, never user text)
+CHOROPLETH_METRICS = {
+    "censo": "SUM(censo)",
+    "contactos": "SUM(contactos)",
+    "empleados": "SUM(empleados)",
+    "empresas": "SUM(empresas)",
+    "puestos": "SUM(puestos)",
+    "mesas": "SUM(mesas)",
+    "cobertura_pct": "ROUND(COALESCE(SUM(contactos)::decimal / NULLIF(SUM(censo), 0) * 100, 0), 2)",
+}
+CHOROPLETH_LEVELS = {
+    # level -> code expression matching the map geometry ids
+    "departamento": "cod_departamento",
+    "municipio": "cod_departamento || cod_municipio",
+}
+
+# Compact code -> value arrays for coloring the map, from precomputed aggregates
+@app.get("/api/geo/choropleth")
+@response_cache.cached
+async def get_choropleth(level: str = "departamento", metric: str = "cobertura_pct", cod_dept: str = None):
+    if level not in CHOROPLETH_LEVELS:
+        raise HTTPException(status_code=400, detail=f"level must be one of {sorted(CHOROPLETH_LEVELS)}")
+    if metric not in CHOROPLETH_METRICS:
+        raise HTTPException(status_code=400, detail=f"metric must be one of {sorted(CHOROPLETH_METRICS)}")
+
+    code = CHOROPLETH_LEVELS[level]
+    query = f"""
+    SELECT {code} AS code, {CHOROPLETH_METRICS[metric]} AS value
+    FROM agg_geo_municipio
+    {"WHERE cod_departamento = :cod_dept" if cod_dept else ""}
+    GROUP BY 1
+    ORDER BY 1
+    """
+    rows = await database.fetch_all(query=query, values={"cod_dept": cod_dept} if cod_dept else None)
+    values = [float(row["value"] or 0) for row in rows]
+    return {
+        "level": level,
+        "metric": metric,
+        "codes": [row["code"] for row in rows],
+        "values": values,
+        "min": min(values) if values else 0,
+        "max": max(values) if values else 0,
+    }
+
+# Rebuild the spatial index after dim_divipole is reloaded
+@app.post("/api/geo/index/reload")
+async def reload_geo_index():
+    puestos = await reload_puesto_index()
+    await response_cache.invalidate()
+    return {"puestos": puestos}
+
+# After loading data outside run_pipeline.py, which the cache cannot see
+@app.post("/api/cache/invalidate")
+async def invalidate_cache():
+    await response_cache.invalidate()
+    return {"invalidated": True, "hits": response_cache.hits, "misses": response_cache.misses}
+
 # Contact Info Endpoint
 @app.get("/api/analytics/contact-info")
+@response_cache.cached
 async def get_contact_info(limit: int = 100):
     query = """
     SELECT 
@@ -461,3 +845,380 @@ async def get_upcoming_birthdays(limit: int = 100):
     """
     rows = await database.fetch_all(query=query, values={"limit": limit})
     return [dict(row) for row in rows]
+
+# --- PERSON INDEX (cross-source) ---
+
+# Same bits as etl/personas.py
+PERSON_SOURCES = {
+    1: "censo_electoral",
+    2: "contactos_hjs",
+    4: "empleados_empresas",
+    8: "representantes_legales_contacto",
+}
+
+def person_sources(fuentes: int):
+    return [name for bit, name in PERSON_SOURCES.items() if fuentes & bit]
+
+# Overlap between sources: one row per combination of sources
+@app.get("/api/personas/overlap")
+@response_cache.cached
+async def get_persons_overlap():
+    query = """
+    SELECT fuentes, COUNT(*) AS total
+    FROM personas
+    GROUP BY fuentes
+    ORDER BY total DESC;
+    """
+    rows = await database.fetch_all(query=query)
+    return [
+        {"fuentes": row["fuentes"], "sources": person_sources(row["fuentes"]), "total": row["total"]}
+        for row in rows
+    ]
+
+# Per-person lookup: every source containing the document, whatever its formatting
+@app.get("/api/personas/{documento}")
+async def get_person(documento: str):
+    person = await database.fetch_one(
+        query="SELECT doc_key, documento, fuentes, updated_at FROM personas WHERE doc_key = doc_key(:documento)",
+        values={"documento": documento}
+    )
+    if not person:
+        raise HTTPException(status_code=404, detail="Person not found")
+
+    result = dict(person)
+    result["sources"] = person_sources(person["fuentes"])
+    values = {"doc_key": person["doc_key"]}
+
+    # Each lookup uses the doc_key(documento) expression index of its table
+    if person["fuentes"] & 1:
+        row = await database.fetch_one(query="""
+            SELECT documento, tipo_documento, cod_departamento, cod_municipio, cod_zona, cod_puesto, fecha_registro_censo
+            FROM censo_electoral WHERE doc_key(documento) = :doc_key LIMIT 1
+        """, values=values)
+        result["censo"] = dict(row) if row else None
+    if person["fuentes"] & 2:
+        row = await database.fetch_one(query="""
+            SELECT documento, nombre_completo, contacto, municipio_texto, cod_departamento, cod_municipio
+            FROM contactos_hjs WHERE doc_key(documento) = :doc_key LIMIT 1
+        """, values=values)
+        result["contacto_hjs"] = dict(row) if row else None
+    if person["fuentes"] & 4:
+        rows = await database.fetch_all(query="""
+            SELECT e.empleado_id, e.nombre_completo, e.empresa_id, c.razon_social, e.celular, e.email
+            FROM empleados_empresas e
+            LEFT JOIN core_empresas c ON c.empresa_id = e.empresa_id
+            WHERE doc_key(e.documento) = :doc_key
+        """, values=values)
+        result["empleos"] = [dict(row) for row in rows]
+    if person["fuentes"] & 8:
+        rows = await database.fetch_all(query="""
+            SELECT r.id_contacto_empresa, r.nombre_contacto, r.rol_empresa, r.empresa_id, c.razon_social
+            FROM representantes_legales_contacto r
+            LEFT JOIN core_empresas c ON c.empresa_id = r.empresa_id
+            WHERE doc_key(r.documento) = :doc_key
+        """, values=values)
+        result["representaciones"] = [dict(row) for row in rows]
+    return result
+
+# --- SEARCH ---
+
+# tipo -> table and returned columns. nombre_busqueda is a generated column kept by the
+# database (etl/search_index.py), indexed for name prefix (btree) and word prefix (trigram).
+SEARCH_SOURCES = {
+    "contacto": {
+        "table": "contactos_hjs",
+        "columns": "documento AS id, nombre_completo AS nombre, municipio_texto AS detalle, cod_departamento, cod_municipio",
+        "documento": "doc_key(documento) = doc_key(:lo)",
+    },
+    "empleado": {
+        "table": "empleados_empresas",
+        "columns": "empleado_id AS id, nombre_completo AS nombre, empresa_id AS detalle, cod_departamento, cod_municipio",
+        "documento": "doc_key(documento) = doc_key(:lo)",
+    },
+    "empresa": {
+        "table": "core_empresas",
+        "columns": """empresa_id AS id, razon_social AS nombre, nit AS detalle,
+            LEFT(municipio_cod, 2) AS cod_departamento, SUBSTRING(municipio_cod FROM 3 FOR 3) AS cod_municipio""",
+        "documento": "nit ~>=~ :lo AND nit ~<~ :hi",
+    },
+}
+# Word-prefix matches are ranked by similarity among at most this many rows per source,
+# so a common first name costs the same as a rare one
+SEARCH_CANDIDATES = 500
+
+def prefix_range(prefix: str):
+    # col ~>=~ lo AND col ~<~ hi is LIKE 'prefix%' as a range the text_pattern_ops
+    # index can scan even in a generic (parameter-independent) plan
+    return prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+# Accent-insensitive autocomplete over people and companies: names starting with the
+# query first, then names where every query word starts some word; digits search
+# documento / NIT
+@app.get("/api/search")
+async def search(q: str = Query(..., min_length=2), tipo: str = None, limit: int = Query(20, ge=1, le=100)):
+    tipos = tipo.split(",") if tipo else list(SEARCH_SOURCES)
+    unknown = [t for t in tipos if t not in SEARCH_SOURCES]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"tipo must be among {sorted(SEARCH_SOURCES)}")
+
+    normalized = search_text(q)
+    digits = re.sub(r"[\s.,-]", "", q)
+    exact, by_word = [], []
+
+    for t in tipos:
+        source = SEARCH_SOURCES[t]
+        if digits.isdigit():
+            lo, hi = prefix_range(digits)
+            values = {"lo": lo, "limit": limit}
+            if ":hi" in source["documento"]:
+                values["hi"] = hi
+            rows = await database.fetch_all(
+                query=f"SELECT {source['columns']} FROM {source['table']} WHERE {source['documento']} LIMIT :limit",
+                values=values
+            )
+            exact += [dict(row, tipo=t, coincidencia="documento") for row in rows]
+            continue
+        if not normalized:
+            continue
+
+        lo, hi = prefix_range(normalized)
+        rows = await database.fetch_all(query=f"""
+            SELECT {source['columns']}
+            FROM {source['table']}
+            WHERE nombre_busqueda ~>=~ :lo AND nombre_busqueda ~<~ :hi
+            ORDER BY nombre_busqueda USING ~<~
+            LIMIT :limit
+        """, values={"lo": lo, "hi": hi, "limit": limit})
+        exact += [dict(row, tipo=t, coincidencia="prefijo") for row in rows]
+        # Every word must start a word of the name; words of 3+ letters also go through
+        # the trigram index. Without any such word the index cannot help: prefix only
+        words = normalized.split()
+        if len(rows) >= limit or max(len(w) for w in words) < 3:
+            continue
+        values = {"lo": lo, "hi": hi, "q": normalized, "candidates": SEARCH_CANDIDATES, "limit": limit - len(rows)}
+        conditions = []
+        for i, word in enumerate(words):
+            values[f"w{i}"] = f"% {word}%"
+            conditions.append(f"(' ' || nombre_busqueda) LIKE :w{i}")
+            if len(word) >= 3:
+                values[f"t{i}"] = f"%{word}%"
+                conditions.append(f"nombre_busqueda LIKE :t{i}")
+        rows = await database.fetch_all(query=f"""
+            SELECT * FROM (
+                SELECT {source['columns']}, nombre_busqueda
+                FROM {source['table']}
+                WHERE {" AND ".join(conditions)}
+                  AND NOT (nombre_busqueda ~>=~ :lo AND nombre_busqueda ~<~ :hi)
+                LIMIT :candidates
+            ) c
+            ORDER BY similarity(nombre_busqueda, :q) DESC, nombre_busqueda
+            LIMIT :limit
+        """, values=values)
+        for row in rows:
+            result = dict(row, tipo=t, coincidencia="palabra")
+            del result["nombre_busqueda"]
+            by_word.append(result)
+
+    return {"query": q, "normalizado": normalized, "results": (exact + by_word)[:limit]}
+
+# --- SEGMENTS ---
+
+# Audience size for an AND/OR/NOT expression over groups, geography, sexo, age and source,
+# e.g. {"and": [{"grupo": "BINGO"}, {"departamento": "68"}, {"edad": "31-60"},
+#               {"fuente": "censo_electoral"}]}. See backend/segments.py
+@app.post("/api/segments/count")
+async def count_segment(segment: dict = Body(...)):
+    index = await current_segment_index()
+    start = time.perf_counter()
+    try:
+        count = index.count(segment)
+    except SegmentError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {
+        "count": count,
+        "universe": len(index),
+        "build_id": index.build_id,
+        "ms": round((time.perf_counter() - start) * 1000, 2),
+    }
+
+@app.post("/api/segments/reload")
+async def reload_segments():
+    global segment_checked_at
+    async with segment_lock:
+        persons = await reload_segment_index()
+        segment_checked_at = time.monotonic()
+    return {"persons": persons, "build_id": segment_index.build_id}
+
+# --- EXPORTS ---
+
+EXPORT_FORMATS = {
+    "csv": "text/csv; charset=utf-8",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+async def prepare_export(fuente, format, cod_dept=None, cod_muni=None, grupo=None, con_celular=False, con_email=False):
+    """Validates an export request. Returns (query, args, columns)."""
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {sorted(EXPORT_FORMATS)}")
+
+    grupo_id = None
+    if grupo:
+        grupo_id = await database.fetch_val(
+            query="SELECT grupo_id FROM dim_grupos WHERE nombre = :grupo OR grupo_id::text = :grupo",
+            values={"grupo": grupo}
+        )
+        if grupo_id is None:
+            raise HTTPException(status_code=404, detail="Group not found")
+
+    try:
+        return build_export_query(fuente, cod_dept, cod_muni, grupo_id, con_celular, con_email)
+    except ExportError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def export_stream(format, query, args, columns):
+    if format == "csv":
+        return stream_csv(DB_CONNECT_KWARGS, query, args)
+    return stream_parquet(DB_CONNECT_KWARGS, query, args, columns)
+
+# Filtered contact lists streamed straight from the database (see backend/exports.py);
+# use instead of contact-info with large limits. Same filters as an 'export' job
+@app.get("/api/export/{fuente}")
+async def export_contacts(
+    fuente: str,
+    format: str = "csv",
+    cod_dept: str = None,
+    cod_muni: str = None,
+    grupo: str = None,
+    con_celular: bool = False,
+    con_email: bool = False,
+):
+    query, args, columns = await prepare_export(fuente, format, cod_dept, cod_muni, grupo, con_celular, con_email)
+    filename = re.sub(r"[^\w-]+", "", "_".join(p for p in (fuente, cod_dept, cod_muni, grupo) if p))
+    return StreamingResponse(
+        export_stream(format, query, args, columns),
+        media_type=EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}.{format}"'},
+    )
+
+# --- JOBS ---
+
+MATERIALIZED_VIEWS = ["mv_dashboard_summary", "mv_cobertura_puesto", "mv_corporate_analytics", "mv_age_distribution"]
+EXPORT_JOB_PARAMS = ["fuente", "format", "cod_dept", "cod_muni", "grupo", "con_celular", "con_email"]
+
+# Export written to JOB_RESULTS_DIR, fetched later from /api/jobs/{id}/result
+async def run_export_job(job: JobContext):
+    params = {k: v for k, v in job.params.items() if k in EXPORT_JOB_PARAMS}
+    params.setdefault("format", "csv")
+    query, args, columns = await prepare_export(**params)
+    path = job.result_path(params["format"])
+    body = export_stream(params["format"], query, args, columns)
+    written, reported = 0, time.monotonic()
+    try:
+        with open(path + ".part", "wb") as f:
+            async for chunk in body:
+                f.write(chunk)
+                written += len(chunk)
+                if time.monotonic() - reported >= 2:
+                    await job.progress(mensaje=f"{written / 1e6:.1f} MB escritos")
+                    reported = time.monotonic()
+        os.replace(path + ".part", path)
+    finally:
+        await body.aclose()
+        if os.path.exists(path + ".part"):
+            os.remove(path + ".part")
+    return {"archivo": path, "bytes": written, "format": params["format"]}
+
+async def run_refresh_views_job(job: JobContext):
+    for i, view in enumerate(MATERIALIZED_VIEWS):
+        await job.progress(100 * i / len(MATERIALIZED_VIEWS), f"Actualizando {view}")
+        await database.execute(query=f"REFRESH MATERIALIZED VIEW {view}")
+    await response_cache.invalidate()
+    return {"views": MATERIALIZED_VIEWS}
+
+async def run_reload_indexes_job(job: JobContext):
+    # Only this backend process; other workers pick up segment builds on their own
+    return {"puestos": await reload_puesto_index(), "persons": await reload_segment_index()}
+
+job_queue = JobQueue(
+    database,
+    handlers={
+        "export": run_export_job,
+        "refresh_views": run_refresh_views_job,
+        "reload_indexes": run_reload_indexes_job,
+    },
+    results_dir=os.getenv("JOB_RESULTS_DIR", "/tmp/hjs-jobs"),
+    external_types=["pipeline"],  # run_pipeline.py --worker: {"stages": [...], "with_deps": true}
+)
+
+class JobRequest(BaseModel):
+    tipo: str
+    parametros: dict = {}
+
+def job_response(row):
+    job = dict(row)
+    for key in ("parametros", "resultado"):
+        if isinstance(job.get(key), str):
+            job[key] = json.loads(job[key])
+    return job
+
+@app.post("/api/jobs")
+async def submit_job(request: JobRequest):
+    if request.tipo == "export":
+        # Reject bad filters now rather than as a failed job
+        params = {k: v for k, v in request.parametros.items() if k in EXPORT_JOB_PARAMS}
+        if "fuente" not in params:
+            raise HTTPException(status_code=400, detail="export needs parametros.fuente")
+        await prepare_export(**{"format": "csv", **params})
+    try:
+        job_id = await job_queue.submit(request.tipo, request.parametros)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"job_id": job_id, "estado": "pendiente"}
+
+@app.get("/api/jobs")
+async def list_jobs(estado: str = None, limit: int = Query(50, ge=1, le=500)):
+    if estado and estado not in JOB_STATES:
+        raise HTTPException(status_code=400, detail=f"estado must be one of {list(JOB_STATES)}")
+    query = f"""
+    SELECT job_id, tipo, estado, progreso, mensaje, intentos, created_at, started_at, finished_at
+    FROM jobs
+    {"WHERE estado = :estado" if estado else ""}
+    ORDER BY job_id DESC
+    LIMIT :limit
+    """
+    values = {"limit": limit, **({"estado": estado} if estado else {})}
+    rows = await database.fetch_all(query=query, values=values)
+    return [dict(row) for row in rows]
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: int):
+    row = await database.fetch_one(query="SELECT * FROM jobs WHERE job_id = :job_id", values={"job_id": job_id})
+    if not row:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job_response(row)
+
+@app.get("/api/jobs/{job_id}/result")
+async def get_job_result(job_id: int):
+    row = await database.fetch_one(
+        query="SELECT estado, resultado FROM jobs WHERE job_id = :job_id", values={"job_id": job_id}
+    )
+    if not row:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if row["estado"] != "completado":
+        raise HTTPException(status_code=409, detail=f"Job is {row['estado']}")
+    resultado = job_response(row)["resultado"] or {}
+    if "archivo" in resultado:
+        if not os.path.exists(resultado["archivo"]):
+            raise HTTPException(status_code=410, detail="Result file no longer available")
+        return FileResponse(
+            resultado["archivo"],
+            media_type=EXPORT_FORMATS.get(resultado.get("format"), "application/octet-stream"),
+            filename=os.path.basename(resultado["archivo"]),
+        )
+    return resultado
+
+@app.post("/api/jobs/{job_id}/cancel")
+async def cancel_job(job_id: int):
+    if not await job_queue.cancel(job_id):
+        raise HTTPException(status_code=409, detail="Job not found or already finished")
+    return {"job_id": job_id, "estado": "cancelado"}
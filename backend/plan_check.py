@@ -0,0 +1,502 @@
+import argparse
+import asyncio
+import json
+import os
+import re
+import statistics
+import sys
+
+import psycopg2
+import psycopg2.extras
+
+# Query plan regression check for the endpoint SQL in main.py.
+# Loads a synthetic dataset into a scratch database on a local Postgres, runs every case
+# below through the real endpoint code with `database` swapped for a recorder (so the SQL
+# checked is exactly what the endpoint sends, with its parameters), then runs
+# EXPLAIN (ANALYZE, BUFFERS) on each captured query and compares with plan_baselines.json:
+#   - fails when a query does a sequential scan on a large table, unless SEQ_SCAN_ALLOWED
+#     lists it for that case (with or without a baseline)
+#   - fails when a query is slower than its baseline by more than --threshold (and by more
+#     than MIN_REGRESSION_MS, so sub-millisecond noise never fails)
+#   - reports, without failing, plans whose shape changed
+# Usage (from the repo root, with the backend requirements installed):
+#   python backend/plan_check.py --update     # load, measure, write baselines
+#   python backend/plan_check.py --skip-load  # compare against them on the loaded database
+DB_HOST = os.getenv("DB_HOST", "localhost")
+DB_USER = os.getenv("DB_USER", "postgres")
+DB_PASS = os.getenv("DB_PASS", "postgres")
+CHECK_DB = os.getenv("PLAN_CHECK_DB", "hjs_plan_check")
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BACKEND_DIR)
+BASELINE_FILE = os.path.join(BACKEND_DIR, "plan_baselines.json")
+
+REPEATS = 3                 # EXPLAIN ANALYZE runs per query after a warm-up; the median counts
+LARGE_TABLE_ROWS = 10000    # Sequential scans on tables at least this big are flagged
+MIN_REGRESSION_MS = 5.0
+
+# Rows per table at --scale 1
+ROWS = {
+    "censo_electoral": 300000,
+    "contactos_hjs": 75000,
+    "core_empresas": 20000,
+    "empleados_empresas": 150000,
+    "representantes_legales_contacto": 10000,
+    "rel_contacto_grupo": 100000,
+    "lideres_campana": 400,
+}
+
+# (case name, endpoint name in main.py, arguments); optional arguments not given take the
+# endpoint's defaults, as in a request without them
+CASES = [
+    ("company-heatmap", "get_company_heatmap", {}),
+    ("age-distribution", "get_age_distribution", {}),
+    ("coverage-by-puesto", "get_coverage_by_puesto", {"limit": 200}),
+    ("verified-leaders", "get_verified_leaders", {}),
+    ("verified-leaders-dept", "get_verified_leaders", {"cod_dept": "08"}),
+    ("education-level", "get_education_level", {}),
+    ("sex-distribution", "get_sex_distribution", {}),
+    ("top-companies", "get_top_companies", {}),
+    ("top-companies-dept", "get_top_companies", {"cod_dept": "08", "limit": 10}),
+    ("puestos-demographics", "get_puestos_demographics", {}),
+    ("leader-efficiency", "get_leader_efficiency", {}),
+    ("company-timeline", "get_company_timeline", {}),
+    ("company-timeline-monthly", "get_company_timeline", {"granularidad": "mes", "cod_dept": "08", "acumulado": True}),
+    ("mesas-by-dept", "get_mesas_by_dept", {}),
+    ("mesas-by-dept-dept", "get_mesas_by_dept", {"cod_dept": "08"}),
+    ("empresas-by-dept", "get_empresas_by_dept", {}),
+    ("empresas-by-dept-dept", "get_empresas_by_dept", {"cod_dept": "08"}),
+    ("municipios-by-dept", "get_municipios_by_dept", {"cod_dept": "08"}),
+    ("puestos-by-muni", "get_puestos_by_muni", {"cod_muni": "001", "cod_dept": "08"}),
+    ("geo-summary", "get_geo_summary", {}),
+    ("geo-summary-dept", "get_geo_summary", {"cod_dept": "08"}),
+    ("choropleth", "get_choropleth", {}),
+    ("choropleth-municipios", "get_choropleth", {"level": "municipio", "cod_dept": "08"}),
+    ("contact-info", "get_contact_info", {"limit": 100}),
+    ("upcoming-birthdays", "get_upcoming_birthdays", {"limit": 100}),
+    ("persons-overlap", "get_persons_overlap", {}),
+    ("person", "get_person", {"documento": "10.000.004"}),
+    ("search-name", "search", {"q": "maria gom"}),
+    ("search-document", "search", {"q": "1000012"}),
+]
+
+# Whole-table aggregations, where reading every row is the plan: the only sequential scans
+# on large tables accepted. Anything else scanning a large table fails the check.
+SEQ_SCAN_ALLOWED = {
+    "coverage-by-puesto": {"censo_electoral", "contactos_hjs"},
+    "geo-summary": {"censo_electoral", "contactos_hjs", "core_empresas", "empleados_empresas"},
+    "education-level": {"empleados_empresas"},
+    "sex-distribution": {"empleados_empresas"},
+    "puestos-demographics": {"empleados_empresas"},
+    "empresas-by-dept": {"core_empresas"},
+    "persons-overlap": {"personas"},
+}
+
+# fuente and filters passed to exports.build_export_query (COPY/cursor SQL, not via `database`)
+EXPORT_CASES = [
+    ("export-empleados-dept", {"fuente": "empleados", "cod_dept": "08", "con_celular": True}),
+    ("export-contactos-grupo", {"fuente": "contactos", "grupo_id": 1}),
+]
+
+NAMED_PARAM = re.compile(r"(?<![:\w]):(\w+)")
+
+def to_psycopg(query, values):
+    """`databases` :name placeholders -> psycopg2 %(name)s."""
+    return NAMED_PARAM.sub(r"%(\1)s", query.replace("%", "%%")), dict(values or {})
+
+def connect(database):
+    conn = psycopg2.connect(host=DB_HOST, database=database, user=DB_USER, password=DB_PASS)
+    conn.autocommit = True
+    return conn
+
+class RecordingDatabase:
+    """Stands in for main.database: runs each query on the check database and keeps it,
+    so endpoints follow their real code paths (a person found, search phases...)."""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.queries = []
+
+    def _run(self, query, values):
+        sql, params = to_psycopg(query, values)
+        self.queries.append((sql, params))
+        with self.conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+            cur.execute(sql, params)
+            return cur.fetchall() if cur.description else []
+
+    async def fetch_all(self, query, values=None):
+        return self._run(query, values)
+
+    async def fetch_one(self, query, values=None):
+        rows = self._run(query, values)
+        return rows[0] if rows else None
+
+    async def fetch_val(self, query, values=None):
+        row = await self.fetch_one(query, values)
+        return next(iter(row.values())) if row else None
+
+    async def execute(self, query, values=None):
+        self._run(query, values)
+
+# --- SYNTHETIC DATASET ---
+
+def split_statements(script):
+    """Splits a SQL script on top-level semicolons (not inside quotes, $$ bodies or comments)."""
+    statements, current, i = [], [], 0
+    quote = None
+    while i < len(script):
+        c = script[i]
+        if quote is None and script.startswith("--", i):
+            end = script.find("\n", i)
+            i = len(script) if end < 0 else end
+            continue
+        if script.startswith("$$", i) and quote in (None, "$$"):
+            quote = None if quote else "$$"
+            current.append("$$")
+            i += 2
+            continue
+        if c in ("'", '"') and quote in (None, c):
+            quote = None if quote else c
+        if c == ";" and quote is None:
+            statements.append("".join(current).strip())
+            current = []
+        else:
+            current.append(c)
+        i += 1
+    statements.append("".join(current).strip())
+    return [s for s in statements if s]
+
+def run_script(cur, path):
+    failed = 0
+    for statement in split_statements(open(path, encoding="utf-8").read()):
+        try:
+            cur.execute(statement)
+        except psycopg2.Error as e:
+            failed += 1
+            print(f"   ⚠️ {os.path.basename(path)}: {statement.splitlines()[0][:70]}... {e.pgerror or e}".strip())
+    return failed
+
+def create_database():
+    admin = connect("postgres")
+    with admin.cursor() as cur:
+        cur.execute(f'DROP DATABASE IF EXISTS "{CHECK_DB}"')
+        cur.execute(f'CREATE DATABASE "{CHECK_DB}"')
+    admin.close()
+
+SYNTHETIC_SQL = """
+SELECT setseed(0.42);
+
+INSERT INTO dim_divipole (
+    cod_departamento, cod_municipio, cod_zona, cod_puesto, nom_departamento, nom_municipio,
+    nombre_puesto, direccion_puesto, tipo_zona, mesa, latitud, longitud
+)
+SELECT
+    LPAD(d::text, 2, '0'), LPAD(m::text, 3, '0'), LPAD(z::text, 2, '0'), LPAD(p::text, 2, '0'),
+    'DEPARTAMENTO ' || d, 'MUNICIPIO ' || d || '-' || m, 'PUESTO ' || z || '-' || p, 'CALLE ' || p,
+    CASE WHEN z = 1 THEN 'Urbana' ELSE 'Rural' END,
+    1 + (random() * 20)::int, 1 + random() * 10, -77 + random() * 5
+FROM generate_series(1, 33) d, generate_series(1, 30) m, generate_series(1, 2) z, generate_series(1, 5) p;
+
+INSERT INTO censo_electoral (
+    documento, tipo_documento, cod_departamento, cod_municipio, cod_zona, cod_puesto, fecha_registro_censo
+)
+SELECT
+    (10000000 + i)::text, 'CC',
+    LPAD((1 + i % 33)::text, 2, '0'), LPAD((1 + (i / 33) % 30)::text, 3, '0'),
+    LPAD((1 + (i / 990) % 2)::text, 2, '0'), LPAD((1 + (i / 1980) % 5)::text, 2, '0'),
+    DATE '2000-01-01' + (i % 8000)
+FROM generate_series(1, {censo_electoral}) i;
+
+INSERT INTO contactos_hjs (
+    documento, nombre_completo, contacto, direccion, barrio, municipio_texto, cod_departamento, cod_municipio
+)
+SELECT
+    -- Every 4th census person, formatted as the HJS sheets do
+    to_char(10000000 + i * 4, 'FM99G999G999'),
+    (ARRAY['MARÍA', 'JOSÉ', 'LUIS', 'ANA', 'CARLOS', 'LAURA', 'JUAN', 'DIANA', 'PEDRO', 'SOFÍA'])[1 + i % 10] || ' ' ||
+    (ARRAY['GÓMEZ', 'RODRÍGUEZ', 'PÉREZ', 'MARTÍNEZ', 'GARCÍA', 'LÓPEZ', 'DÍAZ', 'TORRES', 'RUIZ', 'VARGAS'])[1 + (i / 10) % 10] || ' ' ||
+    (ARRAY['SUÁREZ', 'ROJAS', 'MORENO', 'JIMÉNEZ', 'CASTRO', 'ORTIZ', 'SILVA', 'RAMOS', 'MEDINA', 'HERRERA'])[1 + (i / 100) % 10],
+    '3' || LPAD((i % 1000000000)::text, 9, '0'), 'CALLE ' || i % 200, 'BARRIO ' || i % 50,
+    'MUNICIPIO ' || (1 + (i * 4) % 33),
+    LPAD((1 + (i * 4) % 33)::text, 2, '0'), LPAD((1 + ((i * 4) / 33) % 30)::text, 3, '0')
+FROM generate_series(1, {contactos_hjs}) i;
+
+INSERT INTO core_empresas (
+    empresa_id, nit, razon_social, tipo_empresa, estado_actual, fecha_constitucion, municipio_cod
+)
+SELECT
+    'E' || i, (800000000 + i)::text,
+    (ARRAY['INVERSIONES', 'COMERCIALIZADORA', 'CONSTRUCTORA', 'SERVICIOS', 'DISTRIBUIDORA'])[1 + i % 5] || ' ' ||
+    (ARRAY['ANDINA', 'DEL ORIENTE', 'SANTANDER', 'NACIONAL', 'GLOBAL'])[1 + (i / 5) % 5] || ' ' || i || ' S.A.S.',
+    (ARRAY['SAS', 'LTDA', 'SA', 'PERSONA NATURAL', 'COOPERATIVA'])[1 + (i / 25) % 5],
+    'ACTIVA', DATE '1980-01-01' + (random() * 16000)::int,
+    LPAD((1 + i % 33)::text, 2, '0') || LPAD((1 + (i / 33) % 30)::text, 3, '0')
+FROM generate_series(1, {core_empresas}) i;
+
+INSERT INTO empleados_empresas (
+    empleado_id, documento, empresa_id, nombre_completo, sexo, fecha_nacimiento, nivel_educativo,
+    email, celular, cod_departamento, cod_municipio, zona_codigo, puesto_codigo, updated_at
+)
+SELECT
+    'EMP' || i, (10000000 + i * 2)::text,
+    -- Skewed: a few large employers, many small ones
+    'E' || (1 + floor(power(random(), 3) * {core_empresas})::int),
+    (ARRAY['ANDRÉS', 'PAOLA', 'JORGE', 'CAMILA', 'MIGUEL', 'VALENTINA', 'DAVID', 'ISABEL'])[1 + i % 8] || ' ' ||
+    (ARRAY['GÓMEZ', 'RODRÍGUEZ', 'PÉREZ', 'MARTÍNEZ', 'GARCÍA', 'LÓPEZ', 'DÍAZ', 'TORRES'])[1 + (i / 8) % 8],
+    CASE WHEN i % 2 = 0 THEN 'F' ELSE 'M' END,
+    DATE '1950-01-01' + (random() * 20000)::int,
+    (ARRAY['BACHILLER', 'TÉCNICO', 'TECNÓLOGO', 'PROFESIONAL', 'POSGRADO', NULL])[1 + i % 6],
+    CASE WHEN i % 3 = 0 THEN NULL ELSE 'empleado' || i || '@correo.com' END,
+    CASE WHEN i % 4 = 0 THEN NULL ELSE '3' || LPAD(i::text, 9, '0') END,
+    LPAD((1 + (i * 2) % 33)::text, 2, '0'), LPAD((1 + ((i * 2) / 33) % 30)::text, 3, '0'),
+    LPAD((1 + i % 2)::text, 2, '0'), LPAD((1 + i % 5)::text, 2, '0'),
+    CURRENT_TIMESTAMP - (i % 365) * INTERVAL '1 day'
+FROM generate_series(1, {empleados_empresas}) i;
+
+INSERT INTO representantes_legales_contacto (
+    id_contacto_empresa, nombre_contacto, rol_empresa, celular, email, empresa_id, documento
+)
+SELECT
+    'R' || i, 'REPRESENTANTE ' || i, 'REPRESENTANTE LEGAL', '3' || LPAD(i::text, 9, '0'),
+    'rep' || i || '@empresa.com', 'E' || (1 + i % {core_empresas}), (10000000 + i * 3)::text
+FROM generate_series(1, {representantes_legales_contacto}) i;
+
+INSERT INTO dim_grupos (nombre) SELECT 'GRUPO ' || g FROM generate_series(1, 20) g;
+
+INSERT INTO rel_contacto_grupo (documento, grupo_id)
+SELECT to_char(10000000 + (1 + i % {contactos_hjs}) * 4, 'FM99G999G999'), 1 + (i * 7) % 20
+FROM generate_series(1, {rel_contacto_grupo}) i;
+
+INSERT INTO lideres_campana (
+    nombre_completo, comuna, cod_municipio, meta_votos, verificado, hojas_vida_entregadas,
+    boletas_bingo, damas_gratis, pendones, hoja_origen, clave_natural
+)
+SELECT
+    'LÍDER ' || i, 'COMUNA ' || (1 + i % 17),
+    -- Full DIVIPOLE code, bare municipality code, or nothing, as in the sheets
+    CASE i % 3
+        WHEN 0 THEN LPAD((1 + i % 33)::text, 2, '0') || LPAD((1 + i % 30)::text, 3, '0')
+        WHEN 1 THEN LPAD((1 + i % 30)::text, 3, '0')
+    END,
+    (random() * 500)::int, CASE WHEN i % 3 = 0 THEN 'NO' ELSE 'SI' END, (random() * 20)::int,
+    (random() * 100)::int, (random() * 50)::int, (random() * 30)::int, 'LIDERES', 'LIDERES|LÍDER ' || i
+FROM generate_series(1, {lideres_campana}) i;
+"""
+
+def load_dataset(scale):
+    print(f"🚀 Creating {CHECK_DB} with a synthetic dataset (scale {scale})...")
+    create_database()
+    conn = connect(CHECK_DB)
+    cur = conn.cursor()
+
+    failed = run_script(cur, os.path.join(REPO_DIR, "database", "ddl.sql"))
+    # ddl.sql declares rel_contacto_grupo.contacto_id as an INTEGER key into a VARCHAR
+    # column, which Postgres rejects; the loaders write (documento, grupo_id)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS rel_contacto_grupo (
+            rel_id SERIAL PRIMARY KEY,
+            documento VARCHAR(20),
+            grupo_id INTEGER,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cur.execute("ALTER TABLE rel_contacto_grupo ADD COLUMN IF NOT EXISTS documento VARCHAR(20)")
+    print(f"   📐 Schema created ({failed} statements of ddl.sql failed)")
+
+    rows = {table: max(1, int(count * scale)) for table, count in ROWS.items()}
+    for statement in split_statements(SYNTHETIC_SQL.format(**rows)):
+        cur.execute(statement)
+    print("   🧪 " + ", ".join(f"{table}: {count}" for table, count in rows.items()))
+
+    # Derived tables, built by the same code as the pipeline
+    os.environ.update(DB_HOST=DB_HOST, DB_NAME=CHECK_DB, DB_USER=DB_USER, DB_PASS=DB_PASS)
+    sys.path.insert(0, os.path.join(REPO_DIR, "etl"))
+    from personas import refresh_persons, SOURCE_FLAGS
+    from company_counters import refresh_company_counters, refresh_company_timeline
+    from leader_scorecard import refresh_leader_scorecard
+    from build_geo_aggregates import build_geo_aggregates
+
+    conn.autocommit = False
+    for table in SOURCE_FLAGS:
+        refresh_persons(cur, table)
+    refresh_company_counters(cur)
+    refresh_company_timeline(cur)
+    refresh_leader_scorecard(cur)
+    conn.commit()
+    conn.autocommit = True
+    build_geo_aggregates()
+
+    failed = run_script(cur, os.path.join(REPO_DIR, "database", "optimization.sql"))
+    print(f"   📐 Materialized views created ({failed} statements of optimization.sql failed)")
+    cur.execute("VACUUM ANALYZE")
+    cur.close()
+    conn.close()
+
+# --- CAPTURE AND EXPLAIN ---
+
+def capture_queries(conn, selected):
+    """Returns {case name: [(sql, params), ...]} as sent by the endpoint code."""
+    sys.path.insert(0, BACKEND_DIR)
+    import main
+    from exports import build_export_query
+    from response_cache import default_arguments
+
+    recorder = RecordingDatabase(conn)
+    main.database = recorder
+    captured = {}
+
+    async def run_cases():
+        for name, endpoint_name, kwargs in CASES:
+            if selected and name not in selected:
+                continue
+            endpoint = getattr(main, endpoint_name)
+            recorder.queries = []
+            try:
+                # Unwrapped: the response cache would hide the queries after the first case
+                await getattr(endpoint, "__wrapped__", endpoint)(**{**default_arguments(endpoint), **kwargs})
+            except Exception as e:
+                print(f"   ⚠️ {name}: {type(e).__name__}: {e}")
+            captured[name] = recorder.queries
+
+    asyncio.run(run_cases())
+
+    for name, kwargs in EXPORT_CASES:
+        if selected and name not in selected:
+            continue
+        query, args, _ = build_export_query(**kwargs)
+        sql = re.sub(r"\$(\d+)", r"%(p\1)s", query.replace("%", "%%"))
+        captured[name] = [(sql, {f"p{i + 1}": value for i, value in enumerate(args)})]
+    return captured
+
+def plan_nodes(node):
+    yield node
+    for child in node.get("Plans", []):
+        yield from plan_nodes(child)
+
+def describe(node):
+    text = node["Node Type"]
+    if "Relation Name" in node:
+        text += f" on {node['Relation Name']}"
+    if "Index Name" in node:
+        text += f" using {node['Index Name']}"
+    return text
+
+def explain(cur, sql, params, table_rows):
+    timings, plan = [], None
+    for attempt in range(REPEATS + 1):
+        cur.execute("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + sql, params)
+        result = cur.fetchone()[0]
+        result = json.loads(result) if isinstance(result, str) else result
+        plan = result[0]
+        if attempt:  # The first run only warms the cache
+            timings.append(plan["Execution Time"])
+    nodes = list(plan_nodes(plan["Plan"]))
+    return {
+        "ms": round(statistics.median(timings), 3),
+        "shape": [describe(n) for n in nodes],
+        "seq_scans": sorted({
+            n["Relation Name"] for n in nodes
+            if n["Node Type"] == "Seq Scan" and table_rows.get(n.get("Relation Name"), 0) >= LARGE_TABLE_ROWS
+        }),
+        "shared_blocks": plan["Plan"].get("Shared Hit Blocks", 0) + plan["Plan"].get("Shared Read Blocks", 0),
+    }
+
+def measure(conn, captured):
+    cur = conn.cursor()
+    cur.execute("SELECT relname, reltuples::BIGINT FROM pg_class WHERE relkind IN ('r', 'm')")
+    table_rows = dict(cur.fetchall())
+
+    results = {}
+    for name, queries in captured.items():
+        for i, (sql, params) in enumerate(queries):
+            if not re.match(r"\s*(SELECT|WITH)\b", sql, re.IGNORECASE):
+                continue
+            key = f"{name}#{i}"
+            try:
+                results[key] = explain(cur, sql, params, table_rows)
+                results[key]["sql"] = " ".join(sql.split())[:200]
+            except psycopg2.Error as e:
+                print(f"   ⚠️ {key}: {e.pgerror or e}".strip())
+    cur.close()
+    return results
+
+def compare(results, baselines, threshold):
+    """Returns the list of failures; prints every finding."""
+    failures = []
+    for key, current in sorted(results.items()):
+        base = baselines.get(key)
+        status = f"{current['ms']:9.2f} ms"
+        problems = []
+        scans = sorted(set(current["seq_scans"]) - SEQ_SCAN_ALLOWED.get(key.split("#")[0], set()))
+        if scans:
+            problems.append(f"seq scan on {', '.join(scans)}")
+        if base is None:
+            if problems:
+                failures.append(f"{key}: {'; '.join(problems)}")
+                print(f"   ❌ {key}: {status} - {'; '.join(problems)} (no baseline)")
+            else:
+                print(f"   ❔ {key}: {status} (no baseline)")
+            continue
+
+        limit = base["ms"] * (1 + threshold)
+        if current["ms"] > limit and current["ms"] - base["ms"] > MIN_REGRESSION_MS:
+            problems.append(f"{current['ms']:.2f} ms vs baseline {base['ms']:.2f} ms")
+        if problems:
+            failures.append(f"{key}: {'; '.join(problems)}")
+            print(f"   ❌ {key}: {status} - {'; '.join(problems)}")
+        elif current["shape"] != base["shape"]:
+            print(f"   🔀 {key}: {status} (plan changed: {' > '.join(current['shape'][:6])})")
+        else:
+            print(f"   ✅ {key}: {status} (baseline {base['ms']:.2f} ms)")
+    return failures
+
+def main():
+    parser = argparse.ArgumentParser(description="Checks the plans of the endpoint queries against stored baselines.")
+    parser.add_argument('cases', nargs='*', help="Cases to check (default: all).")
+    parser.add_argument('--scale', type=float, default=1.0, help="Synthetic dataset size multiplier.")
+    parser.add_argument('--skip-load', action='store_true', help="Reuse the dataset already in PLAN_CHECK_DB.")
+    parser.add_argument('--update', action='store_true', help="Write the measured plans as the new baselines.")
+    parser.add_argument('--threshold', type=float, default=0.5, help="Allowed slowdown over baseline (0.5 = 50%%).")
+    parser.add_argument('--baseline', default=BASELINE_FILE, help="Baseline file.")
+    parser.add_argument('--list', action='store_true', help="Print the cases and exit.")
+    args = parser.parse_args()
+
+    if args.list:
+        for name, endpoint_name, kwargs in CASES:
+            print(f"{name:28} {endpoint_name} {kwargs or ''}")
+        for name, kwargs in EXPORT_CASES:
+            print(f"{name:28} build_export_query {kwargs}")
+        return 0
+    if CHECK_DB == os.getenv("DB_NAME", "postgres"):
+        print(f"❌ PLAN_CHECK_DB must not be the application database ({CHECK_DB}): it is dropped and recreated")
+        return 2
+    if not args.skip_load:
+        load_dataset(args.scale)
+
+    conn = connect(CHECK_DB)
+    print("🔎 Capturing endpoint queries...")
+    captured = capture_queries(conn, set(args.cases))
+    print(f"⏱️ Explaining {sum(len(q) for q in captured.values())} queries ({REPEATS} runs each)...")
+    results = measure(conn, captured)
+    conn.close()
+
+    baselines = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            baselines = json.load(f)["queries"]
+    failures = compare(results, baselines, args.threshold)
+
+    if args.update:
+        merged = {**baselines, **results} if args.cases else results
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({"scale": args.scale, "queries": merged}, f, indent=2, sort_keys=True)
+        print(f"💾 Baselines written to {args.baseline}")
+        return 0
+    if failures:
+        print(f"❌ {len(failures)} plan regressions")
+        return 1
+    print("🏁 No plan regressions.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,310 @@
+import asyncio
+import inspect
+import json
+import os
+import sqlite3
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
+
+from fastapi import params
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import Response
+
+# Response cache shared by every uvicorn worker on the host, so N workers compute each
+# analytics response once instead of N times. Bodies are stored already serialized.
+#   - sqlite (default): one file on /dev/shm, read by all workers through the page cache
+#   - redis: REDIS_URL, a local instance is enough (optional dependency: pip install redis)
+#   - off: no caching
+# Single writer: on a miss, a worker takes a short lock on the key and computes; other
+# workers poll for the result instead of running the same query (within one worker,
+# concurrent requests for a key share one computation).
+# Invalidation: keys carry a generation number; invalidate() bumps it, and a value computed
+# before the bump is stored under the old generation, where nobody reads it. The
+# generation also moves when version_source (the latest ETL run) changes.
+BACKEND = os.getenv("RESPONSE_CACHE", "sqlite")
+SQLITE_PATH = os.getenv("RESPONSE_CACHE_PATH", os.path.join(
+    "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir(), "hjs_response_cache.sqlite"
+))
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+TTL_SECONDS = int(os.getenv("RESPONSE_CACHE_TTL", "3600"))
+MAX_MB = int(os.getenv("RESPONSE_CACHE_MAX_MB", "256"))
+LOCK_SECONDS = 30          # A worker computing a key longer than this loses its lock
+WAIT_POLL_SECONDS = 0.05
+VERSION_CHECK_SECONDS = 10
+PURGE_EVERY_WRITES = 200
+
+class SQLiteStore:
+    """Cache file shared between processes. All calls go through one thread, which owns
+    this process's connection."""
+
+    def __init__(self, path=SQLITE_PATH, max_bytes=MAX_MB * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.connection = None
+        self.writes = 0
+
+    def _connect(self):
+        if self.connection is None:
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=OFF")  # Losing the cache in a crash is fine
+            connection.executescript("""
+                CREATE TABLE IF NOT EXISTS entries (
+                    key TEXT PRIMARY KEY, value BLOB NOT NULL, created_at REAL NOT NULL, expires_at REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS locks (key TEXT PRIMARY KEY, expires_at REAL NOT NULL);
+                CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT);
+                INSERT OR IGNORE INTO meta (name, value) VALUES ('generation', '0');
+            """)
+            self.connection = connection
+        return self.connection
+
+    async def _run(self, fn, *args):
+        return await asyncio.get_event_loop().run_in_executor(self.executor, fn, *args)
+
+    def _generation(self):
+        return int(self._connect().execute("SELECT value FROM meta WHERE name = 'generation'").fetchone()[0])
+
+    def _get(self, key):
+        row = self._connect().execute(
+            "SELECT value FROM entries WHERE key = ? AND expires_at > ?", (key, time.time())
+        ).fetchone()
+        return row[0] if row else None
+
+    def _try_lock(self, key):
+        now = time.time()
+        cursor = self._connect().execute("""
+            INSERT INTO locks (key, expires_at) VALUES (?, ?)
+            ON CONFLICT (key) DO UPDATE SET expires_at = excluded.expires_at WHERE locks.expires_at <= ?
+        """, (key, now + LOCK_SECONDS, now))
+        return cursor.rowcount == 1
+
+    def _unlock(self, key):
+        self._connect().execute("DELETE FROM locks WHERE key = ?", (key,))
+
+    def _set(self, key, value, ttl):
+        connection = self._connect()
+        now = time.time()
+        connection.execute(
+            "INSERT OR REPLACE INTO entries (key, value, created_at, expires_at) VALUES (?, ?, ?, ?)",
+            (key, value, now, now + ttl)
+        )
+        connection.execute("DELETE FROM locks WHERE key = ?", (key,))
+        self.writes += 1
+        if self.writes % PURGE_EVERY_WRITES == 0:
+            self._purge()
+
+    def _purge(self):
+        connection = self._connect()
+        now = time.time()
+        connection.execute("DELETE FROM entries WHERE expires_at <= ?", (now,))
+        connection.execute("DELETE FROM locks WHERE expires_at <= ?", (now,))
+        size = connection.execute("SELECT COALESCE(SUM(LENGTH(value)), 0) FROM entries").fetchone()[0]
+        if size > self.max_bytes:
+            # Over budget: drop the older half
+            connection.execute("""
+                DELETE FROM entries WHERE key IN (
+                    SELECT key FROM entries ORDER BY created_at LIMIT (SELECT COUNT(*) / 2 + 1 FROM entries)
+                )
+            """)
+
+    def _invalidate(self, connection):
+        connection.execute("UPDATE meta SET value = CAST(value AS INTEGER) + 1 WHERE name = 'generation'")
+        connection.execute("DELETE FROM entries")
+        connection.execute("DELETE FROM locks")
+
+    def _invalidate_all(self):
+        connection = self._connect()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            self._invalidate(connection)
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+
+    def _set_data_version(self, version):
+        connection = self._connect()
+        connection.execute("BEGIN IMMEDIATE")  # Only the first worker to see a new version invalidates
+        try:
+            row = connection.execute("SELECT value FROM meta WHERE name = 'data_version'").fetchone()
+            changed = row is None or row[0] != version
+            if changed:
+                connection.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('data_version', ?)", (version,))
+                if row is not None:
+                    self._invalidate(connection)
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        return changed
+
+    async def generation(self):
+        return await self._run(self._generation)
+
+    async def get(self, key):
+        return await self._run(self._get, key)
+
+    async def try_lock(self, key):
+        return await self._run(self._try_lock, key)
+
+    async def unlock(self, key):
+        await self._run(self._unlock, key)
+
+    async def set(self, key, value, ttl):
+        await self._run(self._set, key, value, ttl)
+
+    async def invalidate(self):
+        await self._run(self._invalidate_all)
+
+    async def set_data_version(self, version):
+        return await self._run(self._set_data_version, version)
+
+class RedisStore:
+    """Same operations on Redis; entries of old generations are left to expire."""
+
+    def __init__(self, url=REDIS_URL, prefix="hjs:cache:"):
+        import redis.asyncio as redis  # Optional dependency, only for RESPONSE_CACHE=redis
+        self.client = redis.from_url(url)
+        self.prefix = prefix
+
+    async def generation(self):
+        return int(await self.client.get(self.prefix + "generation") or 0)
+
+    async def get(self, key):
+        return await self.client.get(self.prefix + "entry:" + key)
+
+    async def try_lock(self, key):
+        return bool(await self.client.set(self.prefix + "lock:" + key, 1, nx=True, ex=LOCK_SECONDS))
+
+    async def unlock(self, key):
+        await self.client.delete(self.prefix + "lock:" + key)
+
+    async def set(self, key, value, ttl):
+        await self.client.set(self.prefix + "entry:" + key, value, ex=ttl)
+        await self.unlock(key)
+
+    async def invalidate(self):
+        await self.client.incr(self.prefix + "generation")
+
+    async def set_data_version(self, version):
+        previous = await self.client.getset(self.prefix + "data_version", version)
+        if previous is None or previous.decode() == version:
+            return previous is None
+        await self.invalidate()
+        return True
+
+def open_store(backend=BACKEND):
+    if backend == "off":
+        return None
+    if backend == "redis":
+        return RedisStore()
+    if backend == "sqlite":
+        return SQLiteStore()
+    raise ValueError(f"RESPONSE_CACHE must be sqlite, redis or off, got {backend!r}")
+
+def default_arguments(endpoint):
+    """Defaults of an endpoint's optional parameters, Query(...) unwrapped, so a direct call
+    (the startup warm-up) gets the same key and arguments as a request."""
+    defaults = {}
+    for name, param in inspect.signature(endpoint).parameters.items():
+        default = param.default
+        if isinstance(default, params.Param):
+            default = default.default
+        if default is param.empty or default is ... or type(default).__name__ == "PydanticUndefinedType":
+            continue  # Required
+        defaults[name] = default
+    return defaults
+
+class ResponseCache:
+    def __init__(self, store, ttl=TTL_SECONDS):
+        self.store = store
+        self.ttl = ttl
+        self.version_source = None  # async fn -> str identifying the loaded data
+        self.version_checked_at = 0.0
+        self.inflight = {}
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self):
+        return self.store is not None
+
+    async def check_version(self, force=False):
+        if self.version_source is None or not self.enabled:
+            return False
+        if not force and time.monotonic() - self.version_checked_at < VERSION_CHECK_SECONDS:
+            return False
+        self.version_checked_at = time.monotonic()
+        try:
+            return await self.store.set_data_version(str(await self.version_source()))
+        except Exception as e:
+            print(f"Response cache: version check failed: {e}")
+            return False
+
+    async def invalidate(self):
+        if self.enabled:
+            await self.store.invalidate()
+
+    async def get_or_compute(self, key, compute):
+        """compute: async fn returning the response body (bytes)."""
+        future = self.inflight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(self._fetch(key, compute))
+            self.inflight[key] = future
+            future.add_done_callback(lambda _: self.inflight.pop(key, None))
+        # Shielded: a client leaving does not cancel the computation others wait on
+        return await asyncio.shield(future)
+
+    async def _fetch(self, key, compute):
+        try:
+            key = f"{await self.store.generation()}:{key}"
+            deadline = time.monotonic() + LOCK_SECONDS
+            while True:
+                value = await self.store.get(key)
+                if value is not None:
+                    self.hits += 1
+                    return bytes(value)
+                if await self.store.try_lock(key) or time.monotonic() > deadline:
+                    break
+                await asyncio.sleep(WAIT_POLL_SECONDS)  # Another worker is computing it
+        except Exception as e:
+            print(f"Response cache unavailable: {e}")
+            return await compute()
+
+        self.misses += 1
+        try:
+            value = await compute()
+        except BaseException:
+            try:
+                await self.store.unlock(key)
+            except Exception:
+                pass
+            raise
+        try:
+            await self.store.set(key, value, self.ttl)
+        except Exception as e:
+            print(f"Response cache: could not store {key}: {e}")
+        return value
+
+    def cached(self, endpoint):
+        """Decorator for JSON GET endpoints (below @app.get); the key is the endpoint name
+        and its query parameters."""
+        defaults = default_arguments(endpoint)
+
+        @wraps(endpoint)
+        async def wrapper(**kwargs):
+            kwargs = {**defaults, **kwargs}
+            if not self.enabled:
+                return await endpoint(**kwargs)
+            await self.check_version()
+
+            async def compute():
+                return json.dumps(jsonable_encoder(await endpoint(**kwargs))).encode("utf-8")
+
+            key = endpoint.__name__ + json.dumps(kwargs, sort_keys=True, default=str)
+            return Response(content=await self.get_or_compute(key, compute), media_type="application/json")
+        return wrapper
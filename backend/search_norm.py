@@ -0,0 +1,21 @@
+import re
+
+# Python side of the database's search_norm() (database/ddl.sql, etl/search_index.py),
+# used to normalize /api/search queries. It must give the same result as the SQL function,
+# which translates only the characters below before upper-casing, so both use the same
+# table instead of a general accent removal.
+ACCENTED = 'áàäâéèëêíìïîóòöôúùüûñçÁÀÄÂÉÈËÊÍÌÏÎÓÒÖÔÚÙÜÛÑÇ'
+UNACCENTED = 'aaaaeeeeiiiioooouuuuncAAAAEEEEIIIIOOOOUUUUNC'
+
+ACCENT_TABLE = str.maketrans(ACCENTED, UNACCENTED)
+
+def sql_upper(text):
+    # upper() maps one character to one character: some non-ASCII letters become ASCII
+    # ('ı' -> 'I', 'ſ' -> 'S') and survive the regex, while letters whose upper case is
+    # several characters in Python ('ß' -> 'SS') are left as they are, as in Postgres
+    return "".join(u if len(u := c.upper()) == 1 else c for c in text)
+
+def search_text(text: str):
+    """Same normalization as search_norm() in the database: translate(), upper(), then
+    everything but A-Z/0-9 to single spaces."""
+    return re.sub(r"[^A-Z0-9]+", " ", sql_upper(text.translate(ACCENT_TABLE))).strip()
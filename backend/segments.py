@@ -0,0 +1,146 @@
+import numpy as np
+
+# In-memory audience counting over segment_personas / segment_grupos (etl/build_segments.py).
+# Every person is a dense segment_id, so a set of persons is a bitmap of 64-bit words.
+#   - Geography: ids are assigned in (departamento, municipio) order, so a department or
+#     municipio is just an id range, located with a binary search. No storage at all.
+#   - Groups, sexo, age bucket, source: a sorted id array when sparse (fewer than 1 in 32
+#     persons, smaller than its bitmap), otherwise the bitmap itself.
+# A segment is a JSON expression evaluated word-wise with numpy:
+#   {"and": [...]}, {"or": [...]}, {"not": {...}} and leaves such as
+#   {"grupo": "BINGO"}, {"departamento": "68"}, {"municipio": "68001"}, {"sexo": "F"},
+#   {"edad": "31-60"}, {"fuente": "censo_electoral"}
+
+# Same buckets as mv_age_distribution; index = segment_personas.rango_edad
+AGE_BUCKETS = ['Menores de 18', '18-30', '31-60', 'Mayor de 60', 'Desconocido']
+
+# Same bits as etl/personas.py
+SOURCE_FLAGS = {
+    'censo_electoral': 1,
+    'contactos_hjs': 2,
+    'empleados_empresas': 4,
+    'representantes_legales_contacto': 8,
+}
+
+class SegmentError(ValueError):
+    """Invalid segment expression; the message is safe to return to clients."""
+
+def popcount(words):
+    if hasattr(np, 'bitwise_count'):  # numpy >= 2.0
+        return int(np.bitwise_count(words).sum())
+    return int(np.unpackbits(words.view(np.uint8)).sum())
+
+class SegmentIndex:
+    def __init__(self, personas, grupos, group_names, build_id=None):
+        """personas: int array (n, 4) of [geo, sexo, rango_edad, fuentes] ordered by segment_id,
+        geo = dept * 1000 + muni (-1 unknown, always last), sexo = character code (0 unknown).
+        grupos: int array (m, 2) of [grupo_id, segment_id]. group_names: {nombre: grupo_id}."""
+        self.build_id = build_id
+        self.size = len(personas)
+        self.words = (self.size + 63) // 64
+        self.group_names = dict(group_names)
+
+        geo = np.asarray(personas[:, 0], dtype=np.int64) if self.size else np.empty(0, np.int64)
+        self.geo_known = int(np.count_nonzero(geo >= 0))
+        self.geo = geo[:self.geo_known]
+
+        self.sets = {}
+        if self.size:
+            for code in np.unique(personas[:, 1]):
+                if code > 0:
+                    self.sets[('sexo', chr(int(code)))] = self._compress(np.flatnonzero(personas[:, 1] == code))
+            for bucket, label in enumerate(AGE_BUCKETS):
+                self.sets[('edad', label)] = self._compress(np.flatnonzero(personas[:, 2] == bucket))
+            for name, flag in SOURCE_FLAGS.items():
+                self.sets[('fuente', name)] = self._compress(np.flatnonzero(personas[:, 3] & flag))
+
+        if len(grupos):
+            grupos = grupos[np.lexsort((grupos[:, 1], grupos[:, 0]))]
+            starts = np.flatnonzero(np.r_[True, grupos[1:, 0] != grupos[:-1, 0]])
+            for start, end in zip(starts, np.r_[starts[1:], len(grupos)]):
+                self.sets[('grupo', int(grupos[start, 0]))] = self._compress(grupos[start:end, 1])
+
+        # Bits past `size` in the last word; cleared after every NOT
+        self.valid = self._range_words(0, self.size)
+
+    def __len__(self):
+        return self.size
+
+    def _to_words(self, ids):
+        bits = np.zeros(self.words * 64, dtype=bool)
+        bits[ids] = True
+        return np.packbits(bits, bitorder='little').view('<u8').copy()
+
+    def _range_words(self, start, end):
+        bits = np.zeros(self.words * 64, dtype=bool)
+        bits[start:end] = True
+        return np.packbits(bits, bitorder='little').view('<u8').copy()
+
+    def _compress(self, ids):
+        if len(ids) * 32 < self.size:
+            return np.asarray(ids, dtype=np.int32)
+        return self._to_words(ids)
+
+    def _leaf_words(self, key):
+        stored = self.sets.get(key)
+        if stored is None:
+            return np.zeros(self.words, dtype='<u8')
+        if stored.dtype == np.int32:
+            return self._to_words(stored)
+        return stored
+
+    def _geo_range(self, low, high):
+        return (int(np.searchsorted(self.geo, low, side='left')),
+                int(np.searchsorted(self.geo, high, side='left')))
+
+    def _leaf(self, kind, value):
+        value = str(value).strip()
+        if kind == 'departamento':
+            if not value.isdigit():
+                raise SegmentError(f"departamento must be a DIVIPOLE code, got {value!r}")
+            return self._range_words(*self._geo_range(int(value) * 1000, (int(value) + 1) * 1000))
+        if kind == 'municipio':
+            # 5-digit code (dept + muni)
+            if not value.isdigit() or len(value) != 5:
+                raise SegmentError(f"municipio must be a 5-digit DIVIPOLE code, got {value!r}")
+            return self._range_words(*self._geo_range(int(value), int(value) + 1))
+        if kind == 'grupo':
+            grupo_id = int(value) if value.isdigit() else self.group_names.get(value)
+            if grupo_id is None:
+                raise SegmentError(f"unknown grupo {value!r}")
+            return self._leaf_words(('grupo', grupo_id))
+        if kind == 'sexo':
+            return self._leaf_words(('sexo', value.upper()))
+        if kind == 'edad':
+            if value not in AGE_BUCKETS:
+                raise SegmentError(f"edad must be one of {AGE_BUCKETS}")
+            return self._leaf_words(('edad', value))
+        if kind == 'fuente':
+            if value not in SOURCE_FLAGS:
+                raise SegmentError(f"fuente must be one of {sorted(SOURCE_FLAGS)}")
+            return self._leaf_words(('fuente', value))
+        raise SegmentError(f"unknown segment key {kind!r}")
+
+    def _evaluate(self, expr):
+        if not isinstance(expr, dict) or len(expr) != 1:
+            raise SegmentError("each segment node must be an object with exactly one key")
+        (kind, arg), = expr.items()
+        if kind in ('and', 'or'):
+            if not isinstance(arg, list) or not arg:
+                raise SegmentError(f"'{kind}' takes a non-empty list")
+            result = self._evaluate(arg[0]).copy()
+            for item in arg[1:]:
+                if kind == 'and':
+                    result &= self._evaluate(item)
+                else:
+                    result |= self._evaluate(item)
+            return result
+        if kind == 'not':
+            return ~self._evaluate(arg) & self.valid
+        return self._leaf(kind, arg)
+
+    def count(self, expr):
+        """Number of persons matching the segment expression (None or {} = everyone)."""
+        if not expr:
+            return self.size
+        return popcount(self._evaluate(expr))
@@ -0,0 +1,133 @@
+import math
+import numpy as np
+
+# In-memory grid index over the puesto coordinates in dim_divipole.
+# Points are bucketed into square cells of CELL_DEGREES; a nearest-neighbour query
+# scans rings of cells outwards from the query point and stops as soon as no
+# unvisited cell can hold anything closer than the k-th result. Bounding-box queries
+# only touch the cells overlapping the box. No PostGIS needed.
+CELL_DEGREES = 0.05       # ~5.5 km at Colombian latitudes
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+def haversine_km(lat, lon, lats, lons):
+    lat1, lon1 = math.radians(lat), math.radians(lon)
+    lat2, lon2 = np.radians(lats), np.radians(lons)
+    a = np.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+class PuestoIndex:
+    def __init__(self, rows, cell_degrees=CELL_DEGREES):
+        """rows: mappings with latitud/longitud plus the attributes returned to clients."""
+        self.cell = cell_degrees
+        self.records = [dict(r) for r in rows if r["latitud"] is not None and r["longitud"] is not None]
+        self.records = [r for r in self.records if float(r["latitud"]) != 0 or float(r["longitud"]) != 0]
+        for r in self.records:
+            r["latitud"], r["longitud"] = float(r["latitud"]), float(r["longitud"])
+
+        self.lats = np.array([r["latitud"] for r in self.records], dtype=np.float64)
+        self.lons = np.array([r["longitud"] for r in self.records], dtype=np.float64)
+
+        # Cell -> indices of its points
+        self.cells = {}
+        if len(self.records):
+            lat_cells = np.floor(self.lats / self.cell).astype(np.int64)
+            lon_cells = np.floor(self.lons / self.cell).astype(np.int64)
+            order = np.lexsort((lon_cells, lat_cells))
+            keys = np.stack([lat_cells[order], lon_cells[order]], axis=1)
+            starts = np.flatnonzero(np.r_[True, np.any(keys[1:] != keys[:-1], axis=1)])
+            for start, end in zip(starts, np.r_[starts[1:], len(order)]):
+                self.cells[(int(keys[start, 0]), int(keys[start, 1]))] = order[start:end]
+            self.row_range = (int(lat_cells.min()), int(lat_cells.max()))
+            self.col_range = (int(lon_cells.min()), int(lon_cells.max()))
+
+    def __len__(self):
+        return len(self.records)
+
+    def _cell_of(self, lat, lon):
+        return math.floor(lat / self.cell), math.floor(lon / self.cell)
+
+    def _ring(self, row, col, radius):
+        if radius == 0:
+            yield row, col
+            return
+        for c in range(col - radius, col + radius + 1):
+            yield row - radius, c
+            yield row + radius, c
+        for r in range(row - radius + 1, row + radius):
+            yield r, col - radius
+            yield r, col + radius
+
+    def nearby(self, lat, lon, k=10, max_km=None):
+        """The k closest puestos to (lat, lon), nearest first, with distancia_km."""
+        if not self.records:
+            return []
+        row, col = self._cell_of(lat, lon)
+        # Ring radius beyond which the whole grid has been covered
+        max_radius = max(
+            abs(row - self.row_range[0]), abs(row - self.row_range[1]),
+            abs(col - self.col_range[0]), abs(col - self.col_range[1])
+        )
+        # Width of one cell in km along the shorter (longitude) side, for the stop bound
+        cell_km = self.cell * KM_PER_DEGREE * max(math.cos(math.radians(abs(lat) + self.cell)), 0.01)
+
+        found_idx, found_dist = [], []
+        radius = 0
+        while radius <= max_radius:
+            # Far from the data (or k close to everything) the rings are mostly empty:
+            # one vectorized pass over all points is cheaper
+            if (2 * radius + 1) ** 2 > 4 * len(self.cells):
+                found_idx = [np.arange(len(self.records))]
+                found_dist = [haversine_km(lat, lon, self.lats, self.lons)]
+                break
+            for key in self._ring(row, col, radius):
+                idx = self.cells.get(key)
+                if idx is not None:
+                    found_idx.append(idx)
+                    found_dist.append(haversine_km(lat, lon, self.lats[idx], self.lons[idx]))
+            # Anything outside the rings scanned so far is at least radius cells away
+            bound = radius * cell_km
+            if max_km is not None and bound >= max_km:
+                break
+            if found_idx and sum(len(i) for i in found_idx) >= k:
+                dist = np.concatenate(found_dist)
+                if np.partition(dist, k - 1)[k - 1] <= bound:
+                    break
+            radius += 1
+
+        if not found_idx:
+            return []
+        idx = np.concatenate(found_idx)
+        dist = np.concatenate(found_dist)
+        if max_km is not None:
+            keep = dist <= max_km
+            idx, dist = idx[keep], dist[keep]
+        best = np.argsort(dist, kind="stable")[:k]
+        return [dict(self.records[idx[i]], distancia_km=round(float(dist[i]), 3)) for i in best]
+
+    def bbox(self, min_lat, min_lon, max_lat, max_lon, limit=1000):
+        """Puestos inside the box, at most `limit` of them."""
+        if not self.records:
+            return []
+        r0, c0 = self._cell_of(min_lat, min_lon)
+        r1, c1 = self._cell_of(max_lat, max_lon)
+        r0, r1 = max(r0, self.row_range[0]), min(r1, self.row_range[1])
+        c0, c1 = max(c0, self.col_range[0]), min(c1, self.col_range[1])
+        if r0 > r1 or c0 > c1:
+            return []
+
+        # Very large boxes: cheaper to walk the occupied cells than every cell in range
+        if (r1 - r0 + 1) * (c1 - c0 + 1) > len(self.cells):
+            keys = [key for key in self.cells if r0 <= key[0] <= r1 and c0 <= key[1] <= c1]
+        else:
+            keys = [(r, c) for r in range(r0, r1 + 1) for c in range(c0, c1 + 1) if (r, c) in self.cells]
+
+        result = []
+        for key in keys:
+            idx = self.cells[key]
+            lats, lons = self.lats[idx], self.lons[idx]
+            inside = idx[(lats >= min_lat) & (lats <= max_lat) & (lons >= min_lon) & (lons <= max_lon)]
+            result.extend(self.records[i] for i in inside[:limit - len(result)])
+            if len(result) >= limit:
+                break
+        return result
@@ -165,9 +165,13 @@ CREATE TABLE "lideres_campana" (
     "damas_gratis" INTEGER,
     "pendones" INTEGER,
     "reunion_info" TEXT,
+    "hoja_origen" VARCHAR(100),
+    "clave_natural" VARCHAR(400),  -- hoja + nombre (load_seguimiento.py sincroniza por esta clave)
+    "row_hash" CHAR(32),           -- md5 del contenido, para detectar cambios
     "created_at" TIMESTAMP DEFAULT CURRENT_TIMESTAMP
     -- CORRECCIÓN: Eliminada FK a "municipio"
 );
+CREATE UNIQUE INDEX uq_lideres_campana_clave ON "lideres_campana" ("clave_natural");
 
 CREATE TABLE "candidatos_gestion" (
     "candidato_id" SERIAL PRIMARY KEY,
@@ -183,8 +187,11 @@ CREATE TABLE "candidatos_gestion" (
     "boletas_bingo" INTEGER,
     "pendones_entregados" INTEGER,
     "reunion_info" TEXT,
+    "clave_natural" VARCHAR(400),  -- hoja (partido) + nombre
+    "row_hash" CHAR(32),
     "created_at" TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
+CREATE UNIQUE INDEX uq_candidatos_gestion_clave ON "candidatos_gestion" ("clave_natural");
 
 -- --------------------------------------------------------------------------------------
 -- 5. TABLAS DE RELACIÓN Y ESPECÍFICAS
@@ -215,4 +222,295 @@ CREATE TABLE "rel_contacto_grupo" (
     
     FOREIGN KEY ("contacto_id") REFERENCES "contactos_hjs"("documento") ON DELETE CASCADE,
     FOREIGN KEY ("grupo_id") REFERENCES "dim_grupos"("grupo_id") ON DELETE CASCADE
-);
\ No newline at end of file
+);
+
+-- --------------------------------------------------------------------------------------
+-- 6. CONTROL DE CARGAS (ETL)
+-- --------------------------------------------------------------------------------------
+
+-- Huella por documento del último censo cargado (modo delta de load_censo.py)
+CREATE TABLE "censo_fingerprints" (
+    "documento" VARCHAR(20) PRIMARY KEY,
+    "fingerprint" BIGINT NOT NULL -- md5(documento + códigos geo + fecha) truncado a 64 bits
+);
+
+-- Manifiesto de cargas: hash del archivo fuente, conteos y duración
+CREATE TABLE "load_manifest" (
+    "manifest_id" SERIAL PRIMARY KEY,
+    "source" VARCHAR(100) NOT NULL,
+    "file_hash" CHAR(64),
+    "load_mode" VARCHAR(10),       -- delta / full
+    "rows_read" INTEGER DEFAULT 0,
+    "rows_inserted" INTEGER DEFAULT 0,
+    "rows_updated" INTEGER DEFAULT 0,
+    "rows_deleted" INTEGER DEFAULT 0,
+    "rows_unchanged" INTEGER DEFAULT 0,
+    "duration_seconds" NUMERIC(10, 2),
+    "status" VARCHAR(20),          -- OK / SKIPPED / FAILED
+    "loaded_at" TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX idx_load_manifest_source ON "load_manifest" ("source", "loaded_at" DESC);
+
+-- Ejecuciones del orquestador (etl/run_pipeline.py): una fila por etapa y corrida
+CREATE TABLE "load_runs" (
+    "load_run_id" SERIAL PRIMARY KEY,
+    "run_id" VARCHAR(36) NOT NULL,   -- agrupa las etapas de una misma corrida (--resume la reutiliza)
+    "stage" VARCHAR(50) NOT NULL,
+    "status" VARCHAR(20) NOT NULL,   -- OK / FAILED / SKIPPED / CANCELLED
+    "target_table" VARCHAR(100),
+    "rows_before" BIGINT,
+    "rows_after" BIGINT,
+    "started_at" TIMESTAMP,
+    "finished_at" TIMESTAMP,
+    "duration_seconds" NUMERIC(10, 2),
+    "exit_code" INTEGER
+);
+CREATE INDEX idx_load_runs_run ON "load_runs" ("run_id", "stage");
+
+-- Validación de calidad de datos (etl/validation.py): filas que incumplen una regla
+-- ('rechazar' = no se cargó, 'advertir' = se cargó). Solo se conserva la última corrida por fuente.
+CREATE TABLE "validation_rejects" (
+    "reject_id" BIGSERIAL PRIMARY KEY,
+    "source" VARCHAR(100) NOT NULL,
+    "regla" VARCHAR(100) NOT NULL,
+    "severidad" VARCHAR(20) NOT NULL,  -- rechazar / advertir
+    "fila" BIGINT,                     -- fila de datos en el archivo fuente (base 1)
+    "clave" VARCHAR(100),
+    "valor" TEXT,
+    "created_at" TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX idx_validation_rejects_source ON "validation_rejects" ("source", "regla");
+
+-- Conteo por regla de cada corrida de validación
+CREATE TABLE "validation_summary" (
+    "summary_id" SERIAL PRIMARY KEY,
+    "source" VARCHAR(100) NOT NULL,
+    "regla" VARCHAR(100) NOT NULL,
+    "severidad" VARCHAR(20) NOT NULL,
+    "filas_evaluadas" BIGINT DEFAULT 0,
+    "filas_fallidas" BIGINT DEFAULT 0,
+    "filas_no_guardadas" BIGINT DEFAULT 0,   -- fallidas que no caben en validation_rejects (tope por regla)
+    "validated_at" TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- --------------------------------------------------------------------------------------
+-- 7. ÍNDICE DE PERSONAS (CRUCE ENTRE FUENTES)
+-- --------------------------------------------------------------------------------------
+
+-- Documento normalizado: sin separadores ni sufijo '.0', como BIGINT (NULL si no es numérico)
+CREATE OR REPLACE FUNCTION doc_key(doc TEXT) RETURNS BIGINT AS $$
+    SELECT CASE WHEN d ~ '^[0-9]{1,18}$' THEN d::BIGINT END
+    FROM (
+        SELECT regexp_replace(regexp_replace(btrim(doc), '\.0$', ''), '[\s.,-]', '', 'g') AS d
+    ) n
+$$ LANGUAGE sql IMMUTABLE STRICT PARALLEL SAFE;
+
+-- Una fila por persona; los loaders actualizan su bit al terminar (etl/personas.py)
+CREATE TABLE "personas" (
+    "doc_key" BIGINT PRIMARY KEY,
+    "documento" VARCHAR(20),                  -- forma original (la menor entre fuentes)
+    "fuentes" SMALLINT NOT NULL DEFAULT 0,    -- 1 censo, 2 HJS, 4 empleados, 8 representantes
+    "updated_at" TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX idx_personas_fuentes ON "personas" ("fuentes");
+
+-- Búsquedas por documento normalizado en cada fuente
+CREATE INDEX idx_censo_electoral_doc_key ON "censo_electoral" (doc_key("documento"));
+CREATE INDEX idx_contactos_hjs_doc_key ON "contactos_hjs" (doc_key("documento"));
+CREATE INDEX idx_empleados_empresas_doc_key ON "empleados_empresas" (doc_key("documento"));
+CREATE INDEX idx_representantes_legales_contacto_doc_key ON "representantes_legales_contacto" (doc_key("documento"));
+
+-- --------------------------------------------------------------------------------------
+-- 8. RESOLUCIÓN DE MUNICIPIOS (TEXTO LIBRE)
+-- --------------------------------------------------------------------------------------
+
+-- Cada texto de municipio distinto se resuelve una sola vez (etl/geo_resolver.py).
+-- metodo: exacto / difuso / ambiguo / sin_resolver / manual. 'ambiguo': el nombre existe en
+-- varios departamentos y el texto no indica cuál (sin códigos). Las filas 'manual' son correcciones
+-- hechas a mano y la carga nunca las reemplaza; para corregir un texto basta con
+-- UPDATE ... SET cod_departamento, cod_municipio, metodo = 'manual'.
+CREATE TABLE "resolucion_municipios" (
+    "texto_normalizado" VARCHAR(255) PRIMARY KEY, -- mayúsculas, sin tildes ni signos
+    "texto_original" VARCHAR(255),
+    "cod_departamento" VARCHAR(5),
+    "cod_municipio" VARCHAR(5),
+    "nombre_resuelto" VARCHAR(100),
+    "metodo" VARCHAR(20) NOT NULL,
+    "similitud" NUMERIC(4, 3),                    -- similitud por trigramas (1 = exacto)
+    "version_divipole" CHAR(32),                  -- huella de dim_divipole usada; 'sin_resolver'/'ambiguo' se reintentan si cambia
+    "created_at" TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    "updated_at" TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- --------------------------------------------------------------------------------------
+-- 9. AGREGADOS GEOGRÁFICOS (MAPA)
+-- --------------------------------------------------------------------------------------
+
+-- Métricas por municipio para /api/geo/choropleth; se reconstruye al final del pipeline
+-- (etl/build_geo_aggregates.py). Códigos siempre con ceros a la izquierda (2 + 3 dígitos).
+CREATE TABLE "agg_geo_municipio" (
+    "cod_departamento" VARCHAR(5) NOT NULL,
+    "cod_municipio" VARCHAR(5) NOT NULL,
+    "nom_departamento" VARCHAR(100),
+    "nom_municipio" VARCHAR(100),
+    "puestos" INTEGER DEFAULT 0,
+    "mesas" INTEGER DEFAULT 0,
+    "censo" BIGINT DEFAULT 0,
+    "contactos" BIGINT DEFAULT 0,
+    "empleados" BIGINT DEFAULT 0,
+    "empresas" BIGINT DEFAULT 0,
+    "cobertura_pct" NUMERIC(14, 2) DEFAULT 0, -- contactos / censo * 100 (puede superar 100)
+    "updated_at" TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY ("cod_departamento", "cod_municipio")
+);
+
+-- --------------------------------------------------------------------------------------
+-- 10. BÚSQUEDA (NOMBRES NORMALIZADOS)
+-- --------------------------------------------------------------------------------------
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+-- Mayúsculas, sin tildes, solo letras/dígitos separados por un espacio ('José  Pérez-G.' -> 'JOSE PEREZ G').
+-- No reemplazar con otra definición: las columnas generadas guardan el resultado anterior.
+CREATE FUNCTION search_norm(t TEXT) RETURNS TEXT AS $$
+    SELECT NULLIF(btrim(regexp_replace(
+        upper(translate(t, 'áàäâéèëêíìïîóòöôúùüûñçÁÀÄÂÉÈËÊÍÌÏÎÓÒÖÔÚÙÜÛÑÇ', 'aaaaeeeeiiiioooouuuuncAAAAEEEEIIIIOOOOUUUUNC')),
+        '[^A-Z0-9]+', ' ', 'g'
+    )), '')
+$$ LANGUAGE sql IMMUTABLE STRICT PARALLEL SAFE;
+
+-- Columnas de /api/search, mantenidas por la base de datos en cada INSERT/UPDATE
+ALTER TABLE "contactos_hjs" ADD COLUMN "nombre_busqueda" TEXT GENERATED ALWAYS AS (search_norm("nombre_completo")) STORED;
+ALTER TABLE "empleados_empresas" ADD COLUMN "nombre_busqueda" TEXT GENERATED ALWAYS AS (search_norm("nombre_completo")) STORED;
+ALTER TABLE "core_empresas" ADD COLUMN "nombre_busqueda" TEXT GENERATED ALWAYS AS (search_norm("razon_social")) STORED;
+
+-- Prefijo del nombre completo (orden de índice) y prefijo de cualquier palabra (trigramas)
+CREATE INDEX idx_contactos_hjs_busqueda_prefijo ON "contactos_hjs" ("nombre_busqueda" text_pattern_ops);
+CREATE INDEX idx_contactos_hjs_busqueda_trgm ON "contactos_hjs" USING gin ("nombre_busqueda" gin_trgm_ops);
+CREATE INDEX idx_empleados_empresas_busqueda_prefijo ON "empleados_empresas" ("nombre_busqueda" text_pattern_ops);
+CREATE INDEX idx_empleados_empresas_busqueda_trgm ON "empleados_empresas" USING gin ("nombre_busqueda" gin_trgm_ops);
+CREATE INDEX idx_core_empresas_busqueda_prefijo ON "core_empresas" ("nombre_busqueda" text_pattern_ops);
+CREATE INDEX idx_core_empresas_busqueda_trgm ON "core_empresas" USING gin ("nombre_busqueda" gin_trgm_ops);
+CREATE INDEX idx_core_empresas_nit_prefijo ON "core_empresas" ("nit" text_pattern_ops);
+
+-- --------------------------------------------------------------------------------------
+-- 11. SEGMENTOS (CONTEO DE AUDIENCIAS)
+-- --------------------------------------------------------------------------------------
+
+-- Una fila por persona de "personas" con id denso, asignado en orden (departamento, municipio):
+-- el backend (backend/segments.py) guarda cada territorio como un rango de ids.
+-- Se reconstruye al final del pipeline (etl/build_segments.py).
+CREATE TABLE "segment_personas" (
+    "segment_id" INTEGER PRIMARY KEY,
+    "doc_key" BIGINT NOT NULL UNIQUE,
+    "fuentes" SMALLINT NOT NULL,              -- mismos bits que personas.fuentes
+    "cod_departamento" VARCHAR(2),            -- censo, si no HJS, si no empleados
+    "cod_municipio" VARCHAR(3),
+    "sexo" CHAR(1),                           -- del registro de empleado
+    "rango_edad" SMALLINT NOT NULL            -- 0 <18, 1 18-30, 2 31-60, 3 >60, 4 desconocido
+);
+
+CREATE TABLE "segment_grupos" (
+    "grupo_id" INTEGER NOT NULL,
+    "segment_id" INTEGER NOT NULL,
+    PRIMARY KEY ("grupo_id", "segment_id")
+);
+
+-- Una fila por reconstrucción; el backend recarga al ver un build_id nuevo
+CREATE TABLE "segment_build" (
+    "build_id" SERIAL PRIMARY KEY,
+    "personas" BIGINT,
+    "relaciones" BIGINT,
+    "built_at" TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- --------------------------------------------------------------------------------------
+-- 12. TRABAJOS EN SEGUNDO PLANO
+-- --------------------------------------------------------------------------------------
+
+-- Cola de trabajos de /api/jobs (backend/jobs.py). Los workers toman el pendiente más
+-- antiguo con FOR UPDATE SKIP LOCKED; los de tipo 'pipeline' los ejecuta
+-- run_pipeline.py --worker. estado: pendiente / ejecutando / completado / fallido / cancelado
+CREATE TABLE "jobs" (
+    "job_id" BIGSERIAL PRIMARY KEY,
+    "tipo" VARCHAR(50) NOT NULL,                -- export / refresh_views / reload_indexes / pipeline
+    "parametros" JSONB DEFAULT '{}',
+    "estado" VARCHAR(20) NOT NULL DEFAULT 'pendiente',
+    "progreso" NUMERIC(5, 2) DEFAULT 0,
+    "mensaje" TEXT,
+    "resultado" JSONB,
+    "intentos" SMALLINT NOT NULL DEFAULT 0,
+    "max_intentos" SMALLINT NOT NULL DEFAULT 3, -- reintentos tras caídas del proceso, no tras errores
+    "worker" VARCHAR(100),                      -- host:pid que lo ejecuta
+    "created_at" TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    "started_at" TIMESTAMP,
+    "heartbeat_at" TIMESTAMP,                   -- sin latido por 2 minutos: el proceso murió
+    "finished_at" TIMESTAMP
+);
+CREATE INDEX idx_jobs_pendientes ON "jobs" ("tipo", "job_id") WHERE "estado" = 'pendiente';
+
+-- --------------------------------------------------------------------------------------
+-- 13. CONTADORES POR EMPRESA
+-- --------------------------------------------------------------------------------------
+
+-- Empleados por empresa para /api/analytics/top-companies; una fila por empresa de
+-- core_empresas (también sin empleados). Lo actualizan load_empresas y load_empleados
+-- (etl/company_counters.py).
+CREATE TABLE "agg_empresa_empleados" (
+    "empresa_id" VARCHAR(20) PRIMARY KEY,
+    "razon_social" VARCHAR(255),
+    "nit" VARCHAR(20),
+    "tipo_empresa" VARCHAR(100),
+    "cod_departamento" VARCHAR(5),
+    "nom_departamento" VARCHAR(100),
+    "total_empleados" INTEGER NOT NULL DEFAULT 0,
+    "hombres" INTEGER NOT NULL DEFAULT 0,
+    "mujeres" INTEGER NOT NULL DEFAULT 0,
+    "con_email" INTEGER NOT NULL DEFAULT 0,
+    "con_celular" INTEGER NOT NULL DEFAULT 0,
+    "updated_at" TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX idx_agg_empresa_empleados_total ON "agg_empresa_empleados" ("total_empleados" DESC, "empresa_id");
+CREATE INDEX idx_agg_empresa_empleados_dept_total ON "agg_empresa_empleados" ("cod_departamento", "total_empleados" DESC, "empresa_id");
+
+-- --------------------------------------------------------------------------------------
+-- 14. SERIES DE TIEMPO DE EMPRESAS
+-- --------------------------------------------------------------------------------------
+
+-- Empresas creadas por mes, departamento y tipo para /api/analytics/company-timeline;
+-- trimestres, años y acumulados se suman desde aquí. Lo reconstruye load_empresas.
+CREATE TABLE "agg_empresas_mes" (
+    "mes" DATE NOT NULL,                      -- primer día del mes de fecha_constitucion
+    "cod_departamento" VARCHAR(5),
+    "nom_departamento" VARCHAR(100),
+    "tipo_empresa" VARCHAR(100),
+    "total_empresas" INTEGER NOT NULL
+);
+CREATE INDEX idx_agg_empresas_mes ON "agg_empresas_mes" ("mes", "cod_departamento");
+
+-- --------------------------------------------------------------------------------------
+-- 15. TABLERO DE LÍDERES
+-- --------------------------------------------------------------------------------------
+
+-- Una fila por líder de lideres_campana para /api/analytics/leader-efficiency y
+-- verified-leaders. Lo reconstruye load_seguimiento (etl/leader_scorecard.py).
+-- Un cod_municipio sin departamento solo se resuelve si existe en un único departamento.
+CREATE TABLE "agg_lideres" (
+    "lider_id" INTEGER PRIMARY KEY,
+    "nombre_completo" VARCHAR(255),
+    "comuna" VARCHAR(50),
+    "cod_departamento" VARCHAR(5),
+    "nom_departamento" VARCHAR(100),
+    "cod_municipio" VARCHAR(5),
+    "nom_municipio" VARCHAR(100),
+    "verificado" BOOLEAN NOT NULL DEFAULT FALSE,
+    "meta_votos" INTEGER NOT NULL DEFAULT 0,
+    "pendones" INTEGER NOT NULL DEFAULT 0,
+    "boletas_bingo" INTEGER NOT NULL DEFAULT 0,
+    "damas_gratis" INTEGER NOT NULL DEFAULT 0,
+    "total_recursos" INTEGER NOT NULL DEFAULT 0,   -- pendones + boletas_bingo + damas_gratis
+    "votos_por_recurso" NUMERIC(12, 2),            -- meta_votos / total_recursos
+    "ranking_comuna" INTEGER NOT NULL              -- por meta_votos dentro de la comuna
+);
+CREATE INDEX idx_agg_lideres_recursos ON "agg_lideres" ("total_recursos" DESC, "lider_id");
+CREATE INDEX idx_agg_lideres_comuna ON "agg_lideres" ("comuna", "ranking_comuna");
@@ -0,0 +1,123 @@
+import psycopg2
+import os
+import time
+
+# Per-municipality metrics behind /api/geo/choropleth, rebuilt after the loads.
+# Codes are left-padded because the CSV sources store '1'/'43' where
+# dim_divipole stores '01'/'043'.
+
+# Configuration
+DB_HOST = os.getenv("DB_HOST", "db")
+DB_NAME = os.getenv("DB_NAME", "postgres")
+DB_USER = os.getenv("DB_USER", "postgres")
+DB_PASS = os.getenv("DB_PASS", "postgres")
+
+def get_db_connection():
+    retries = 5
+    while retries > 0:
+        try:
+            conn = psycopg2.connect(
+                host=DB_HOST,
+                database=DB_NAME,
+                user=DB_USER,
+                password=DB_PASS
+            )
+            return conn
+        except psycopg2.OperationalError as e:
+            print(f"DB not ready, retrying... {e}")
+            time.sleep(5)
+            retries -= 1
+    raise Exception("DB Connection failed")
+
+def ensure_aggregate_table(cur):
+    # Same definition as database/ddl.sql, for databases created before it existed
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS agg_geo_municipio (
+            cod_departamento VARCHAR(5) NOT NULL,
+            cod_municipio VARCHAR(5) NOT NULL,
+            nom_departamento VARCHAR(100),
+            nom_municipio VARCHAR(100),
+            puestos INTEGER DEFAULT 0,
+            mesas INTEGER DEFAULT 0,
+            censo BIGINT DEFAULT 0,
+            contactos BIGINT DEFAULT 0,
+            empleados BIGINT DEFAULT 0,
+            empresas BIGINT DEFAULT 0,
+            cobertura_pct NUMERIC(14, 2) DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (cod_departamento, cod_municipio)
+        );
+    """)
+    # Contacts can outnumber a small census (stale census, contacts geocoded to the wrong
+    # municipality), which overflowed the original NUMERIC(7, 2). Only altered when still
+    # narrow: ALTER TYPE locks out readers until the rebuild commits, even as a no-op.
+    cur.execute("""
+        SELECT numeric_precision FROM information_schema.columns
+        WHERE table_name = 'agg_geo_municipio' AND column_name = 'cobertura_pct'
+    """)
+    if cur.fetchone()[0] != 14:
+        cur.execute("ALTER TABLE agg_geo_municipio ALTER COLUMN cobertura_pct TYPE NUMERIC(14, 2);")
+
+def build_geo_aggregates():
+    conn = get_db_connection()
+    cur = conn.cursor()
+    start_time = time.time()
+
+    print("🚀 Building municipality aggregates...")
+    ensure_aggregate_table(cur)
+
+    # Rebuilt in one transaction: readers see the old rows until COMMIT
+    cur.execute("DELETE FROM agg_geo_municipio;")
+    cur.execute("""
+        WITH municipios AS (
+            SELECT
+                LPAD(cod_departamento, 2, '0') AS dept,
+                LPAD(cod_municipio, 3, '0') AS muni,
+                MAX(nom_departamento) AS nom_departamento,
+                MAX(nom_municipio) AS nom_municipio,
+                COUNT(*) AS puestos,
+                COALESCE(SUM(mesa), 0) AS mesas
+            FROM dim_divipole
+            GROUP BY 1, 2
+        ),
+        censo AS (
+            SELECT LPAD(cod_departamento, 2, '0') AS dept, LPAD(cod_municipio, 3, '0') AS muni, COUNT(*) AS total
+            FROM censo_electoral GROUP BY 1, 2
+        ),
+        contactos AS (
+            SELECT LPAD(cod_departamento, 2, '0') AS dept, LPAD(cod_municipio, 3, '0') AS muni, COUNT(*) AS total
+            FROM contactos_hjs GROUP BY 1, 2
+        ),
+        empleados AS (
+            SELECT LPAD(cod_departamento, 2, '0') AS dept, LPAD(cod_municipio, 3, '0') AS muni, COUNT(*) AS total
+            FROM empleados_empresas GROUP BY 1, 2
+        ),
+        empresas AS (
+            -- municipio_cod is the 5-digit dept + muni code
+            SELECT LEFT(municipio_cod, 2) AS dept, SUBSTRING(municipio_cod FROM 3 FOR 3) AS muni, COUNT(*) AS total
+            FROM core_empresas WHERE LENGTH(municipio_cod) = 5 GROUP BY 1, 2
+        )
+        INSERT INTO agg_geo_municipio (
+            cod_departamento, cod_municipio, nom_departamento, nom_municipio,
+            puestos, mesas, censo, contactos, empleados, empresas, cobertura_pct
+        )
+        SELECT
+            m.dept, m.muni, m.nom_departamento, m.nom_municipio,
+            m.puestos, m.mesas,
+            COALESCE(c.total, 0), COALESCE(h.total, 0), COALESCE(e.total, 0), COALESCE(x.total, 0),
+            CASE WHEN c.total > 0 THEN ROUND(COALESCE(h.total, 0)::decimal / c.total * 100, 2) ELSE 0 END
+        FROM municipios m
+        LEFT JOIN censo c ON c.dept = m.dept AND c.muni = m.muni
+        LEFT JOIN contactos h ON h.dept = m.dept AND h.muni = m.muni
+        LEFT JOIN empleados e ON e.dept = m.dept AND e.muni = m.muni
+        LEFT JOIN empresas x ON x.dept = m.dept AND x.muni = m.muni;
+    """)
+    rows = cur.rowcount
+    conn.commit()
+
+    print(f"🏁 DONE! {rows} municipalities aggregated in {time.time() - start_time:.2f} seconds.")
+    cur.close()
+    conn.close()
+
+if __name__ == "__main__":
+    build_geo_aggregates()
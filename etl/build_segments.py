@@ -0,0 +1,159 @@
+import psycopg2
+import os
+import time
+
+# Person table behind the in-memory segment engine (backend/segments.py).
+# Every person in `personas` gets a dense segment_id, assigned in (departamento, municipio)
+# order so the backend can keep geography as id ranges instead of bitmaps. Attributes are
+# flattened here once per load, so the backend only has to read two narrow tables:
+#   - geography: census first (where they vote), then HJS contact, then employee record
+#   - sexo / rango_edad: employee record (the only source with them)
+#   - groups: rel_contacto_grupo, one row per (grupo_id, segment_id)
+# segment_build gets a row per rebuild; the backend reloads when it sees a newer one.
+
+# Configuration
+DB_HOST = os.getenv("DB_HOST", "db")
+DB_NAME = os.getenv("DB_NAME", "postgres")
+DB_USER = os.getenv("DB_USER", "postgres")
+DB_PASS = os.getenv("DB_PASS", "postgres")
+
+def get_db_connection():
+    retries = 5
+    while retries > 0:
+        try:
+            conn = psycopg2.connect(
+                host=DB_HOST,
+                database=DB_NAME,
+                user=DB_USER,
+                password=DB_PASS
+            )
+            return conn
+        except psycopg2.OperationalError as e:
+            print(f"DB not ready, retrying... {e}")
+            time.sleep(5)
+            retries -= 1
+    raise Exception("DB Connection failed")
+
+def ensure_segment_tables(cur):
+    # Same definitions as database/ddl.sql, for databases created before they existed
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS segment_personas (
+            segment_id INTEGER PRIMARY KEY,
+            doc_key BIGINT NOT NULL UNIQUE,
+            fuentes SMALLINT NOT NULL,
+            cod_departamento VARCHAR(2),
+            cod_municipio VARCHAR(3),
+            sexo CHAR(1),
+            rango_edad SMALLINT NOT NULL
+        );
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS segment_grupos (
+            grupo_id INTEGER NOT NULL,
+            segment_id INTEGER NOT NULL,
+            PRIMARY KEY (grupo_id, segment_id)
+        );
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS segment_build (
+            build_id SERIAL PRIMARY KEY,
+            personas BIGINT,
+            relaciones BIGINT,
+            built_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+    """)
+
+def build_segments():
+    conn = get_db_connection()
+    cur = conn.cursor()
+    start_time = time.time()
+
+    print("🚀 Building segment tables...")
+    ensure_segment_tables(cur)
+
+    # Rebuilt in one transaction: the backend keeps reading the previous build until COMMIT
+    # (DELETE rather than TRUNCATE, which would block those reads)
+    cur.execute("DELETE FROM segment_grupos;")
+    cur.execute("DELETE FROM segment_personas;")
+    cur.execute("""
+        WITH censo AS (
+            SELECT DISTINCT ON (doc_key(documento))
+                doc_key(documento) AS k,
+                LPAD(cod_departamento, 2, '0') || LPAD(cod_municipio, 3, '0') AS geo
+            FROM censo_electoral
+            WHERE doc_key(documento) IS NOT NULL
+            ORDER BY doc_key(documento)
+        ),
+        hjs AS (
+            SELECT DISTINCT ON (doc_key(documento))
+                doc_key(documento) AS k,
+                LPAD(cod_departamento, 2, '0') || LPAD(cod_municipio, 3, '0') AS geo
+            FROM contactos_hjs
+            WHERE doc_key(documento) IS NOT NULL
+            ORDER BY doc_key(documento)
+        ),
+        empleados AS (
+            -- Latest employee record per person
+            SELECT DISTINCT ON (doc_key(documento))
+                doc_key(documento) AS k,
+                LPAD(cod_departamento, 2, '0') || LPAD(cod_municipio, 3, '0') AS geo,
+                UPPER(sexo) AS sexo,
+                EXTRACT(YEAR FROM AGE(fecha_nacimiento)) AS edad
+            FROM empleados_empresas
+            WHERE doc_key(documento) IS NOT NULL
+            ORDER BY doc_key(documento), updated_at DESC NULLS LAST
+        ),
+        atributos AS (
+            SELECT
+                p.doc_key,
+                p.fuentes,
+                -- Only well-formed codes: the backend reads geo as the integer dept * 1000 + muni
+                COALESCE(
+                    CASE WHEN c.geo ~ '^[0-9]{5}$' THEN c.geo END,
+                    CASE WHEN h.geo ~ '^[0-9]{5}$' THEN h.geo END,
+                    CASE WHEN e.geo ~ '^[0-9]{5}$' THEN e.geo END
+                ) AS geo,
+                e.sexo,
+                -- Same buckets as mv_age_distribution; backend/segments.py AGE_BUCKETS
+                CASE
+                    WHEN e.edad < 18 THEN 0
+                    WHEN e.edad BETWEEN 18 AND 30 THEN 1
+                    WHEN e.edad BETWEEN 31 AND 60 THEN 2
+                    WHEN e.edad > 60 THEN 3
+                    ELSE 4
+                END AS rango_edad
+            FROM personas p
+            LEFT JOIN censo c ON c.k = p.doc_key
+            LEFT JOIN hjs h ON h.k = p.doc_key
+            LEFT JOIN empleados e ON e.k = p.doc_key
+        )
+        INSERT INTO segment_personas (
+            segment_id, doc_key, fuentes, cod_departamento, cod_municipio, sexo, rango_edad
+        )
+        SELECT
+            ROW_NUMBER() OVER (ORDER BY geo NULLS LAST, doc_key) - 1,
+            doc_key, fuentes, LEFT(geo, 2), RIGHT(geo, 3), sexo, rango_edad
+        FROM atributos;
+    """)
+    personas = cur.rowcount
+    print(f"   👥 {personas} persons")
+
+    cur.execute("""
+        INSERT INTO segment_grupos (grupo_id, segment_id)
+        SELECT DISTINCT r.grupo_id, s.segment_id
+        FROM rel_contacto_grupo r
+        JOIN segment_personas s ON s.doc_key = doc_key(r.documento)
+        WHERE r.grupo_id IS NOT NULL;
+    """)
+    relaciones = cur.rowcount
+    print(f"   🏷️ {relaciones} group memberships")
+
+    cur.execute("INSERT INTO segment_build (personas, relaciones) VALUES (%s, %s);", (personas, relaciones))
+    conn.commit()
+
+    print(f"🏁 DONE! Segment tables rebuilt in {time.time() - start_time:.2f} seconds.")
+    cur.close()
+    conn.close()
+
+if __name__ == "__main__":
+    build_segments()
@@ -0,0 +1,153 @@
+import time
+
+# Company aggregates maintained at load time:
+#   - agg_empresa_empleados, behind /api/analytics/top-companies: one row per company in
+#     core_empresas (also those without employees), refreshed at the end of load_empresas
+#     and load_empleados, so the ranking is an index scan on (total_empleados DESC)
+#     instead of a join + GROUP BY over every employee. Rows whose counts did not change
+#     are left untouched (no dead tuples, no index churn).
+#   - agg_empresas_mes, behind /api/analytics/company-timeline: companies created per
+#     month, department and tipo_empresa, rebuilt by load_empresas. Quarters, years and
+#     cumulative series are summed from it at query time.
+
+def ensure_company_counters(cur):
+    # Same definition as database/ddl.sql, for databases created before it existed
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS agg_empresa_empleados (
+            empresa_id VARCHAR(20) PRIMARY KEY,
+            razon_social VARCHAR(255),
+            nit VARCHAR(20),
+            tipo_empresa VARCHAR(100),
+            cod_departamento VARCHAR(5),
+            nom_departamento VARCHAR(100),
+            total_empleados INTEGER NOT NULL DEFAULT 0,
+            hombres INTEGER NOT NULL DEFAULT 0,
+            mujeres INTEGER NOT NULL DEFAULT 0,
+            con_email INTEGER NOT NULL DEFAULT 0,
+            con_celular INTEGER NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+    """)
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_agg_empresa_empleados_total
+        ON agg_empresa_empleados (total_empleados DESC, empresa_id);
+    """)
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_agg_empresa_empleados_dept_total
+        ON agg_empresa_empleados (cod_departamento, total_empleados DESC, empresa_id);
+    """)
+
+def ensure_company_timeline(cur):
+    # Same definition as database/ddl.sql, for databases created before it existed
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS agg_empresas_mes (
+            mes DATE NOT NULL,
+            cod_departamento VARCHAR(5),
+            nom_departamento VARCHAR(100),
+            tipo_empresa VARCHAR(100),
+            total_empresas INTEGER NOT NULL
+        );
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_agg_empresas_mes ON agg_empresas_mes (mes, cod_departamento);")
+
+def refresh_company_timeline(cur):
+    """Rebuilds the monthly company-creation rollup. Returns its row count."""
+    start = time.time()
+    print("📅 Rebuilding company creation timeline...")
+    ensure_company_timeline(cur)
+
+    # Small table (months x departments x types): rebuilt whole in the load transaction
+    cur.execute("DELETE FROM agg_empresas_mes;")
+    cur.execute("""
+        WITH divipole AS (
+            SELECT DISTINCT ON (cod_departamento, cod_municipio) cod_departamento, cod_municipio, nom_departamento
+            FROM dim_divipole
+            ORDER BY cod_departamento, cod_municipio
+        )
+        INSERT INTO agg_empresas_mes (mes, cod_departamento, nom_departamento, tipo_empresa, total_empresas)
+        SELECT
+            DATE_TRUNC('month', c.fecha_constitucion)::DATE,
+            d.cod_departamento,
+            d.nom_departamento,
+            c.tipo_empresa,
+            COUNT(*)
+        FROM core_empresas c
+        LEFT JOIN divipole d ON c.municipio_cod = d.cod_departamento || d.cod_municipio
+        WHERE c.fecha_constitucion IS NOT NULL
+        GROUP BY 1, 2, 3, 4;
+    """)
+    rows = cur.rowcount
+    print(f"   ✅ {rows} month/department/type rows ({time.time() - start:.1f}s)")
+    return rows
+
+def refresh_company_counters(cur):
+    """Recomputes the counters from core_empresas / empleados_empresas.
+    Returns (companies updated, companies removed)."""
+    start = time.time()
+    print("🏢 Refreshing company employee counters...")
+    ensure_company_counters(cur)
+
+    cur.execute("""
+        WITH conteos AS (
+            SELECT
+                empresa_id,
+                COUNT(*) AS total,
+                COUNT(*) FILTER (WHERE UPPER(sexo) = 'M') AS hombres,
+                COUNT(*) FILTER (WHERE UPPER(sexo) = 'F') AS mujeres,
+                COUNT(*) FILTER (WHERE NULLIF(btrim(email), '') IS NOT NULL) AS con_email,
+                COUNT(*) FILTER (WHERE NULLIF(btrim(celular), '') IS NOT NULL) AS con_celular
+            FROM empleados_empresas
+            WHERE empresa_id IS NOT NULL
+            GROUP BY empresa_id
+        ),
+        divipole AS (
+            -- One name per municipality, or a company would be inserted twice
+            SELECT DISTINCT ON (cod_departamento, cod_municipio) cod_departamento, cod_municipio, nom_departamento
+            FROM dim_divipole
+            ORDER BY cod_departamento, cod_municipio
+        )
+        INSERT INTO agg_empresa_empleados (
+            empresa_id, razon_social, nit, tipo_empresa, cod_departamento, nom_departamento,
+            total_empleados, hombres, mujeres, con_email, con_celular
+        )
+        SELECT
+            c.empresa_id, c.razon_social, c.nit, c.tipo_empresa, d.cod_departamento, d.nom_departamento,
+            COALESCE(n.total, 0), COALESCE(n.hombres, 0), COALESCE(n.mujeres, 0),
+            COALESCE(n.con_email, 0), COALESCE(n.con_celular, 0)
+        FROM core_empresas c
+        LEFT JOIN conteos n ON n.empresa_id = c.empresa_id
+        LEFT JOIN divipole d ON c.municipio_cod = d.cod_departamento || d.cod_municipio
+        ON CONFLICT (empresa_id) DO UPDATE SET
+            razon_social = EXCLUDED.razon_social,
+            nit = EXCLUDED.nit,
+            tipo_empresa = EXCLUDED.tipo_empresa,
+            cod_departamento = EXCLUDED.cod_departamento,
+            nom_departamento = EXCLUDED.nom_departamento,
+            total_empleados = EXCLUDED.total_empleados,
+            hombres = EXCLUDED.hombres,
+            mujeres = EXCLUDED.mujeres,
+            con_email = EXCLUDED.con_email,
+            con_celular = EXCLUDED.con_celular,
+            updated_at = CURRENT_TIMESTAMP
+        WHERE (
+            agg_empresa_empleados.razon_social, agg_empresa_empleados.nit, agg_empresa_empleados.tipo_empresa,
+            agg_empresa_empleados.cod_departamento, agg_empresa_empleados.nom_departamento,
+            agg_empresa_empleados.total_empleados, agg_empresa_empleados.hombres, agg_empresa_empleados.mujeres,
+            agg_empresa_empleados.con_email, agg_empresa_empleados.con_celular
+        ) IS DISTINCT FROM (
+            EXCLUDED.razon_social, EXCLUDED.nit, EXCLUDED.tipo_empresa,
+            EXCLUDED.cod_departamento, EXCLUDED.nom_departamento,
+            EXCLUDED.total_empleados, EXCLUDED.hombres, EXCLUDED.mujeres,
+            EXCLUDED.con_email, EXCLUDED.con_celular
+        );
+    """)
+    updated = cur.rowcount
+
+    cur.execute("""
+        DELETE FROM agg_empresa_empleados a
+        WHERE NOT EXISTS (SELECT 1 FROM core_empresas c WHERE c.empresa_id = a.empresa_id);
+    """)
+    removed = cur.rowcount
+
+    print(f"   ✅ {updated} companies updated, {removed} removed ({time.time() - start:.1f}s)")
+    return updated, removed
@@ -0,0 +1,42 @@
+import os
+import csv
+import resource
+import pyarrow as pa
+import pyarrow.csv as pacsv
+
+# Streaming reader for the big ';'-separated exports (EMPRESAS, EMPLEADOS_EMPRESAS,
+# REP_LEGAL_EMPRESA). The pyarrow CSV engine parses fixed-size blocks, so peak memory
+# is bounded by the budget instead of the file size. Every column comes back as text
+# (like dtype=str), except the low-cardinality codes, which come back as categoricals.
+MEMORY_BUDGET_MB = int(os.getenv("ETL_MEMORY_BUDGET_MB", "256"))
+
+# A block of raw CSV grows roughly this much once converted to a pandas DataFrame
+DATAFRAME_EXPANSION = 8
+
+LOW_CARDINALITY_COLUMNS = ['department_code', 'municipality_code', 'sex', 'education_level']
+
+def read_header(path, sep=';', quotechar='"'):
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        return next(csv.reader(f, delimiter=sep, quotechar=quotechar))
+
+def iter_csv_chunks(path, categorical=LOW_CARDINALITY_COLUMNS, memory_budget_mb=None, sep=';', quotechar='"'):
+    """Yields the CSV as a sequence of pandas DataFrames of bounded size."""
+    budget = (memory_budget_mb or MEMORY_BUDGET_MB) * 1024 * 1024
+    block_size = max(1024 * 1024, budget // DATAFRAME_EXPANSION)
+
+    column_types = {
+        col: pa.dictionary(pa.int32(), pa.string()) if col in categorical else pa.string()
+        for col in read_header(path, sep, quotechar)
+    }
+    reader = pacsv.open_csv(
+        path,
+        read_options=pacsv.ReadOptions(block_size=block_size),
+        parse_options=pacsv.ParseOptions(delimiter=sep, quote_char=quotechar, newlines_in_values=True),
+        convert_options=pacsv.ConvertOptions(column_types=column_types, strings_can_be_null=True)
+    )
+    for batch in reader:
+        yield batch.to_pandas()
+
+def peak_rss_mb():
+    # ru_maxrss is reported in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
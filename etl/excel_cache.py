@@ -0,0 +1,155 @@
+import os
+import json
+import fcntl
+import hashlib
+from contextlib import contextmanager
+import numpy as np
+import pandas as pd
+
+# Shared columnar cache for the Excel sources.
+# Each workbook is parsed with openpyxl once; every sheet is stored as Parquet
+# (header=None, all values as text) under a directory keyed by the file's
+# sha256. The (size, mtime) of each source is remembered so unchanged files
+# are not even re-hashed. Header-row detection results are cached alongside.
+# index.json and the manifests are shared by loaders running in parallel: every
+# read-modify-write holds an exclusive flock on a sibling .lock file.
+CACHE_DIR = os.getenv("EXCEL_CACHE_DIR", "/app/data/cache/excel")
+INDEX_FILE = os.path.join(CACHE_DIR, 'index.json')
+
+def read_json(path, default):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default
+
+def write_json(path, data):
+    # Write then rename: readers never see a half-written file
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, path)
+
+@contextmanager
+def locked(path):
+    """Exclusive lock on `path` across processes, held on `path`.lock."""
+    with open(f"{path}.lock", 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+def update_json(path, default, update):
+    """Applies `update` (changes the data in place) to the latest contents of a JSON file
+    under its lock, so concurrent updates are never lost. Returns the data written."""
+    with locked(path):
+        data = read_json(path, default)
+        update(data)
+        write_json(path, data)
+    return data
+
+def file_sha256(path, block_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def workbook_dir(path):
+    """Cache directory for the current content of `path`, hashing only when size/mtime changed."""
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    entry = read_json(INDEX_FILE, {}).get(path)
+    if not entry or entry['size'] != stat.st_size or entry['mtime_ns'] != stat.st_mtime_ns:
+        entry = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': file_sha256(path)}
+        update_json(INDEX_FILE, {}, lambda index: index.update({path: entry}))
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(CACHE_DIR, f"{stem}-{entry['sha256'][:16]}")
+
+def load_workbook(path):
+    """Returns (cache dir, manifest), converting the whole workbook on first use."""
+    wb_dir = workbook_dir(path)
+    manifest_path = os.path.join(wb_dir, 'manifest.json')
+    manifest = read_json(manifest_path, None)
+    if manifest is not None:
+        return wb_dir, manifest
+
+    os.makedirs(wb_dir, exist_ok=True)
+    with locked(manifest_path):
+        # Another loader may have converted it while we waited for the lock
+        manifest = read_json(manifest_path, None)
+        if manifest is not None:
+            return wb_dir, manifest
+
+        print(f"🗂️ Converting {os.path.basename(path)} to columnar cache...")
+        sheets = pd.read_excel(path, sheet_name=None, header=None, dtype=str)
+        manifest = {'sheets': list(sheets), 'files': {}, 'headers': {}}
+        for i, (name, df) in enumerate(sheets.items()):
+            file_name = f"sheet_{i:03d}.parquet"
+            df.columns = [str(c) for c in df.columns]
+            tmp_path = os.path.join(wb_dir, f"{file_name}.{os.getpid()}.tmp")
+            df.to_parquet(tmp_path, index=False)
+            os.replace(tmp_path, os.path.join(wb_dir, file_name))
+            manifest['files'][name] = file_name
+        write_json(manifest_path, manifest)
+    return wb_dir, manifest
+
+def sheet_name(manifest, sheet):
+    return manifest['sheets'][sheet] if isinstance(sheet, int) else sheet
+
+def sheet_names(path):
+    return load_workbook(path)[1]['sheets']
+
+def read_raw_sheet(path, sheet=0):
+    """Sheet contents without header handling, like pd.read_excel(header=None, dtype=str)."""
+    wb_dir, manifest = load_workbook(path)
+    df = pd.read_parquet(os.path.join(wb_dir, manifest['files'][sheet_name(manifest, sheet)]))
+    df.columns = [int(c) for c in df.columns]
+    # Parquet round-trips missing cells as None; loaders expect NaN like read_excel gives
+    return df.astype(object).where(df.notna(), np.nan)
+
+def read_sheet(path, sheet=0, header=0):
+    """Equivalent of pd.read_excel(path, sheet, header=header, dtype=str), served from the cache."""
+    raw = read_raw_sheet(path, sheet)
+    if header is None:
+        return raw
+
+    columns = []
+    seen = {}
+    for i, value in enumerate(raw.iloc[header] if header < len(raw) else []):
+        name = f"Unnamed: {i}" if pd.isna(value) else value
+        # Mangle duplicates the way pandas does: X, X.1, X.2...
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}.{seen[name]}"
+        else:
+            seen[name] = 0
+        columns.append(name)
+
+    df = raw.iloc[header + 1:].reset_index(drop=True)
+    df.columns = columns or df.columns
+    return df
+
+def find_header_row(path, sheet, first_terms, second_terms, max_rows=10):
+    """Index of the first row (within max_rows) containing any of first_terms and any of
+    second_terms, or None. Results are cached in the workbook manifest."""
+    wb_dir, manifest = load_workbook(path)
+    name = sheet_name(manifest, sheet)
+    key = f"{name}|{'/'.join(first_terms)}|{'/'.join(second_terms)}|{max_rows}"
+    if key in manifest['headers']:
+        return manifest['headers'][key]
+
+    header_row = None
+    raw = read_raw_sheet(path, name).head(max_rows)
+    for idx, row in raw.iterrows():
+        row_str = " ".join([str(x).upper() for x in row.values])
+        if any(t in row_str for t in first_terms) and any(t in row_str for t in second_terms):
+            header_row = int(idx)
+            break
+
+    manifest['headers'][key] = header_row
+    update_json(os.path.join(wb_dir, 'manifest.json'), manifest,
+                lambda latest: latest['headers'].update({key: header_row}))
+    return header_row
@@ -1,12 +1,25 @@
 import pdfplumber
 import os
+import sys
 import psycopg2
-from psycopg2 import sql
 import time
+import hashlib
+import numpy as np
+import pandas as pd
+from io import StringIO
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 # Configuration
 pdf_path = "/app/data/DIVIPOLE 2026 GEORREFERENCIACIÓN 15122025.pdf"
 
+# Parsed page tables are cached on disk, keyed by PDF hash + page number,
+# so a re-run (e.g. after a DB reset) skips pdfplumber entirely.
+CACHE_DIR = os.getenv("DIVIPOLE_CACHE_DIR", "/app/data/cache/divipole")
+MAX_WORKERS = int(os.getenv("ETL_WORKERS", os.cpu_count() or 1))
+PAGES_PER_TASK = 25 # Each worker opens the PDF once per batch of pages
+PAGES_PER_BATCH = 50 # Pages bulk upserted (and committed) together
+REJECT_FILE = os.getenv("DIVIPOLE_REJECT_FILE", "/app/data/rejects/divipole_rejects.csv")
+
 # Database Connection Parameters
 DB_HOST = os.getenv("DB_HOST", "db")
 DB_NAME = os.getenv("DB_NAME", "postgres")
@@ -30,127 +43,241 @@ def get_db_connection():
             retries -= 1
     raise Exception("Could not connect to database")
 
+def file_sha256(path, block_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def page_cache_path(pdf_hash, page_number):
+    return os.path.join(CACHE_DIR, pdf_hash, f"page_{page_number:05d}.parquet")
+
+def extract_pages(pdf_path, pdf_hash, page_numbers):
+    # Runs in a worker process: pdfplumber objects can't be pickled, so each
+    # task opens the PDF itself and writes every parsed page to the cache.
+    done = []
+    with pdfplumber.open(pdf_path) as pdf:
+        for n in page_numbers:
+            table = pdf.pages[n].extract_table() or []
+            # Clean up row data
+            rows = [[str(cell).replace('\n', ' ').strip() if cell is not None else '' for cell in row] for row in table]
+            width = max((len(r) for r in rows), default=0)
+            df = pd.DataFrame(
+                [r + [''] * (width - len(r)) for r in rows],
+                columns=[f"c{j}" for j in range(width)],
+                dtype=str
+            )
+            # Write then rename, so a killed worker never leaves a truncated cache entry
+            cache_path = page_cache_path(pdf_hash, n)
+            df.to_parquet(cache_path + '.tmp', index=False)
+            os.replace(cache_path + '.tmp', cache_path)
+            done.append(n)
+    return done
+
+def build_page_cache(pdf_path, pdf_hash, total_pages):
+    os.makedirs(os.path.join(CACHE_DIR, pdf_hash), exist_ok=True)
+    missing = [n for n in range(total_pages) if not os.path.exists(page_cache_path(pdf_hash, n))]
+    if not missing:
+        print(f"Page cache complete for {pdf_hash[:12]}, skipping PDF parsing.")
+        return
+
+    print(f"Extracting {len(missing)}/{total_pages} pages with {MAX_WORKERS} workers...")
+    batches = [missing[i:i + PAGES_PER_TASK] for i in range(0, len(missing), PAGES_PER_TASK)]
+    extracted = 0
+    with ProcessPoolExecutor(max_workers=MAX_WORKERS) as pool:
+        futures = [pool.submit(extract_pages, pdf_path, pdf_hash, batch) for batch in batches]
+        for future in as_completed(futures):
+            extracted += len(future.result())
+            print(f"Extracted {extracted}/{len(missing)} pages.")
+
+def read_cached_page(pdf_hash, page_number):
+    return pd.read_parquet(page_cache_path(pdf_hash, page_number))
+
+# Expected columns in PDF:
+# 0: DD, 1: MM, 2: ZZ, 3: PP
+# 4: DEPARTAMENTO, 5: MUNICIPIO, 6: PUESTO, 7: DIRECCIÓN, 8: COMUNA
+# 9: MUJERES, 10: HOMBRES, 11: TOTAL, 12: MESAS
+# 13: LATITUD, 14: LONGITUD
+PDF_COLUMNS = {
+    'c0': 'cod_departamento', 'c1': 'cod_municipio', 'c2': 'cod_zona', 'c3': 'cod_puesto',
+    'c4': 'nom_departamento', 'c5': 'nom_municipio', 'c6': 'nombre_puesto', 'c7': 'direccion_puesto',
+    'c8': 'tipo_zona', 'c12': 'mesa', 'c13': 'latitud', 'c14': 'longitud',
+}
+DB_COLUMNS = list(PDF_COLUMNS.values())
+GEO_KEY = ['cod_departamento', 'cod_municipio', 'cod_zona', 'cod_puesto']
+
+# VARCHAR limits from dim_divipole, checked before COPY so one bad row can't sink a batch
+MAX_LENGTHS = {
+    'cod_departamento': 5, 'cod_municipio': 5, 'cod_zona': 5, 'cod_puesto': 20,
+    'nom_departamento': 100, 'nom_municipio': 100, 'nombre_puesto': 255,
+    'direccion_puesto': 255, 'tipo_zona': 50,
+}
+
+def normalize_coordinates(values, limit):
+    # Heuristic for Colombia (Lat: -5 to 13, Lon: -85 to -65): values come with the
+    # decimal point missing (e.g. 10277349 -> 10.277349), so divide by 10 until in range.
+    clean = values.str.replace(',', '.', regex=False).str.replace(' ', '', regex=False)
+    coords = pd.to_numeric(clean, errors='coerce').to_numpy(dtype=float)
+    coords[~np.isfinite(coords)] = np.nan
+    out_of_range = np.abs(coords) > limit
+    while out_of_range.any():
+        coords[out_of_range] /= 10.0
+        out_of_range = np.abs(coords) > limit
+    return coords
+
+def prepare_batch(pages):
+    """Turns a list of cached page tables into (valid rows, rejected rows) DataFrames."""
+    # Row Check: at least 15 columns and first column must be digits (DD code)
+    frames = [df for df in pages if df.shape[1] >= 15]
+    if not frames:
+        return pd.DataFrame(columns=DB_COLUMNS), pd.DataFrame(columns=DB_COLUMNS + ['motivo'])
+    raw = pd.concat(frames, ignore_index=True)
+    raw = raw[raw['c0'].str.isdigit()]
+
+    df = raw[list(PDF_COLUMNS)].rename(columns=PDF_COLUMNS)
+    motivo = pd.Series('', index=df.index)
+
+    for col, max_len in MAX_LENGTHS.items():
+        too_long = df[col].str.len() > max_len
+        motivo[too_long] += f"{col} > {max_len} chars; "
+
+    mesa = pd.to_numeric(df['mesa'], errors='coerce')
+    bad_mesa = (df['mesa'] != '') & (mesa.isna() | (mesa % 1 != 0))
+    motivo[bad_mesa] += "mesa no numérica; "
+
+    # Rejected rows keep their raw PDF text
+    rejected = df[motivo != ''].assign(motivo=motivo[motivo != ''].str.rstrip('; '))
+
+    # Later pages win on duplicated keys, as with the old row-by-row upsert
+    valid = df[motivo == ''].drop_duplicates(subset=GEO_KEY, keep='last').copy()
+    valid['mesa'] = mesa[valid.index].astype('Int64')
+    valid['latitud'] = normalize_coordinates(valid['latitud'], 90)
+    valid['longitud'] = normalize_coordinates(valid['longitud'], 180)
+    return valid, rejected
+
+def write_rejects(rejected):
+    if rejected.empty:
+        return
+    os.makedirs(os.path.dirname(REJECT_FILE), exist_ok=True)
+    write_header = not os.path.exists(REJECT_FILE)
+    rejected.to_csv(REJECT_FILE, mode='a', header=write_header, index=False)
+
+def upsert_batch(cur, df):
+    buffer = StringIO()
+    df.to_csv(buffer, index=False, header=False)
+    buffer.seek(0)
+    cur.copy_expert(
+        f"COPY staging_divipole ({', '.join(DB_COLUMNS)}) FROM STDIN WITH (FORMAT csv)",
+        buffer
+    )
+    cur.execute("""
+        INSERT INTO dim_divipole (
+            cod_departamento, cod_municipio, cod_zona, cod_puesto,
+            nom_departamento, nom_municipio, nombre_puesto, direccion_puesto,
+            tipo_zona, mesa, latitud, longitud
+        )
+        SELECT
+            cod_departamento, cod_municipio, cod_zona, cod_puesto,
+            nom_departamento, nom_municipio, nombre_puesto, direccion_puesto,
+            tipo_zona, mesa, latitud, longitud
+        FROM staging_divipole
+        ON CONFLICT (cod_departamento, cod_municipio, cod_zona, cod_puesto) 
+        DO UPDATE SET
+            nom_departamento = EXCLUDED.nom_departamento,
+            nom_municipio = EXCLUDED.nom_municipio,
+            nombre_puesto = EXCLUDED.nombre_puesto,
+            direccion_puesto = EXCLUDED.direccion_puesto,
+            tipo_zona = EXCLUDED.tipo_zona,
+            mesa = EXCLUDED.mesa,
+            latitud = EXCLUDED.latitud,
+            longitud = EXCLUDED.longitud;
+    """)
+    return cur.rowcount
+
+def upsert_rows(cur, df):
+    """Retries a failed batch one row at a time, each under a savepoint, so only the rows
+    the database refuses are rejected. Returns (rows upserted, rejected rows)."""
+    upserted, failed = 0, []
+    for i in range(len(df)):
+        row = df.iloc[i:i + 1]
+        cur.execute("SAVEPOINT divipole_row")
+        try:
+            upserted += upsert_batch(cur, row)
+            cur.execute("RELEASE SAVEPOINT divipole_row")
+        except Exception as e:
+            cur.execute("ROLLBACK TO SAVEPOINT divipole_row")
+            failed.append(row.assign(motivo=f"db error: {str(e).strip().splitlines()[0]}"))
+        cur.execute("DELETE FROM staging_divipole")  # Each row is upserted on its own
+    return upserted, pd.concat(failed) if failed else df.iloc[:0].assign(motivo=None)
+
 def extract_and_load(pdf_path):
-    conn = get_db_connection()
-    cur = conn.cursor()
-    
     print(f"Starting extraction from {pdf_path}...")
-    
-    rows_inserted = 0
-    
+
+    pdf_hash = file_sha256(pdf_path)
     with pdfplumber.open(pdf_path) as pdf:
         total_pages = len(pdf.pages)
-        
-        for i, page in enumerate(pdf.pages):
-            table = page.extract_table()
-            
-            if table:
-                for row in table:
-                    # Clean up row data
-                    clean_row = [str(cell).replace('\n', ' ').strip() if cell is not None else '' for cell in row]
-                    
-                    # Row Check: First column must be digits (DD code)
-                    # Expected columns in PDF:
-                    # 0: DD, 1: MM, 2: ZZ, 3: PP
-                    # 4: DEPARTAMENTO, 5: MUNICIPIO, 6: PUESTO, 7: DIRECCIÓN, 8: COMUNA
-                    # 9: MUJERES, 10: HOMBRES, 11: TOTAL, 12: MESAS
-                    # 13: LATITUD, 14: LONGITUD
-                    
-                    if len(clean_row) >= 15 and clean_row[0].isdigit():
-                        try:
-                            # Map to DB columns
-                            cod_departamento = clean_row[0]
-                            cod_municipio = clean_row[1]
-                            cod_zona = clean_row[2]
-                            cod_puesto = clean_row[3]
-                            nom_departamento = clean_row[4]
-                            nom_municipio = clean_row[5]
-                            nombre_puesto = clean_row[6]
-                            direccion_puesto = clean_row[7]
-                            tipo_zona = clean_row[8]
-                            # clean_row[9], [10], [11] are census counts - ignored
-                            mesa = clean_row[12]
-                            
-                            # Handle coordinates (remove thousand separators if any, handle dots)
-                            lat_str = clean_row[13].replace(',', '.')
-                            lon_str = clean_row[14].replace(',', '.')
-                            
-                            # Handle coordinates (remove thousand separators if any, handle dots)
-                            lat_str = clean_row[13].replace(',', '.')
-                            lon_str = clean_row[14].replace(',', '.')
-                            
-                            def normalize_coordinate(val_str, is_lat):
-                                if not val_str:
-                                    return None
-                                try:
-                                    # Remove distinct invalid chars but keep negative sign and dot
-                                    clean_val = val_str.replace(' ', '')
-                                    # If multiple dots, keep first? Or assumption is it might be missing dot.
-                                    
-                                    val = float(clean_val)
-                                    
-                                    # Heuristic for Colombia: 
-                                    # Lat: -5 to 13
-                                    # Lon: -85 to -65
-                                    
-                                    if is_lat:
-                                        # Fix integer-like large numbers (e.g. 10277349 -> 10.277349)
-                                        while abs(val) > 90:
-                                            val /= 10.0
-                                        # If still weird (e.g. 0.0001), maybe multiply? No, usually it's missing dot.
-                                    else:
-                                        # Lon
-                                        while abs(val) > 180:
-                                            val /= 10.0
-                                            
-                                    return val
-                                except ValueError:
-                                    return None
-
-                            latitud = normalize_coordinate(lat_str, True)
-                            longitud = normalize_coordinate(lon_str, False)
-
-                            insert_query = sql.SQL("""
-                                INSERT INTO dim_divipole (
-                                    cod_departamento, cod_municipio, cod_zona, cod_puesto,
-                                    nom_departamento, nom_municipio, nombre_puesto, direccion_puesto,
-                                    tipo_zona, mesa, latitud, longitud
-                                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                                ON CONFLICT (cod_departamento, cod_municipio, cod_zona, cod_puesto) 
-                                DO UPDATE SET
-                                    nom_departamento = EXCLUDED.nom_departamento,
-                                    nom_municipio = EXCLUDED.nom_municipio,
-                                    nombre_puesto = EXCLUDED.nombre_puesto,
-                                    direccion_puesto = EXCLUDED.direccion_puesto,
-                                    tipo_zona = EXCLUDED.tipo_zona,
-                                    mesa = EXCLUDED.mesa,
-                                    latitud = EXCLUDED.latitud,
-                                    longitud = EXCLUDED.longitud;
-                            """)
-                            
-                            cur.execute(insert_query, (
-                                cod_departamento, cod_municipio, cod_zona, cod_puesto,
-                                nom_departamento, nom_municipio, nombre_puesto, direccion_puesto,
-                                tipo_zona, mesa, latitud, longitud
-                            ))
-                            rows_inserted += 1
-                            
-                        except Exception as e:
-                            print(f"Error inserting row {clean_row}: {e}")
-                            conn.rollback()
-                            continue
-
-            if (i + 1) % 50 == 0:
-                conn.commit()
-                print(f"Processed {i + 1}/{total_pages} pages. Rows inserted: {rows_inserted}")
-    
+
+    build_page_cache(pdf_path, pdf_hash, total_pages)
+
+    conn = get_db_connection()
+    cur = conn.cursor()
+
+    # Rows are emptied at each commit, so every page batch starts with a clean staging table
+    cur.execute("""
+        CREATE TEMP TABLE staging_divipole (
+            cod_departamento VARCHAR(5),
+            cod_municipio VARCHAR(5),
+            cod_zona VARCHAR(5),
+            cod_puesto VARCHAR(20),
+            nom_departamento VARCHAR(100),
+            nom_municipio VARCHAR(100),
+            nombre_puesto VARCHAR(255),
+            direccion_puesto VARCHAR(255),
+            tipo_zona VARCHAR(50),
+            mesa INTEGER,
+            latitud DECIMAL(10, 8),
+            longitud DECIMAL(11, 8)
+        ) ON COMMIT DELETE ROWS;
+    """)
     conn.commit()
+
+    if os.path.exists(REJECT_FILE):
+        os.remove(REJECT_FILE)
+
+    rows_inserted = 0
+    rows_rejected = 0
+
+    for start in range(0, total_pages, PAGES_PER_BATCH):
+        page_numbers = range(start, min(start + PAGES_PER_BATCH, total_pages))
+        valid, rejected = prepare_batch([read_cached_page(pdf_hash, n) for n in page_numbers])
+
+        if not valid.empty:
+            try:
+                rows_inserted += upsert_batch(cur, valid)
+                conn.commit()
+            except Exception as e:
+                # Retry the batch row by row; only the rows that still fail go to the reject file
+                conn.rollback()
+                print(f"Error upserting pages {page_numbers.start + 1}-{page_numbers.stop}, retrying row by row: {e}")
+                inserted, failed = upsert_rows(cur, valid)
+                conn.commit()
+                rows_inserted += inserted
+                rejected = pd.concat([rejected, failed])
+
+        write_rejects(rejected)
+        rows_rejected += len(rejected)
+        print(f"Processed {page_numbers.stop}/{total_pages} pages. Rows inserted: {rows_inserted}. Rejected: {rows_rejected}")
+
     cur.close()
     conn.close()
     print(f"Extraction complete. {rows_inserted} rows inserted into DB.")
+    if rows_rejected:
+        print(f"{rows_rejected} rows rejected, see {REJECT_FILE}")
 
 if __name__ == "__main__":
     if not os.path.exists(pdf_path):
         print(f"Error: PDF not found at {pdf_path}")
+        sys.exit(1)
     else:
         extract_and_load(pdf_path)
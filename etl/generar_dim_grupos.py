@@ -1,14 +1,16 @@
 import pandas as pd
-import re
-import unicodedata
 import os
+import sys
 import psycopg2
-from psycopg2 import sql
+import psycopg2.extras
 import time
+from excel_cache import read_sheet
 
 # --- CONFIGURACIÓN ---
 INPUT_FOLDER = '/app/data/data'  # Inside Docker, mapped to e:/Data_Horacio/Dashboard/data
-OUTPUT_FOLDER = '/app/data/data' # Save CSV output here too
+OUTPUT_FOLDER = '/app/data/data' # Parquet handoff for load_relaciones.py
+RELACIONES_FILE = os.path.join(OUTPUT_FOLDER, 'relaciones_persona_grupo.parquet')
+MAX_LEN_GRUPO = 100 # dim_grupos.nombre VARCHAR(100)
 
 # Database Connection Parameters
 DB_HOST = os.getenv("DB_HOST", "db")
@@ -33,23 +35,24 @@ def get_db_connection():
             retries -= 1
     raise Exception("Could not connect to database")
 
-# --- FUNCIÓN DE LIMPIEZA ---
-def limpiar_nombre_grupo(texto):
-    if pd.isna(texto): return None
-    t = str(texto).upper().strip()
+# --- FUNCIONES DE LIMPIEZA (vectorizadas sobre Series) ---
+def limpiar_nombres_grupo(serie):
+    # Se limpia cada valor distinto una sola vez y se mapea de vuelta (hay pocos grupos y muchas filas)
+    unicos = pd.Series(serie.dropna().unique(), dtype=str)
+    t = unicos.str.upper().str.strip()
     # 1. Quitar tildes (Á -> A)
-    t = ''.join(c for c in unicodedata.normalize('NFD', t) if unicodedata.category(c) != 'Mn')
+    t = t.str.normalize('NFD').str.replace(r'[\u0300-\u036f]', '', regex=True)
     # 2. Dejar solo letras, números y guiones (eliminar puntos, comas extra, etc.)
-    t = re.sub(r'[^A-Z0-9\s\-]', ' ', t) 
+    t = t.str.replace(r'[^A-Z0-9\s\-]', ' ', regex=True)
     # 3. Colapsar espacios múltiples
-    t = re.sub(r'\s+', ' ', t).strip()
+    t = t.str.replace(r'\s+', ' ', regex=True).str.strip()
     # Filtro: Si queda algo muy corto (ej: "-"), lo ignoramos
-    return t if len(t) > 1 else None
+    t = t.where(t.str.len() > 1)
+    return serie.map(dict(zip(unicos, t)))
 
-def limpiar_doc(doc):
-    if pd.isna(doc): return None
+def limpiar_docs(serie):
     # Dejar solo números
-    return re.sub(r'[^0-9]', '', str(doc).split('.')[0])
+    return serie.astype(str).str.split('.').str[0].str.replace(r'[^0-9]', '', regex=True).where(serie.notna())
 
 # --- FUENTES (Archivos + Columnas Clave) ---
 fuentes = [
@@ -69,8 +72,9 @@ def procesar_grupos():
     conn = get_db_connection()
     cur = conn.cursor()
     
-    df_final = pd.DataFrame()
+    relaciones = []
     grupos_unicos_global = set()
+    errores = 0
 
     print("🔄 Iniciando procesamiento de grupos...")
 
@@ -82,8 +86,8 @@ def procesar_grupos():
             
         try:
             print(f"📄 Leyendo {f['archivo']}...")
-            # Leer todo como texto para evitar errores de tipo
-            df = pd.read_excel(path, dtype=str)
+            # Leer todo como texto (caché columnar compartida con load_hjs)
+            df = read_sheet(path)
             # Normalizar encabezados a mayúsculas y sin espacios
             df.columns = [c.strip().upper() for c in df.columns]
             
@@ -95,7 +99,7 @@ def procesar_grupos():
                 temp = df[[col_doc, col_grupo]].dropna()
                 
                 # 2. Limpiar Documento (Cédula)
-                temp['documento'] = temp[col_doc].apply(limpiar_doc)
+                temp['documento'] = limpiar_docs(temp[col_doc])
                 temp = temp[temp['documento'] != '']
                 
                 # 3. Preparar Grupos para Explosión
@@ -109,14 +113,14 @@ def procesar_grupos():
                 exploded = temp.explode('lista')
                 
                 # 6. Limpiar nombre del grupo
-                exploded['nombre_grupo'] = exploded['lista'].apply(limpiar_nombre_grupo)
+                exploded['nombre_grupo'] = limpiar_nombres_grupo(exploded['lista'])
                 
                 # 7. Filtrar inválidos
                 validos = exploded[['documento', 'nombre_grupo']].dropna()
                 validos = validos[validos['nombre_grupo'] != '']
                 
-                # 8. Acumular para CSV de relaciones
-                df_final = pd.concat([df_final, validos])
+                # 8. Acumular para el archivo de relaciones (un solo concat al final)
+                relaciones.append(validos)
                 
                 # 9. Acumular para DB (Solo nombres únicos)
                 grupos_unicos_local = set(validos['nombre_grupo'].unique())
@@ -128,52 +132,52 @@ def procesar_grupos():
                 
         except Exception as e:
             print(f"   ❌ Error en {f['archivo']}: {e}")
+            errores += 1
 
     # --- CARGA A BASE DE DATOS (dim_grupos) ---
     if grupos_unicos_global:
-        print(f"\n📥 Insertando {len(grupos_unicos_global)} grupos únicos en la base de datos...")
-        nuevos_insertados = 0
-        errores_db = 0
-        
-        for grupo in grupos_unicos_global:
-            try:
-                # Insertar si no existe
-                insert_query = sql.SQL("""
-                    INSERT INTO dim_grupos (nombre, descripcion)
-                    VALUES (%s, 'Carga Masiva Excel')
-                    ON CONFLICT (nombre) DO NOTHING;
-                """)
-                cur.execute(insert_query, (grupo,))
-                # cur.rowcount = 1 si insertó, 0 si existía
-                if cur.rowcount > 0:
-                    nuevos_insertados += 1
-            except Exception as e:
-                errores_db += 1
-                conn.rollback()
-                print(f"Error insertando grupo '{grupo}': {e}")
-                continue # Seguir con el siguiente
-            
-            conn.commit() # Commit parcial o por lotes sería mejor, pero esto es seguro fila a fila
-            
-        print(f"   🏁 DB Actualizada: {nuevos_insertados} nuevos grupos insertados.")
+        largos = {g for g in grupos_unicos_global if len(g) > MAX_LEN_GRUPO}
+        for grupo in largos:
+            print(f"⚠️ Grupo ignorado (más de {MAX_LEN_GRUPO} caracteres): '{grupo[:40]}...'")
+        grupos = sorted(grupos_unicos_global - largos)
+
+        print(f"\n📥 Insertando {len(grupos)} grupos únicos en la base de datos...")
+        try:
+            # Una sola sentencia; RETURNING solo devuelve los grupos nuevos
+            nuevos = psycopg2.extras.execute_values(cur, """
+                INSERT INTO dim_grupos (nombre, descripcion)
+                VALUES %s
+                ON CONFLICT (nombre) DO NOTHING
+                RETURNING grupo_id;
+            """, [(g,) for g in grupos], template="(%s, 'Carga Masiva Excel')", page_size=1000, fetch=True)
+            conn.commit()
+            print(f"   🏁 DB Actualizada: {len(nuevos)} nuevos grupos insertados.")
+        except Exception as e:
+            conn.rollback()
+            print(f"   ❌ Error insertando grupos: {e}")
+            errores += 1
     else:
         print("\n⚠️ No se encontraron grupos para insertar en DB.")
 
-    # --- GENERAR CSV RELACIONES ---
-    if not df_final.empty:
+    # --- GENERAR ARCHIVO DE RELACIONES (Parquet para load_relaciones.py) ---
+    if relaciones:
         # Deduplicar globalmente: (Doc, Grupo) único
         # Esto soluciona el "Bingo, Bingo" -> "Bingo"
-        df_final = df_final.drop_duplicates()
+        df_final = pd.concat(relaciones, ignore_index=True).drop_duplicates()
         
-        archivo_salida = os.path.join(OUTPUT_FOLDER, 'relaciones_persona_grupo.csv')
-        df_final.to_csv(archivo_salida, index=False)
-        print(f"\n💾 Archivo de relaciones generado: {archivo_salida}")
+        tmp_path = RELACIONES_FILE + '.tmp'
+        df_final.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, RELACIONES_FILE)
+        print(f"\n💾 Archivo de relaciones generado: {RELACIONES_FILE}")
         print(f"   -> Total Relaciones Únicas: {len(df_final)}")
     else:
-        print("\n⚠️ No se generaron relaciones para el CSV.")
+        print("\n⚠️ No se generaron relaciones.")
 
     cur.close()
     conn.close()
+    return errores
 
 if __name__ == "__main__":
-    procesar_grupos()
\ No newline at end of file
+    # Código de salida distinto de 0 para que run_pipeline.py marque la etapa como FAILED
+    if procesar_grupos():
+        sys.exit(1)
\ No newline at end of file
@@ -0,0 +1,235 @@
+import os
+import re
+import unicodedata
+from collections import Counter, defaultdict
+
+import pandas as pd
+import psycopg2.extras
+
+# Resolves free-text municipality names ('B/MANGA', 'Giron santander', 'Floridablanca.')
+# to (cod_departamento, cod_municipio) from dim_divipole.
+# Every distinct normalized string is resolved once and stored in resolucion_municipios;
+# later loads only look it up. Rows with metodo = 'manual' are overrides set by hand and
+# are never replaced. Unmatched strings are cached too ('sin_resolver') so they are not
+# retried on every load; fix them with a manual row. So are names shared by municipalities
+# of several departments ('LA UNION', 'SAN PEDRO') given without a department: they are
+# stored as 'ambiguo' with no codes instead of guessing one of them. Both kinds carry the
+# dim_divipole fingerprint they were matched against and are retried when it changes;
+# nothing is cached while dim_divipole is empty.
+MIN_SIMILARITY = float(os.getenv("GEO_MIN_SIMILARITY", "0.55"))
+
+# Common abbreviations in the contact sheets, applied after normalization
+ALIASES = {
+    'B MANGA': 'BUCARAMANGA',
+    'BMANGA': 'BUCARAMANGA',
+    'BGA': 'BUCARAMANGA',
+    'BOGOTA': 'BOGOTA D C',
+    'BTA': 'BOGOTA D C',
+}
+
+# Words that carry no information about which municipality is meant
+NOISE_WORDS = {'MUNICIPIO', 'MPIO', 'CIUDAD', 'DE', 'DEL', 'DEPARTAMENTO', 'DPTO', 'COLOMBIA'}
+
+def normalize_name(text):
+    """Upper case, no accents, only letters/digits separated by single spaces."""
+    if text is None or pd.isna(text):
+        return None
+    text = ''.join(
+        c for c in unicodedata.normalize('NFD', str(text).upper())
+        if unicodedata.category(c) != 'Mn'
+    )
+    text = re.sub(r'[^A-Z0-9]+', ' ', text).strip()
+    return ALIASES.get(text, text) or None
+
+def trigrams(text):
+    # Same scheme as pg_trgm: each word padded with two leading and one trailing space
+    grams = set()
+    for word in text.split():
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+class MunicipalityIndex:
+    """In-memory trigram index over the municipality names in dim_divipole.
+    Candidates come from the inverted index (trigram -> municipalities), so a lookup
+    only scores municipalities sharing at least one trigram with the input."""
+
+    def __init__(self, rows):
+        # rows: (cod_departamento, cod_municipio, nom_departamento, nom_municipio)
+        self.entries = []
+        self.by_name = defaultdict(list)
+        self.by_compact = defaultdict(list)  # Same names without spaces: 'PIE DE CUESTA' -> 'PIEDECUESTA'
+        self.postings = defaultdict(list)
+        self.departments = {}
+        seen = set()
+
+        for c_dept, c_muni, dept_name, muni_name in sorted(rows, key=lambda r: (r[0] or '', r[1] or '')):
+            name = normalize_name(muni_name)
+            if not name or (c_dept, c_muni, name) in seen:
+                continue
+            seen.add((c_dept, c_muni, name))
+            idx = len(self.entries)
+            grams = trigrams(name)
+            self.entries.append((c_dept, c_muni, name, len(grams)))
+            self.by_name[name].append(idx)
+            self.by_compact[name.replace(' ', '')].append(idx)
+            for gram in grams:
+                self.postings[gram].append(idx)
+            dept = normalize_name(dept_name)
+            if dept:
+                self.departments.setdefault(dept, c_dept)
+
+        # Longest first so 'NORTE DE SANTANDER' wins over 'SANTANDER'
+        self.department_names = sorted(self.departments, key=len, reverse=True)
+
+    def split_department_hint(self, name):
+        """'GIRON SANTANDER' -> ('GIRON', '68'). Returns (name, None) without a hint."""
+        for dept in self.department_names:
+            for rest in (name[len(dept):] if name.startswith(dept + ' ') else None,
+                         name[:-len(dept)] if name.endswith(' ' + dept) else None):
+                if rest and rest.strip():
+                    return rest.strip(), self.departments[dept]
+        return name, None
+
+    def pick(self, indices, hint):
+        """Entry for a name: the one in the hinted department, the only one, or None when
+        the name exists in several departments and the hint does not settle it."""
+        if hint:
+            hinted = [i for i in indices if self.entries[i][0] == hint]
+            if hinted:
+                return hinted[0]
+        if len({self.entries[i][0] for i in indices}) > 1:
+            return None
+        return indices[0]
+
+    def resolve(self, name):
+        """Returns (cod_departamento, cod_municipio, metodo, similarity, matched name)."""
+        if name in self.by_name:
+            return self.match(self.by_name[name], None, 'exacto', 1.0)
+
+        query, hint = self.split_department_hint(name)
+        for candidate in (query, ' '.join(w for w in query.split() if w not in NOISE_WORDS)):
+            for lookup, key in ((self.by_name, candidate), (self.by_compact, candidate.replace(' ', ''))):
+                if key in lookup:
+                    return self.match(lookup[key], hint, 'exacto', 1.0)
+        query = ' '.join(w for w in query.split() if w not in NOISE_WORDS) or query
+
+        grams = trigrams(query)
+        if not grams:
+            return None, None, 'sin_resolver', 0.0, None
+        shared = Counter()
+        for gram in grams:
+            shared.update(self.postings.get(gram, ()))
+
+        best, best_key = None, None
+        for idx, common in shared.items():
+            c_dept, _, _, n_grams = self.entries[idx]
+            similarity = common / (len(grams) + n_grams - common)
+            # A department hint outranks a marginally better match elsewhere
+            key = (similarity + (0.1 if hint and c_dept == hint else 0.0), -idx)
+            if best_key is None or key > best_key:
+                best, best_key = (idx, similarity), key
+
+        if best is None or best[1] < MIN_SIMILARITY:
+            return None, None, 'sin_resolver', round(best[1], 3) if best else 0.0, None
+        # The best name may be shared by municipalities of other departments
+        return self.match(self.by_name[self.entries[best[0]][2]], hint, 'difuso', round(best[1], 3))
+
+    def match(self, indices, hint, method, similarity):
+        idx = self.pick(indices, hint)
+        if idx is None:
+            return None, None, 'ambiguo', similarity, self.entries[indices[0]][2]
+        c_dept, c_muni, matched, _ = self.entries[idx]
+        return c_dept, c_muni, method, similarity, matched
+
+def ensure_resolution_table(cur):
+    # Same definition as database/ddl.sql, for databases created before it existed
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS resolucion_municipios (
+            texto_normalizado VARCHAR(255) PRIMARY KEY,
+            texto_original VARCHAR(255),
+            cod_departamento VARCHAR(5),
+            cod_municipio VARCHAR(5),
+            nombre_resuelto VARCHAR(100),
+            metodo VARCHAR(20) NOT NULL,
+            similitud NUMERIC(4, 3),
+            version_divipole CHAR(32),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+    """)
+    cur.execute("ALTER TABLE resolucion_municipios ADD COLUMN IF NOT EXISTS version_divipole CHAR(32);")
+
+def divipole_version(cur):
+    """Fingerprint of the municipality names in dim_divipole, or None when it is empty."""
+    cur.execute("""
+        SELECT md5(string_agg(cod_departamento || '|' || cod_municipio || '|' || COALESCE(nom_municipio, ''), ','
+                              ORDER BY cod_departamento, cod_municipio, nom_municipio))
+        FROM (SELECT DISTINCT cod_departamento, cod_municipio, nom_municipio FROM dim_divipole) d
+    """)
+    return cur.fetchone()[0]
+
+def resolve_municipalities(cur, texts):
+    """Returns {normalize_name(text): (cod_departamento, cod_municipio)}, codes None when
+    unresolved. Only strings never seen before are matched; the rest come from the cache.
+    'sin_resolver' and 'ambiguo' rows are matched again once dim_divipole has changed."""
+    originals = {}
+    for text in texts:
+        name = normalize_name(text)
+        if name and len(name) <= 255:
+            originals.setdefault(name, str(text).strip()[:255])
+
+    ensure_resolution_table(cur)
+    version = divipole_version(cur)
+    cur.execute("""
+        SELECT texto_normalizado, cod_departamento, cod_municipio
+        FROM resolucion_municipios
+        WHERE texto_normalizado = ANY(%s)
+          AND (metodo NOT IN ('sin_resolver', 'ambiguo') OR version_divipole = %s)
+    """, (list(originals), version))
+    resolved = {row[0]: (row[1], row[2]) for row in cur.fetchall()}
+
+    missing = [name for name in originals if name not in resolved]
+    print(f"🧭 Municipality names: {len(originals)} distinct, {len(originals) - len(missing)} cached, {len(missing)} to resolve")
+
+    if missing and version is None:
+        # Nothing to match against yet: leave them uncached so the next load resolves them
+        print("   ⚠️ dim_divipole is empty: names left unresolved and not cached (run extract_divipole first)")
+        resolved.update((name, (None, None)) for name in missing)
+    elif missing:
+        cur.execute("""
+            SELECT DISTINCT cod_departamento, cod_municipio, nom_departamento, nom_municipio
+            FROM dim_divipole
+        """)
+        index = MunicipalityIndex(cur.fetchall())
+
+        new_rows = []
+        methods = Counter()
+        for name in missing:
+            c_dept, c_muni, method, similarity, matched = index.resolve(name)
+            methods[method] += 1
+            resolved[name] = (c_dept, c_muni)
+            new_rows.append((name, originals[name], c_dept, c_muni, matched, method, similarity, version))
+
+        # Earlier unmatched/ambiguous rows are replaced; a manual override set meanwhile, or a
+        # row stored by a concurrent load, is kept
+        psycopg2.extras.execute_values(cur, """
+            INSERT INTO resolucion_municipios (
+                texto_normalizado, texto_original, cod_departamento, cod_municipio,
+                nombre_resuelto, metodo, similitud, version_divipole
+            ) VALUES %s
+            ON CONFLICT (texto_normalizado) DO UPDATE SET
+                texto_original = EXCLUDED.texto_original,
+                cod_departamento = EXCLUDED.cod_departamento,
+                cod_municipio = EXCLUDED.cod_municipio,
+                nombre_resuelto = EXCLUDED.nombre_resuelto,
+                metodo = EXCLUDED.metodo,
+                similitud = EXCLUDED.similitud,
+                version_divipole = EXCLUDED.version_divipole,
+                updated_at = CURRENT_TIMESTAMP
+            WHERE resolucion_municipios.metodo IN ('sin_resolver', 'ambiguo')
+              AND resolucion_municipios.version_divipole IS DISTINCT FROM EXCLUDED.version_divipole
+        """, new_rows, page_size=1000)
+        print("   " + ", ".join(f"{method}: {count}" for method, count in methods.most_common()))
+
+    return resolved
@@ -1,14 +1,14 @@
-import pandas as pd
 import sys
+from excel_cache import sheet_names, read_sheet
 
 input_file = '/app/data/data/SEGUIMIENTO A LIDERES CAMPAÑA HJS 2023.xlsx'
 
 try:
-    xl = pd.ExcelFile(input_file)
-    print(f"Sheets: {xl.sheet_names}")
+    sheets = sheet_names(input_file)
+    print(f"Sheets: {sheets}")
     
-    for sheet in xl.sheet_names:
-        df = pd.read_excel(xl, sheet, nrows=0)
+    for sheet in sheets:
+        df = read_sheet(input_file, sheet)
         print(f"--- Sheet: {sheet} ---")
         print(f"Columns: {df.columns.tolist()}")
 except Exception as e:
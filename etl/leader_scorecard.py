@@ -0,0 +1,97 @@
+import time
+
+# Leader scorecard behind /api/analytics/leader-efficiency and /api/analytics/verified-leaders.
+# One row per leader in lideres_campana, rebuilt at the end of load_seguimiento, with the
+# resource totals, votes-per-resource ratio and rank within the comuna computed once.
+# Geography: load_seguimiento fills lideres_campana.cod_municipio with the 5-digit DIVIPOLE
+# code (assign_leader_geo). Rows holding the municipality code alone are still accepted:
+# a bare code repeats across departments, so it is only resolved when exactly one
+# department has it; otherwise the leader has no department instead of matching all of them.
+
+def ensure_leader_scorecard(cur):
+    # Same definition as database/ddl.sql, for databases created before it existed
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS agg_lideres (
+            lider_id INTEGER PRIMARY KEY,
+            nombre_completo VARCHAR(255),
+            comuna VARCHAR(50),
+            cod_departamento VARCHAR(5),
+            nom_departamento VARCHAR(100),
+            cod_municipio VARCHAR(5),
+            nom_municipio VARCHAR(100),
+            verificado BOOLEAN NOT NULL DEFAULT FALSE,
+            meta_votos INTEGER NOT NULL DEFAULT 0,
+            pendones INTEGER NOT NULL DEFAULT 0,
+            boletas_bingo INTEGER NOT NULL DEFAULT 0,
+            damas_gratis INTEGER NOT NULL DEFAULT 0,
+            total_recursos INTEGER NOT NULL DEFAULT 0,
+            votos_por_recurso NUMERIC(12, 2),
+            ranking_comuna INTEGER NOT NULL
+        );
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_agg_lideres_recursos ON agg_lideres (total_recursos DESC, lider_id);")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_agg_lideres_comuna ON agg_lideres (comuna, ranking_comuna);")
+
+def refresh_leader_scorecard(cur):
+    """Rebuilds agg_lideres from lideres_campana. Returns its row count."""
+    start = time.time()
+    print("🏅 Rebuilding leader scorecard...")
+    ensure_leader_scorecard(cur)
+
+    # A few hundred rows: rebuilt whole in the load transaction
+    cur.execute("DELETE FROM agg_lideres;")
+    cur.execute("""
+        WITH municipios AS (
+            SELECT DISTINCT ON (cod_departamento, cod_municipio)
+                cod_departamento, cod_municipio, nom_departamento, nom_municipio
+            FROM dim_divipole
+            ORDER BY cod_departamento, cod_municipio
+        ),
+        codigos_unicos AS (
+            -- Municipality codes that exist in a single department
+            SELECT cod_municipio, MIN(cod_departamento) AS cod_departamento
+            FROM municipios
+            GROUP BY cod_municipio
+            HAVING COUNT(*) = 1
+        ),
+        lideres AS (
+            SELECT
+                l.*,
+                CASE
+                    WHEN btrim(l.cod_municipio) ~ '^[0-9]{5}$' THEN btrim(l.cod_municipio)
+                    WHEN btrim(l.cod_municipio) ~ '^[0-9]{1,3}$' THEN u.cod_departamento || u.cod_municipio
+                END AS geo,
+                COALESCE(l.pendones, 0) + COALESCE(l.boletas_bingo, 0) + COALESCE(l.damas_gratis, 0) AS recursos
+            FROM lideres_campana l
+            LEFT JOIN codigos_unicos u ON u.cod_municipio = LPAD(btrim(l.cod_municipio), 3, '0')
+        )
+        INSERT INTO agg_lideres (
+            lider_id, nombre_completo, comuna, cod_departamento, nom_departamento,
+            cod_municipio, nom_municipio, verificado, meta_votos, pendones, boletas_bingo,
+            damas_gratis, total_recursos, votos_por_recurso, ranking_comuna
+        )
+        SELECT
+            l.lider_id,
+            l.nombre_completo,
+            NULLIF(btrim(l.comuna), ''),
+            m.cod_departamento,
+            m.nom_departamento,
+            m.cod_municipio,
+            m.nom_municipio,
+            COALESCE(UPPER(btrim(l.verificado)) = 'SI', FALSE),
+            COALESCE(l.meta_votos, 0),
+            COALESCE(l.pendones, 0),
+            COALESCE(l.boletas_bingo, 0),
+            COALESCE(l.damas_gratis, 0),
+            l.recursos,
+            ROUND(COALESCE(l.meta_votos, 0)::decimal / NULLIF(l.recursos, 0), 2),
+            RANK() OVER (
+                PARTITION BY NULLIF(btrim(l.comuna), '')
+                ORDER BY COALESCE(l.meta_votos, 0) DESC, l.recursos
+            )
+        FROM lideres l
+        LEFT JOIN municipios m ON m.cod_departamento || m.cod_municipio = l.geo;
+    """)
+    rows = cur.rowcount
+    print(f"   ✅ {rows} leaders ranked ({time.time() - start:.1f}s)")
+    return rows
@@ -1,13 +1,25 @@
 import pandas as pd
 import psycopg2
 import os
+import sys
 import time
+import hashlib
 from io import StringIO
 import datetime
+from validation import (
+    ensure_validation_tables, load_geo_keys, validate_chunk,
+    clear_rejects, write_rejects, record_summary, print_summary
+)
+from personas import ensure_personas, refresh_persons
 
 # Configuration
 INPUT_FILE = '/app/data/data/CENSO.csv'
 CHUNK_SIZE = 100000
+SOURCE_NAME = 'CENSO.csv'
+
+# Load mode: 'delta' applies only inserts/updates/deletes against the fingerprints
+# stored by the previous run; 'full' restages everything (legacy behaviour).
+LOAD_MODE = os.getenv("CENSO_LOAD_MODE", "delta").lower()
 
 # DB Config
 DB_HOST = os.getenv("DB_HOST", "db")
@@ -15,6 +27,19 @@ DB_NAME = os.getenv("DB_NAME", "postgres")
 DB_USER = os.getenv("DB_USER", "postgres")
 DB_PASS = os.getenv("DB_PASS", "postgres")
 
+# Row fingerprint: hash of documento + geo codes + date, truncated to 64 bits.
+# Computed in SQL so staging rows and existing censo_electoral rows hash identically.
+FINGERPRINT_SQL = """
+    ('x' || LEFT(MD5(
+        COALESCE(documento, '') || '|' ||
+        COALESCE(cod_departamento, '') || '|' ||
+        COALESCE(cod_municipio, '') || '|' ||
+        COALESCE(cod_zona, '') || '|' ||
+        COALESCE(cod_puesto, '') || '|' ||
+        COALESCE(fecha_registro_censo::text, '')
+    ), 16))::bit(64)::bigint
+"""
+
 def get_db_connection():
     retries = 5
     while retries > 0:
@@ -32,12 +57,61 @@ def get_db_connection():
             retries -= 1
     raise Exception("DB Connection failed")
 
-def load_censo():
-    conn = get_db_connection()
-    cur = conn.cursor()
-    
-    print("🚀 Preparing database for bulk load...")
-    
+def file_sha256(path, block_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def ensure_control_tables(cur):
+    # Same definitions as database/ddl.sql, for databases created before they existed
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS censo_fingerprints (
+            documento VARCHAR(20) PRIMARY KEY,
+            fingerprint BIGINT NOT NULL
+        );
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS load_manifest (
+            manifest_id SERIAL PRIMARY KEY,
+            source VARCHAR(100) NOT NULL,
+            file_hash CHAR(64),
+            load_mode VARCHAR(10),
+            rows_read INTEGER DEFAULT 0,
+            rows_inserted INTEGER DEFAULT 0,
+            rows_updated INTEGER DEFAULT 0,
+            rows_deleted INTEGER DEFAULT 0,
+            rows_unchanged INTEGER DEFAULT 0,
+            duration_seconds NUMERIC(10, 2),
+            status VARCHAR(20),
+            loaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+    """)
+
+def last_loaded_hash(cur):
+    cur.execute("""
+        SELECT file_hash FROM load_manifest
+        WHERE source = %s AND status = 'OK'
+        ORDER BY loaded_at DESC, manifest_id DESC
+        LIMIT 1;
+    """, (SOURCE_NAME,))
+    row = cur.fetchone()
+    return row[0] if row else None
+
+def record_manifest(cur, file_hash, stats, duration, status):
+    cur.execute("""
+        INSERT INTO load_manifest (
+            source, file_hash, load_mode, rows_read, rows_inserted,
+            rows_updated, rows_deleted, rows_unchanged, duration_seconds, status
+        ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+    """, (
+        SOURCE_NAME, file_hash, LOAD_MODE,
+        stats.get('read', 0), stats.get('inserted', 0), stats.get('updated', 0),
+        stats.get('deleted', 0), stats.get('unchanged', 0), round(duration, 2), status
+    ))
+
+def stage_csv(conn, cur, strict):
     # 1. Create Staging Table (Unlogged for speed)
     cur.execute("DROP TABLE IF EXISTS staging_censo_import;")
     cur.execute("""
@@ -52,99 +126,256 @@ def load_censo():
         );
     """)
     conn.commit()
-    
+
     print(f"📂 Reading {INPUT_FILE}...")
-    
+
     # 2. Process CSV in Chunks
     # User said cols: "identification_number";"department_code";... with sep=';'
-    try:
-        chunk_iter = pd.read_csv(
-            INPUT_FILE, 
-            sep=';', 
-            chunksize=CHUNK_SIZE,
-            dtype=str, # Read all as string to avoid type errors
-            quotechar='"'
+    chunk_iter = pd.read_csv(
+        INPUT_FILE,
+        sep=';',
+        chunksize=CHUNK_SIZE,
+        dtype=str, # Read all as string to avoid type errors
+        quotechar='"'
+    )
+
+    total_rows = 0
+    rows_read = 0
+    start_time = time.time()
+
+    clear_rejects(cur, SOURCE_NAME)
+    context = {'geo': load_geo_keys(cur)}
+    validation_stats = {}
+    conn.commit()
+
+    for i, chunk in enumerate(chunk_iter):
+        # Vectorized checks over the whole chunk; rows without a usable documento are
+        # left out of staging, warnings are only reported
+        keep, rejects = validate_chunk(
+            chunk, SOURCE_NAME, context, row_offset=rows_read,
+            key_column='identification_number', stats=validation_stats
         )
-        
-        total_rows = 0
-        start_time = time.time()
-        
-        for i, chunk in enumerate(chunk_iter):
-            # Map columns
-            # CSV: identification_number, department_code, municipality_code, zone_code, place_code, register_date, identification_type
-            # DB: documento, cod_departamento, cod_municipio, cod_zona, cod_puesto, fecha_registro_censo, tipo_documento
-            
-            df_stage = pd.DataFrame()
-            df_stage['documento'] = chunk['identification_number']
-            df_stage['cod_departamento'] = chunk['department_code']
-            df_stage['cod_municipio'] = chunk['municipality_code']
-            df_stage['cod_zona'] = chunk['zone_code']
-            df_stage['cod_puesto'] = chunk['place_code']
-            df_stage['fecha_registro_censo'] = chunk['register_date'] # Postgres usually handles 'YYYY-MM-DD' text automatically
-            df_stage['tipo_documento'] = chunk['identification_type']
-            
-            # Clean data if needed (e.g. max lengths)
-            df_stage['tipo_documento'] = df_stage['tipo_documento'].str.slice(0, 10)
-            
-            # Write to memory buffer
-            buffer = StringIO()
-            df_stage.to_csv(buffer, index=False, header=False, sep='\t')
-            buffer.seek(0)
-            
-            # COPY to Staging
-            try:
-                cur.copy_from(buffer, 'staging_censo_import', sep='\t', null='')
-                total_rows += len(df_stage)
-            except Exception as e:
-                print(f"❌ Error copying chunk {i}: {e}")
-                conn.rollback()
-                continue
-                
-            if (i + 1) % 10 == 0:
-                conn.commit()
-                elapsed = time.time() - start_time
-                print(f"   ⏱ Chunk {i+1} processed. Total rows staged: {total_rows} ({total_rows/elapsed:.0f} rows/sec)")
-        
-        conn.commit()
-        print(f"✅ Staging complete. Total rows in buffer: {total_rows}")
-        
-        # 3. Final Insert (Staging -> Production)
-        print("📥 Moving data from Staging to Production (censo_electoral)...")
-        print("   (This might take a while due to index updates and deduplication)")
-        
-        # Using INSERT ON CONFLICT DO NOTHING based on unique constraint
-        # Assumption: 'documento' is unique in censo_electoral
-        cur.execute("""
-            INSERT INTO censo_electoral (
-                documento, tipo_documento, cod_departamento, cod_municipio, 
-                cod_zona, cod_puesto, fecha_registro_censo
-            )
-            SELECT DISTINCT 
-                documento, tipo_documento, cod_departamento, cod_municipio,
-                cod_zona, cod_puesto, 
-                CAST(fecha_registro_censo AS DATE)
-            FROM staging_censo_import
-            ON CONFLICT (documento) DO NOTHING;
+        rows_read += len(chunk)
+        chunk = chunk[keep]
+
+        # Map columns
+        # CSV: identification_number, department_code, municipality_code, zone_code, place_code, register_date, identification_type
+        # DB: documento, cod_departamento, cod_municipio, cod_zona, cod_puesto, fecha_registro_censo, tipo_documento
+
+        df_stage = pd.DataFrame()
+        df_stage['documento'] = chunk['identification_number']
+        df_stage['cod_departamento'] = chunk['department_code']
+        df_stage['cod_municipio'] = chunk['municipality_code']
+        df_stage['cod_zona'] = chunk['zone_code']
+        df_stage['cod_puesto'] = chunk['place_code']
+        df_stage['fecha_registro_censo'] = chunk['register_date'] # Postgres usually handles 'YYYY-MM-DD' text automatically
+        df_stage['tipo_documento'] = chunk['identification_type']
+
+        # Clean data if needed (e.g. max lengths)
+        df_stage['tipo_documento'] = df_stage['tipo_documento'].str.slice(0, 10)
+
+        # Write to memory buffer
+        buffer = StringIO()
+        df_stage.to_csv(buffer, index=False, header=False, sep='\t')
+        buffer.seek(0)
+
+        # COPY to Staging
+        try:
+            cur.copy_from(buffer, 'staging_censo_import', sep='\t', null='')
+            write_rejects(cur, rejects)
+            total_rows += len(df_stage)
+        except Exception as e:
+            print(f"❌ Error copying chunk {i}: {e}")
+            conn.rollback()
+            # A delta run must see the whole file, otherwise missing rows become deletes
+            if strict:
+                raise
+            continue
+
+        if (i + 1) % 10 == 0:
+            conn.commit()
+            elapsed = time.time() - start_time
+            print(f"   ⏱ Chunk {i+1} processed. Total rows staged: {total_rows} ({total_rows/elapsed:.0f} rows/sec)")
+
+    record_summary(cur, SOURCE_NAME, validation_stats)
+    conn.commit()
+    print_summary(SOURCE_NAME, validation_stats)
+    print(f"✅ Staging complete. Total rows in buffer: {total_rows}")
+    return total_rows
+
+def apply_full(cur):
+    # 3. Final Insert (Staging -> Production)
+    print("📥 Moving data from Staging to Production (censo_electoral)...")
+    print("   (This might take a while due to index updates and deduplication)")
+
+    # Using INSERT ON CONFLICT DO NOTHING based on unique constraint
+    # Assumption: 'documento' is unique in censo_electoral
+    cur.execute("""
+        INSERT INTO censo_electoral (
+            documento, tipo_documento, cod_departamento, cod_municipio,
+            cod_zona, cod_puesto, fecha_registro_censo
+        )
+        SELECT DISTINCT
+            documento, tipo_documento, cod_departamento, cod_municipio,
+            cod_zona, cod_puesto,
+            CAST(fecha_registro_censo AS DATE)
+        FROM staging_censo_import
+        ON CONFLICT (documento) DO NOTHING;
+    """)
+    inserted_count = cur.rowcount
+
+    # Rebuild fingerprints from what is actually stored so the next delta run starts clean
+    print("🔑 Rebuilding census fingerprints...")
+    cur.execute("TRUNCATE TABLE censo_fingerprints;")
+    cur.execute(f"""
+        INSERT INTO censo_fingerprints (documento, fingerprint)
+        SELECT documento, {FINGERPRINT_SQL} FROM censo_electoral;
+    """)
+    return {'inserted': inserted_count}
+
+def apply_delta(cur):
+    # Seed fingerprints from censo_electoral the first time delta mode runs after a full load
+    cur.execute("SELECT EXISTS (SELECT 1 FROM censo_fingerprints);")
+    if not cur.fetchone()[0]:
+        print("🔑 No stored fingerprints, seeding from censo_electoral...")
+        cur.execute(f"""
+            INSERT INTO censo_fingerprints (documento, fingerprint)
+            SELECT documento, {FINGERPRINT_SQL} FROM censo_electoral;
         """)
-        
-        inserted_count = cur.rowcount
+
+    print("🔍 Fingerprinting staged rows...")
+    cur.execute("DROP TABLE IF EXISTS staging_censo_delta;")
+    cur.execute(f"""
+        CREATE UNLOGGED TABLE staging_censo_delta AS
+        SELECT DISTINCT ON (documento)
+            documento, tipo_documento, cod_departamento, cod_municipio,
+            cod_zona, cod_puesto, fecha_registro_censo,
+            {FINGERPRINT_SQL} AS fingerprint
+        FROM staging_censo_import
+        WHERE documento IS NOT NULL
+        ORDER BY documento;
+    """)
+    cur.execute("ALTER TABLE staging_censo_delta ADD PRIMARY KEY (documento);")
+    cur.execute("ANALYZE staging_censo_delta;")
+
+    # New documents and documents whose fingerprint changed since the previous run
+    cur.execute("""
+        CREATE TEMP TABLE censo_delta_changes ON COMMIT DROP AS
+        SELECT s.*, (f.documento IS NULL) AS is_new
+        FROM staging_censo_delta s
+        LEFT JOIN censo_fingerprints f ON f.documento = s.documento
+        WHERE f.fingerprint IS DISTINCT FROM s.fingerprint;
+    """)
+    cur.execute("SELECT COUNT(*) FILTER (WHERE is_new), COUNT(*) FILTER (WHERE NOT is_new) FROM censo_delta_changes;")
+    inserted_count, updated_count = cur.fetchone()
+
+    print(f"📥 Applying {inserted_count} inserts and {updated_count} updates...")
+    cur.execute("""
+        INSERT INTO censo_electoral (
+            documento, tipo_documento, cod_departamento, cod_municipio,
+            cod_zona, cod_puesto, fecha_registro_censo
+        )
+        SELECT
+            documento, tipo_documento, cod_departamento, cod_municipio,
+            cod_zona, cod_puesto, fecha_registro_censo
+        FROM censo_delta_changes
+        ON CONFLICT (documento) DO UPDATE SET
+            tipo_documento = EXCLUDED.tipo_documento,
+            cod_departamento = EXCLUDED.cod_departamento,
+            cod_municipio = EXCLUDED.cod_municipio,
+            cod_zona = EXCLUDED.cod_zona,
+            cod_puesto = EXCLUDED.cod_puesto,
+            fecha_registro_censo = EXCLUDED.fecha_registro_censo;
+    """)
+
+    # Documents fingerprinted last run but absent from this file
+    print("🗑️ Removing documents no longer in the census...")
+    cur.execute("""
+        DELETE FROM censo_electoral c
+        USING censo_fingerprints f
+        WHERE c.documento = f.documento
+          AND NOT EXISTS (SELECT 1 FROM staging_censo_delta s WHERE s.documento = f.documento);
+    """)
+    deleted_count = cur.rowcount
+    cur.execute("""
+        DELETE FROM censo_fingerprints f
+        WHERE NOT EXISTS (SELECT 1 FROM staging_censo_delta s WHERE s.documento = f.documento);
+    """)
+
+    cur.execute("""
+        INSERT INTO censo_fingerprints (documento, fingerprint)
+        SELECT documento, fingerprint FROM censo_delta_changes
+        ON CONFLICT (documento) DO UPDATE SET fingerprint = EXCLUDED.fingerprint;
+    """)
+
+    cur.execute("SELECT COUNT(*) FROM staging_censo_delta;")
+    distinct_rows = cur.fetchone()[0]
+    cur.execute("DROP TABLE staging_censo_delta;")
+
+    return {
+        'inserted': inserted_count,
+        'updated': updated_count,
+        'deleted': deleted_count,
+        'unchanged': distinct_rows - inserted_count - updated_count,
+    }
+
+def load_censo():
+    conn = get_db_connection()
+    cur = conn.cursor()
+    start_time = time.time()
+
+    print(f"🚀 Preparing database for census load (mode: {LOAD_MODE})...")
+    ensure_control_tables(cur)
+    ensure_validation_tables(cur)
+    ensure_personas(cur)
+    conn.commit()
+
+    print("🔑 Hashing source file...")
+    file_hash = file_sha256(INPUT_FILE)
+
+    if LOAD_MODE == 'delta' and last_loaded_hash(cur) == file_hash:
+        print(f"⏭️ {SOURCE_NAME} unchanged since last load (sha256 {file_hash[:12]}), nothing to do.")
+        record_manifest(cur, file_hash, {}, time.time() - start_time, 'SKIPPED')
         conn.commit()
-        
+        cur.close()
+        conn.close()
+        return
+
+    stats = {}
+    try:
+        stats['read'] = stage_csv(conn, cur, strict=(LOAD_MODE == 'delta'))
+
+        if LOAD_MODE == 'delta':
+            stats.update(apply_delta(cur))
+        else:
+            stats.update(apply_full(cur))
+
+        refresh_persons(cur, 'censo_electoral')
+
         # Cleanup
         cur.execute("DROP TABLE staging_censo_import;")
+        record_manifest(cur, file_hash, stats, time.time() - start_time, 'OK')
         conn.commit()
-        
-        print(f"🏁 DONE! Successfully inserted/processed {inserted_count} census records.")
-        
+
+        print(
+            f"🏁 DONE! Inserted {stats.get('inserted', 0)}, updated {stats.get('updated', 0)}, "
+            f"deleted {stats.get('deleted', 0)}, unchanged {stats.get('unchanged', 0)} census records."
+        )
+
     except Exception as e:
         print(f"❌ Critical Error: {e}")
         conn.rollback()
-    
-    cur.close()
-    conn.close()
+        record_manifest(cur, file_hash, stats, time.time() - start_time, 'FAILED')
+        conn.commit()
+        raise  # Non-zero exit, so run_pipeline.py records the stage as FAILED
+    finally:
+        print(f"⏱️ Duration: {time.time() - start_time:.2f} seconds")
+        cur.close()
+        conn.close()
 
 if __name__ == "__main__":
     if os.path.exists(INPUT_FILE):
         load_censo()
     else:
         print(f"❌ File not found: {INPUT_FILE}")
+        sys.exit(1)
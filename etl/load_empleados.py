@@ -1,11 +1,21 @@
 import pandas as pd
 import psycopg2
 import os
+import sys
 import time
 from io import StringIO
+from csv_stream import iter_csv_chunks, peak_rss_mb, MEMORY_BUDGET_MB
+from validation import (
+    ensure_validation_tables, load_geo_keys, validate_chunk,
+    clear_rejects, write_rejects, record_summary, print_summary
+)
+from personas import ensure_personas, refresh_persons
+from search_index import ensure_search_columns
+from company_counters import refresh_company_counters
 
 # Configuration
 INPUT_FILE = '/app/data/data/EMPLEADOS_EMPRESAS.csv'
+SOURCE_NAME = 'EMPLEADOS_EMPRESAS.csv'
 DB_HOST = os.getenv("DB_HOST", "db")
 DB_NAME = os.getenv("DB_NAME", "postgres")
 DB_USER = os.getenv("DB_USER", "postgres")
@@ -40,120 +50,115 @@ def load_empleados():
     valid_companies = set(row[0] for row in cur.fetchall())
     print(f"   Found {len(valid_companies)} valid companies.")
 
-    print(f"📂 Reading {INPUT_FILE}...")
+    ensure_validation_tables(cur)
+    ensure_search_columns(cur, 'empleados_empresas')
+    clear_rejects(cur, SOURCE_NAME)
+    context = {'geo': load_geo_keys(cur), 'empresas': valid_companies}
+    validation_stats = {}
+    
+    # 4. Prepare Batch
+    insert_query = """
+        INSERT INTO empleados_empresas (
+            empleado_id, documento, tipo_documento, empresa_id,
+            primer_nombre, segundo_nombre, primer_apellido, segundo_apellido, nombre_completo,
+            sexo, fecha_nacimiento, nivel_educativo, email, celular, direccion,
+            cod_departamento, cod_municipio, zona_codigo, puesto_codigo
+        ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+        ON CONFLICT (empleado_id) DO UPDATE SET
+            documento = EXCLUDED.documento,
+            nombre_completo = EXCLUDED.nombre_completo,
+            empresa_id = EXCLUDED.empresa_id,
+            updated_at = CURRENT_TIMESTAMP;
+    """
+    
+    print(f"📂 Reading {INPUT_FILE} in chunks (memory budget {MEMORY_BUDGET_MB} MB)...")
     
     try:
-        # Load CSV
-        df = pd.read_csv(INPUT_FILE, sep=';', quotechar='"', dtype=str)
-        total_rows = len(df)
-        print(f"   Rows found: {total_rows}")
-        
-        # 1. Generate 'nombre_completo'
-        df['first_name_one'] = df['first_name_one'].fillna('')
-        df['first_name_two'] = df['first_name_two'].fillna('')
-        df['last_name_one'] = df['last_name_one'].fillna('')
-        df['last_name_two'] = df['last_name_two'].fillna('')
-        
-        df['nombre_completo'] = (
-            df['first_name_one'] + ' ' + 
-            df['first_name_two'] + ' ' + 
-            df['last_name_one'] + ' ' + 
-            df['last_name_two']
-        ).str.replace(r'\s+', ' ', regex=True).str.strip()
-        
-        # 2. Date Cleaning
-        df['birthday'] = pd.to_datetime(df['birthday'], errors='coerce').dt.date
-        
-        # 3. Filter Invalid Companies (FK Constraint Logic)
-        # Only keep rows where company_id is present in DB or is Null (if we allow nulls)
-        # If company_id is provided but not in DB, it would crash insert.
-        # Let's set invalid company_ids to None so we can still load the person? 
-        # Or drop them? User asked to "carga toda la informacion". 
-        # Making it None is safer than dropping.
-        
-        def validate_company(cid):
-            if pd.isna(cid) or cid == '':
-                return None
-            if cid in valid_companies:
-                return cid
-            return None # Invalid/Unknown company -> Set to None to avoid FK error
-            
-        df['clean_company_id'] = df['company_id'].apply(validate_company)
-        
-        # 4. Prepare Batch
-        insert_query = """
-            INSERT INTO empleados_empresas (
-                empleado_id, documento, tipo_documento, empresa_id,
-                primer_nombre, segundo_nombre, primer_apellido, segundo_apellido, nombre_completo,
-                sexo, fecha_nacimiento, nivel_educativo, email, celular, direccion,
-                cod_departamento, cod_municipio, zona_codigo, puesto_codigo
-            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-            ON CONFLICT (empleado_id) DO UPDATE SET
-                documento = EXCLUDED.documento,
-                nombre_completo = EXCLUDED.nombre_completo,
-                empresa_id = EXCLUDED.empresa_id,
-                updated_at = CURRENT_TIMESTAMP;
-        """
-        
-        batch_size = 10000
+        total_rows = 0
         processed = 0
         
-        print(f"📥 Starting Batch Insertion ({batch_size} rows per batch)...")
-        
-        # To reduce memory usage, we can iterate key columns or convert to list in chunks
-        # But valid_companies set helps.
-        
-        data_to_insert = []
-        
-        for index, row in df.iterrows():
-            if pd.isna(row['nominated_citizen_id']):
-                continue
-                
-            cel = row['mobile_number'] if pd.notnull(row['mobile_number']) and str(row['mobile_number']).strip() != '' else row['phone_number']
+        # Streamed in bounded chunks; sex/education/geo codes come back as categoricals,
+        # and each chunk is written in one execute_batch call before the next is read
+        for df in iter_csv_chunks(INPUT_FILE):
+            # 0. Validate the whole chunk; rejected and warned rows go to validation_rejects
+            keep, rejects = validate_chunk(
+                df, SOURCE_NAME, context, row_offset=total_rows,
+                key_column='nominated_citizen_id', stats=validation_stats
+            )
+            write_rejects(cur, rejects)
+            total_rows += len(df)
+            df = df[keep].copy()
+            
+            # 1. Generate 'nombre_completo'
+            df['first_name_one'] = df['first_name_one'].fillna('')
+            df['first_name_two'] = df['first_name_two'].fillna('')
+            df['last_name_one'] = df['last_name_one'].fillna('')
+            df['last_name_two'] = df['last_name_two'].fillna('')
+            
+            df['nombre_completo'] = (
+                df['first_name_one'] + ' ' + 
+                df['first_name_two'] + ' ' + 
+                df['last_name_one'] + ' ' + 
+                df['last_name_two']
+            ).str.replace(r'\s+', ' ', regex=True).str.strip()
+            
+            # 2. Date Cleaning
+            df['birthday'] = pd.to_datetime(df['birthday'], errors='coerce').dt.date
             
-            data_to_insert.append((
-                row['nominated_citizen_id'], 
-                row['identification_number'], 
-                row['identification_type'] if pd.notnull(row['identification_type']) else 'CC',
-                row['clean_company_id'], # Use validated ID
-                row['first_name_one'],
-                row['first_name_two'],
-                row['last_name_one'],
-                row['last_name_two'],
-                row['nombre_completo'],
-                row['sex'][:1] if pd.notnull(row['sex']) else None,
-                row['birthday'] if pd.notnull(row['birthday']) else None,
-                row['education_level'],
-                row['email'],
-                str(cel)[:50] if cel else None,
-                row['address'],
-                row['department_code'],
-                row['municipality_code'], 
-                row['zone_code'], 
-                row['place_code']
-            ))
+            # 3. Filter Invalid Companies (FK Constraint Logic)
+            # If company_id is provided but not in DB, it would crash insert.
+            # Making it None is safer than dropping ("carga toda la informacion");
+            # those rows are reported by the 'empresa_existe' rule.
+            df['clean_company_id'] = df['company_id'].where(df['company_id'].isin(valid_companies), None)
             
-            if len(data_to_insert) >= batch_size:
-                psycopg2.extras.execute_batch(cur, insert_query, data_to_insert)
-                conn.commit()
+            data_to_insert = []
+            
+            for index, row in df.iterrows():
+                cel = row['mobile_number'] if pd.notnull(row['mobile_number']) and str(row['mobile_number']).strip() != '' else row['phone_number']
+                
+                data_to_insert.append((
+                    row['nominated_citizen_id'], 
+                    row['identification_number'], 
+                    row['identification_type'] if pd.notnull(row['identification_type']) else 'CC',
+                    row['clean_company_id'], # Use validated ID
+                    row['first_name_one'],
+                    row['first_name_two'],
+                    row['last_name_one'],
+                    row['last_name_two'],
+                    row['nombre_completo'],
+                    row['sex'][:1] if pd.notnull(row['sex']) else None,
+                    row['birthday'] if pd.notnull(row['birthday']) else None,
+                    row['education_level'],
+                    row['email'],
+                    str(cel)[:50] if cel else None,
+                    row['address'],
+                    row['department_code'],
+                    row['municipality_code'], 
+                    row['zone_code'], 
+                    row['place_code']
+                ))
+            
+            if data_to_insert:
+                psycopg2.extras.execute_batch(cur, insert_query, data_to_insert, page_size=1000)
                 processed += len(data_to_insert)
-                data_to_insert = []
-                print(f"   Saved {processed}/{total_rows}...")
-        
-        # Final batch
-        if data_to_insert:
-            psycopg2.extras.execute_batch(cur, insert_query, data_to_insert)
             conn.commit()
-            processed += len(data_to_insert)
+            print(f"   Saved {processed}/{total_rows}... Peak RSS: {peak_rss_mb():.0f} MB")
             
+        record_summary(cur, SOURCE_NAME, validation_stats)
+        ensure_personas(cur)
+        refresh_persons(cur, 'empleados_empresas')
+        refresh_company_counters(cur)
+        conn.commit()
+        print_summary(SOURCE_NAME, validation_stats)
         print(f"🏁 DONE! Successfully processed {processed} records.")
 
     except Exception as e:
         print(f"❌ Fatal Error: {e}")
         conn.rollback()
-    
-    cur.close()
-    conn.close()
+        raise  # Non-zero exit, so run_pipeline.py records the stage as FAILED
+    finally:
+        cur.close()
+        conn.close()
 
 if __name__ == "__main__":
     import psycopg2.extras
@@ -161,5 +166,7 @@ if __name__ == "__main__":
         start_time = time.time()
         load_empleados()
         print(f"⏱️ Duration: {time.time() - start_time:.2f} seconds")
+        print(f"📈 Peak RSS: {peak_rss_mb():.0f} MB")
     else:
         print(f"❌ File not found: {INPUT_FILE}")
+        sys.exit(1)
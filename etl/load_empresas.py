@@ -1,12 +1,22 @@
+import numpy as np
 import pandas as pd
 import psycopg2
 import os
+import sys
 import time
 from io import StringIO
 import datetime
+from csv_stream import iter_csv_chunks, peak_rss_mb, MEMORY_BUDGET_MB
+from validation import (
+    ensure_validation_tables, load_geo_keys, validate_chunk,
+    clear_rejects, write_rejects, record_summary, print_summary
+)
+from search_index import ensure_search_columns
+from company_counters import refresh_company_counters, refresh_company_timeline
 
 # Configuration
 INPUT_FILE = '/app/data/data/EMPRESAS.csv'
+SOURCE_NAME = 'EMPRESAS.csv'
 DB_HOST = os.getenv("DB_HOST", "db")
 DB_NAME = os.getenv("DB_NAME", "postgres")
 DB_USER = os.getenv("DB_USER", "postgres")
@@ -29,6 +39,22 @@ def get_db_connection():
             retries -= 1
     raise Exception("DB Connection failed")
 
+def insert_rows_individually(cur, insert_query, rows, row_numbers):
+    """Fallback when a batch fails: isolates the offending rows behind savepoints.
+    Returns (inserted count, DataFrame of rejects for validation_rejects)."""
+    inserted = 0
+    errors = []
+    for row, fila in zip(rows, row_numbers):
+        cur.execute("SAVEPOINT empresa_row;")
+        try:
+            cur.execute(insert_query, row)
+            cur.execute("RELEASE SAVEPOINT empresa_row;")
+            inserted += 1
+        except psycopg2.Error as e:
+            cur.execute("ROLLBACK TO SAVEPOINT empresa_row;")
+            errors.append((SOURCE_NAME, 'error_bd', 'rechazar', fila, row[0], str(e).strip()[:500]))
+    return inserted, pd.DataFrame(errors, columns=['source', 'regla', 'severidad', 'fila', 'clave', 'valor'])
+
 def load_empresas():
     conn = get_db_connection()
     cur = conn.cursor()
@@ -37,123 +63,152 @@ def load_empresas():
     
     # Check if table exists (should exist from DDL)
     
-    print(f"📂 Reading {INPUT_FILE}...")
+    insert_query = """
+        INSERT INTO core_empresas (
+            empresa_id, nit, razon_social, representante_legal, tipo_empresa, 
+            estado_actual, fecha_constitucion, telefono_contacto, extension, 
+            direccion_fisica, municipio_cod
+        ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+        ON CONFLICT (empresa_id) DO UPDATE SET
+            nit = EXCLUDED.nit,
+            razon_social = EXCLUDED.razon_social,
+            representante_legal = EXCLUDED.representante_legal,
+            tipo_empresa = EXCLUDED.tipo_empresa,
+            estado_actual = EXCLUDED.estado_actual,
+            fecha_constitucion = EXCLUDED.fecha_constitucion,
+            telefono_contacto = EXCLUDED.telefono_contacto,
+            extension = EXCLUDED.extension,
+            direccion_fisica = EXCLUDED.direccion_fisica,
+            municipio_cod = EXCLUDED.municipio_cod;
+    """
+    
+    ensure_validation_tables(cur)
+    ensure_search_columns(cur, 'core_empresas')
+    clear_rejects(cur, SOURCE_NAME)
+    context = {'geo': load_geo_keys(cur)}
+    validation_stats = {}
+    conn.commit()
+
+    print(f"📂 Reading {INPUT_FILE} in chunks (memory budget {MEMORY_BUDGET_MB} MB)...")
+    success_count = 0
+    skipped_count = 0
+    rows_read = 0
+    
     try:
-        # Load CSV
         # Format: "company_id";"legal_name";...
-        df = pd.read_csv(INPUT_FILE, sep=';', quotechar='"', dtype=str)
-        
-        print(f"   Rows found: {len(df)}")
-        
-        # Mapping Columns
-        # Source -> Destination
-        # company_id -> empresa_id (PK)
-        # identification_number -> nit
-        # legal_name -> razon_social
-        # legal_representative -> representante_legal
-        # company_type -> tipo_empresa
-        # status -> estado_actual
-        # created_time -> fecha_constitucion
-        # phone_number -> telefono_contacto
-        # phone_extension -> extension
-        # address -> direccion_fisica
-        # municipality_code -> municipio_cod
-        
-        # Clean Data
-        
-        # 1. Parse Dates: created_time '2025-08-05 17:33:52.492' -> '2025-08-05'
-        # Some might be empty
-        df['fecha_constitucion'] = pd.to_datetime(df['created_time'], errors='coerce').dt.date
-        
-        # 2. Municipality Code
-        # In EMPRESAS.csv: '43' (sometimes short?), '700'
-        # In dim_divipole: usually 5 digits '05001'.
-        # The CSV has separate 'department_code' and 'municipality_code'.
-        # We might need to construct the full code if 'municipio_cod' in DB expects 5 digits.
-        # Let's check the schema logic or assumption. 
-        # The user didn't explicitly specify, but standard Colombia logic is Dept(2) + Muni(3).
-        # Sample row: Dept=1, Muni=43. -> '01043'? 
-        # Sample row: Dept=12, Muni=700 -> '12700'.
-        # Let's construct it to be safe if both cols exist
-        
-        if 'department_code' in df.columns and 'municipality_code' in df.columns:
-             # Pad Dept to 2 chars, Muni to 3 chars
-             df['dept_pad'] = df['department_code'].str.zfill(2)
-             df['muni_pad'] = df['municipality_code'].str.zfill(3)
-             df['municipio_cod_full'] = df['dept_pad'] + df['muni_pad']
-        else:
-            df['municipio_cod_full'] = df['municipality_code'] # Fallback
+        # Streamed in bounded chunks; codes come back as categoricals
+        for df in iter_csv_chunks(INPUT_FILE):
+            # Declarative checks over the whole chunk replace the per-row try/except:
+            # rows breaking a 'rechazar' rule never reach the INSERT
+            keep, rejects = validate_chunk(
+                df, SOURCE_NAME, context, row_offset=rows_read,
+                key_column='company_id', stats=validation_stats
+            )
+            write_rejects(cur, rejects)
+            row_numbers = (np.flatnonzero(keep.to_numpy()) + rows_read + 1).tolist()
+            skipped_count += int((~keep).sum())
+            rows_read += len(df)
+            df = df[keep].copy()
             
-        # Select and Rename for Staging
-        output_data = []
-        for index, row in df.iterrows():
-            output_data.append((
-                row['company_id'],
-                row['identification_number'], # nit
-                row['legal_name'],
-                row['legal_representative'],
-                row['company_type'],
-                row['status'],
-                row['fecha_constitucion'] if pd.notnull(row['fecha_constitucion']) else None,
-                str(row['phone_number']).replace('.0', '')[:20] if pd.notnull(row['phone_number']) else None, # Clean floats
-                row['phone_extension'],
-                row['address'],
-                row['municipio_cod_full']
-            ))
+            # Mapping Columns
+            # Source -> Destination
+            # company_id -> empresa_id (PK)
+            # identification_number -> nit
+            # legal_name -> razon_social
+            # legal_representative -> representante_legal
+            # company_type -> tipo_empresa
+            # status -> estado_actual
+            # created_time -> fecha_constitucion
+            # phone_number -> telefono_contacto
+            # phone_extension -> extension
+            # address -> direccion_fisica
+            # municipality_code -> municipio_cod
+            
+            # Clean Data
+            
+            # 1. Parse Dates: created_time '2025-08-05 17:33:52.492' -> '2025-08-05'
+            # Some might be empty
+            df['fecha_constitucion'] = pd.to_datetime(df['created_time'], errors='coerce').dt.date
+            
+            # 2. Municipality Code
+            # In EMPRESAS.csv: '43' (sometimes short?), '700'
+            # In dim_divipole: usually 5 digits '05001'.
+            # The CSV has separate 'department_code' and 'municipality_code'.
+            # We might need to construct the full code if 'municipio_cod' in DB expects 5 digits.
+            # Let's check the schema logic or assumption. 
+            # The user didn't explicitly specify, but standard Colombia logic is Dept(2) + Muni(3).
+            # Sample row: Dept=1, Muni=43. -> '01043'? 
+            # Sample row: Dept=12, Muni=700 -> '12700'.
+            # Let's construct it to be safe if both cols exist
+            
+            if 'department_code' in df.columns and 'municipality_code' in df.columns:
+                 # Pad Dept to 2 chars, Muni to 3 chars
+                 df['dept_pad'] = df['department_code'].str.zfill(2)
+                 df['muni_pad'] = df['municipality_code'].str.zfill(3)
+                 df['municipio_cod_full'] = df['dept_pad'] + df['muni_pad']
+            else:
+                df['municipio_cod_full'] = df['municipality_code'] # Fallback
+                
+            # Select and Rename for Staging
+            output_data = []
+            for index, row in df.iterrows():
+                output_data.append((
+                    row['company_id'],
+                    row['identification_number'], # nit
+                    row['legal_name'],
+                    row['legal_representative'],
+                    row['company_type'],
+                    row['status'],
+                    row['fecha_constitucion'] if pd.notnull(row['fecha_constitucion']) else None,
+                    str(row['phone_number']).replace('.0', '')[:20] if pd.notnull(row['phone_number']) else None, # Clean floats
+                    row['phone_extension'],
+                    row['address'],
+                    row['municipio_cod_full']
+                ))
 
-        print("📥 Inserting into core_empresas (Row-by-Row for validation)...")
-        
-        insert_query = """
-            INSERT INTO core_empresas (
-                empresa_id, nit, razon_social, representante_legal, tipo_empresa, 
-                estado_actual, fecha_constitucion, telefono_contacto, extension, 
-                direccion_fisica, municipio_cod
-            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-            ON CONFLICT (empresa_id) DO UPDATE SET
-                nit = EXCLUDED.nit,
-                razon_social = EXCLUDED.razon_social,
-                representante_legal = EXCLUDED.representante_legal,
-                tipo_empresa = EXCLUDED.tipo_empresa,
-                estado_actual = EXCLUDED.estado_actual,
-                fecha_constitucion = EXCLUDED.fecha_constitucion,
-                telefono_contacto = EXCLUDED.telefono_contacto,
-                extension = EXCLUDED.extension,
-                direccion_fisica = EXCLUDED.direccion_fisica,
-                municipio_cod = EXCLUDED.municipio_cod;
-        """
-        
-        success_count = 0
-        skipped_count = 0
-        
-        for row in output_data:
+            # One round trip per page for the whole chunk; only if the database still
+            # refuses something do we fall back to isolating rows
+            cur.execute("SAVEPOINT empresa_chunk;")
             try:
-                cur.execute(insert_query, row)
-                success_count += 1
-            except psycopg2.IntegrityError as e:
-                conn.rollback() # Important: rollback the failed transaction part
-                print(f"⚠️ Skipping duplicate/invalid row ID={row[0]} NIT={row[1]}: {e}")
-                skipped_count += 1
-                continue
-            except Exception as e:
-                conn.rollback()
-                print(f"❌ Error on row ID={row[0]}: {e}")
-                continue
-                
-        conn.commit()
+                psycopg2.extras.execute_batch(cur, insert_query, output_data, page_size=1000)
+                cur.execute("RELEASE SAVEPOINT empresa_chunk;")
+                success_count += len(output_data)
+            except psycopg2.Error as e:
+                cur.execute("ROLLBACK TO SAVEPOINT empresa_chunk;")
+                print(f"⚠️ Batch failed ({e.__class__.__name__}), retrying chunk row by row...")
+                inserted, db_rejects = insert_rows_individually(cur, insert_query, output_data, row_numbers)
+                write_rejects(cur, db_rejects)
+                success_count += inserted
+                skipped_count += len(db_rejects)
+                validation_stats.setdefault('error_bd', {'severidad': 'rechazar', 'evaluadas': 0, 'fallidas': 0})
+                validation_stats['error_bd']['evaluadas'] += len(output_data)
+                validation_stats['error_bd']['fallidas'] += len(db_rejects)
+                    
+            # Commit per chunk: a failure only ever rolls back the current chunk
+            conn.commit()
+            print(f"   Read {rows_read} rows. Peak RSS: {peak_rss_mb():.0f} MB")
         
-        print(f"🏁 DONE! Inserted/Updated {success_count} companies. Skipped {skipped_count} due to errors.")
+        record_summary(cur, SOURCE_NAME, validation_stats)
+        refresh_company_counters(cur)
+        refresh_company_timeline(cur)
+        conn.commit()
+        print_summary(SOURCE_NAME, validation_stats)
+        print(f"🏁 DONE! Inserted/Updated {success_count} companies. Skipped {skipped_count} (see validation_rejects).")
         
     except Exception as e:
         print(f"❌ Error: {e}")
         conn.rollback()
-    
-    cur.close()
-    conn.close()
+        raise  # Non-zero exit, so run_pipeline.py records the stage as FAILED
+    finally:
+        cur.close()
+        conn.close()
 
 if __name__ == "__main__":
     # Need extras for execute_batch
     import psycopg2.extras 
     if os.path.exists(INPUT_FILE):
         load_empresas()
+        print(f"📈 Peak RSS: {peak_rss_mb():.0f} MB")
     else:
         print(f"❌ File not found: {INPUT_FILE}")
+        sys.exit(1)
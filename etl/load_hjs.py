@@ -1,9 +1,12 @@
 import pandas as pd
 import psycopg2
 import os
+import sys
 import time
-import unicodedata
-import re
+from excel_cache import read_sheet
+from personas import ensure_personas, refresh_persons
+from geo_resolver import resolve_municipalities, normalize_name
+from search_index import ensure_search_columns
 
 # Configuration
 INPUT_FILE = '/app/data/data/BD_completa_HJS.xlsx'
@@ -29,54 +32,24 @@ def get_db_connection():
             retries -= 1
     raise Exception("DB Connection failed")
 
-def normalize_text(text):
-    if pd.isna(text):
-        return None
-    text = str(text).strip().upper()
-    # Remove accents
-    text = ''.join(c for c in unicodedata.normalize('NFD', text) if unicodedata.category(c) != 'Mn')
-    return text
-
 def load_hjs():
     conn = get_db_connection()
     cur = conn.cursor()
     
     print("🚀 Preparing HJS Contact load...")
     
-    # 1. Fetch Municipality Mapping from Divipole
-    # We want a map: NORMALIZED_NAME -> (COD_DEPTO, COD_MUNI)
-    # Warning: Duplicates exist (e.g. San Francisco in many Depts).
-    # Heuristic: We'll store all matches. If ambiguous, we might rely on a default context (e.g. Santander) 
-    # or just take the first one if the user didn't specify. Given the data sample (Bucaramanga), it's likely Santander focused.
-    # Let's prioritise Santander (68) if duplicates exist? Or just load what we find.
-    
-    print("🌍 Building Municipality Lookup...")
-    cur.execute("SELECT DISTINCT cod_departamento, cod_municipio, nom_municipio FROM dim_divipole")
-    
-    muni_lookup = {}
-    
-    for row in cur.fetchall():
-        c_dept, c_muni, name = row
-        if not name: 
-            continue
-        norm_name = normalize_text(name)
-        
-        # Simple Logic: If collision, keep existing? Or List?
-        # Let's just overwrite. Most capital cities are unique or dominant.
-        # Ideally we'd warn on collisions.
-        if norm_name not in muni_lookup:
-            muni_lookup[norm_name] = (c_dept, c_muni)
-        else:
-            # Collision handling (Optional optimization)
-            pass 
-            
-    print(f"   Loaded {len(muni_lookup)} municipalities for lookup.")
-
     print(f"📂 Reading {INPUT_FILE}...")
     try:
         # Columns in Excel: cc, nombrecompleto, contacto, direccion, barrio, municipio, grupo
-        df = pd.read_excel(INPUT_FILE, dtype=str)
+        df = read_sheet(INPUT_FILE)
         print(f"   Rows found: {len(df)}")
+
+        # 1. Resolve each distinct municipality text once (exact, then trigram match
+        # against dim_divipole); results persist in resolucion_municipios
+        muni_texts = df['municipio'].dropna().unique() if 'municipio' in df.columns else []
+        muni_lookup = resolve_municipalities(cur, muni_texts)
+        ensure_search_columns(cur, 'contactos_hjs')
+        conn.commit()
         
         # Prepare Data
         insert_query = """
@@ -114,11 +87,12 @@ def load_hjs():
             # Resolve Geo
             c_dept = None
             c_muni = None
-            norm_muni = normalize_text(muni_text)
+            norm_muni = normalize_name(muni_text)
             
             if norm_muni and norm_muni in muni_lookup:
                 c_dept, c_muni = muni_lookup[norm_muni]
-                resolved_geo += 1
+                if c_muni:
+                    resolved_geo += 1
             
             data_to_insert.append((
                 cc,
@@ -142,15 +116,20 @@ def load_hjs():
             psycopg2.extras.execute_batch(cur, insert_query, data_to_insert)
             conn.commit()
             processed += len(data_to_insert)
+
+        ensure_personas(cur)
+        refresh_persons(cur, 'contactos_hjs')
+        conn.commit()
             
         print(f"🏁 DONE! Loaded {processed} contacts. Resolved Municipality for {resolved_geo} records.")
         
     except Exception as e:
         print(f"❌ Error: {e}")
         conn.rollback()
-    
-    cur.close()
-    conn.close()
+        raise  # Non-zero exit, so run_pipeline.py records the stage as FAILED
+    finally:
+        cur.close()
+        conn.close()
 
 if __name__ == "__main__":
     import psycopg2.extras
@@ -158,3 +137,4 @@ if __name__ == "__main__":
         load_hjs()
     else:
         print(f"❌ File not found: {INPUT_FILE}")
+        sys.exit(1)
@@ -7,7 +7,7 @@ import sys
 import traceback
 
 # Configuration
-INPUT_FILE = '/app/data/data/relaciones_persona_grupo.csv'
+INPUT_FILE = '/app/data/data/relaciones_persona_grupo.parquet' # Written by generar_dim_grupos.py
 LOG_FILE = '/app/data/error_rel.log'
 DB_HOST = os.getenv("DB_HOST", "db")
 DB_NAME = os.getenv("DB_NAME", "postgres")
@@ -48,7 +48,7 @@ def load_relaciones():
         msg = f"❌ File not found: {INPUT_FILE}"
         print(msg)
         log_to_file(msg)
-        return
+        sys.exit(1)
 
     conn = get_db_connection()
     cur = conn.cursor()
@@ -61,16 +61,6 @@ def load_relaciones():
         print(f"   Mapped {len(group_map)} groups.")
         log_to_file(f"Mapped {len(group_map)} groups.")
         
-        print(f"📂 Reading {INPUT_FILE}...")
-        df = pd.read_csv(INPUT_FILE, dtype=str)
-        print(f"   Rows: {len(df)}")
-        log_to_file(f"CSV Rows: {len(df)}")
-        
-        insert_query = """
-            INSERT INTO rel_contacto_grupo (documento, grupo_id)
-            VALUES (%s, %s)
-        """
-        
         # 2. Cache Valid Documents
         print("🔍 Caching Valid Documents...")
         cur.execute("SELECT documento FROM contactos_hjs")
@@ -79,9 +69,9 @@ def load_relaciones():
         log_to_file(f"Mapped {len(valid_docs)} valid documents.")
 
         print(f"📂 Reading {INPUT_FILE}...")
-        df = pd.read_csv(INPUT_FILE, dtype=str)
+        df = pd.read_parquet(INPUT_FILE)
         print(f"   Rows: {len(df)}")
-        log_to_file(f"CSV Rows: {len(df)}")
+        log_to_file(f"Parquet Rows: {len(df)}")
         
         insert_query = """
             INSERT INTO rel_contacto_grupo (documento, grupo_id)
@@ -129,6 +119,7 @@ def load_relaciones():
         print(err_msg)
         log_to_file(err_msg)
         conn.rollback()
+        raise
     finally:
         cur.close()
         conn.close()
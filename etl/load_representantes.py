@@ -1,10 +1,18 @@
 import pandas as pd
 import psycopg2
 import os
+import sys
 import time
+from csv_stream import iter_csv_chunks, peak_rss_mb, MEMORY_BUDGET_MB
+from validation import (
+    ensure_validation_tables, validate_chunk,
+    clear_rejects, write_rejects, record_summary, print_summary
+)
+from personas import ensure_personas, refresh_persons
 
 # Configuration
 INPUT_FILE = '/app/data/data/REP_LEGAL_EMPRESA.csv'
+SOURCE_NAME = 'REP_LEGAL_EMPRESA.csv'
 DB_HOST = os.getenv("DB_HOST", "db")
 DB_NAME = os.getenv("DB_NAME", "postgres")
 DB_USER = os.getenv("DB_USER", "postgres")
@@ -32,17 +40,14 @@ def load_representantes():
     cur = conn.cursor()
     
     print("🚀 Preparing Legal Representatives load...")
-    print(f"📂 Reading {INPUT_FILE}...")
+    print(f"📂 Reading {INPUT_FILE} in chunks (memory budget {MEMORY_BUDGET_MB} MB)...")
     
     try:
         # Check if file exists
         if not os.path.exists(INPUT_FILE):
              print(f"❌ File not found: {INPUT_FILE}")
-             return
+             sys.exit(1)
 
-        df = pd.read_csv(INPUT_FILE, sep=';', quotechar='"', dtype=str)
-        print(f"   Rows found: {len(df)}")
-        
         # Columns in CSV: 
         # "company_contact_id";"name";"company_role";"phone_number";"phone_extension";
         # "mobile_number";"email";"created_time";"discarted_time";"company_id";"document"
@@ -66,51 +71,69 @@ def load_representantes():
         valid_companies = set(row[0] for row in cur.fetchall())
         print(f"   Key Cache: {len(valid_companies)} companies found.")
         
-        skipped_fk = 0
+        ensure_validation_tables(cur)
+        clear_rejects(cur, SOURCE_NAME)
+        context = {'empresas': valid_companies}
+        validation_stats = {}
+        skipped = 0
+        rows_read = 0
         
-        for index, row in df.iterrows():
-            emp_id = row['company_id']
+        # Streamed in bounded chunks so memory stays flat regardless of file size
+        for df in iter_csv_chunks(INPUT_FILE):
+            # FK and format checks run over the whole chunk ('empresa_existe' rejects
+            # rows whose company is unknown); every failure lands in validation_rejects
+            keep, rejects = validate_chunk(
+                df, SOURCE_NAME, context, row_offset=rows_read,
+                key_column='company_contact_id', stats=validation_stats
+            )
+            write_rejects(cur, rejects)
+            skipped += int((~keep).sum())
+            rows_read += len(df)
             
-            # FK Validation
-            if emp_id not in valid_companies:
-                skipped_fk += 1
-                continue
+            for index, row in df[keep].iterrows():
+                emp_id = row['company_id']
                 
-            data_to_insert.append((
-                row['company_contact_id'],
-                row['name'],
-                row['company_role'],
-                str(row['phone_number'])[:50] if pd.notnull(row['phone_number']) else None,
-                str(row['phone_extension'])[:20] if pd.notnull(row['phone_extension']) else None,
-                str(row['mobile_number'])[:50] if pd.notnull(row['mobile_number']) else None,
-                row['email'],
-                emp_id,
-                row.get('document', None), # CSV might handle document differently or missing
-                row['created_time'],
-                row['discarted_time'] if pd.notnull(row['discarted_time']) else None
-            ))
+                data_to_insert.append((
+                    row['company_contact_id'],
+                    row['name'],
+                    row['company_role'],
+                    str(row['phone_number'])[:50] if pd.notnull(row['phone_number']) else None,
+                    str(row['phone_extension'])[:20] if pd.notnull(row['phone_extension']) else None,
+                    str(row['mobile_number'])[:50] if pd.notnull(row['mobile_number']) else None,
+                    row['email'],
+                    emp_id,
+                    row.get('document', None), # CSV might handle document differently or missing
+                    row['created_time'],
+                    row['discarted_time'] if pd.notnull(row['discarted_time']) else None
+                ))
             
-            if len(data_to_insert) >= batch_size:
-                psycopg2.extras.execute_batch(cur, insert_query, data_to_insert)
-                conn.commit()
-                count += len(data_to_insert)
-                data_to_insert = []
-                print(f"   Saved {count} representatives...")
+                if len(data_to_insert) >= batch_size:
+                    psycopg2.extras.execute_batch(cur, insert_query, data_to_insert)
+                    conn.commit()
+                    count += len(data_to_insert)
+                    data_to_insert = []
+                    print(f"   Saved {count} representatives... Peak RSS: {peak_rss_mb():.0f} MB")
 
         if data_to_insert:
             psycopg2.extras.execute_batch(cur, insert_query, data_to_insert)
-            conn.commit()
             count += len(data_to_insert)
+        record_summary(cur, SOURCE_NAME, validation_stats)
+        ensure_personas(cur)
+        refresh_persons(cur, 'representantes_legales_contacto')
+        conn.commit()
+        print_summary(SOURCE_NAME, validation_stats)
             
-        print(f"🏁 DONE! Loaded {count} representatives. Skipped {skipped_fk} due to missing company FK.")
+        print(f"🏁 DONE! Loaded {count} representatives. Skipped {skipped} invalid rows (see validation_rejects).")
         
     except Exception as e:
         print(f"❌ Error: {e}")
         conn.rollback()
-    
-    cur.close()
-    conn.close()
+        raise  # Non-zero exit, so run_pipeline.py records the stage as FAILED
+    finally:
+        cur.close()
+        conn.close()
 
 if __name__ == "__main__":
     import psycopg2.extras
     load_representantes()
+    print(f"📈 Peak RSS: {peak_rss_mb():.0f} MB")
@@ -1,12 +1,23 @@
 import pandas as pd
 import psycopg2
 import os
+import sys
 import time
 import re
+import hashlib
+import numpy as np
+import psycopg2.extras
+from concurrent.futures import ProcessPoolExecutor
+from excel_cache import sheet_names, read_sheet, find_header_row
+from geo_resolver import resolve_municipalities, normalize_name
+from leader_scorecard import refresh_leader_scorecard
 
 # Configuration
 INPUT_FILE = '/app/data/data/SEGUIMIENTO A LIDERES CAMPAÑA HJS 2023.xlsx'
 LOG_FILE = '/app/data/processing.log'
+MAX_WORKERS = int(os.getenv("ETL_WORKERS", os.cpu_count() or 1))
+# Municipality of the campaign's comunas, for leaders whose row has a comuna but no municipality
+LEADERS_MUNICIPIO = os.getenv("LEADERS_MUNICIPIO", "BUCARAMANGA")
 DB_HOST = os.getenv("DB_HOST", "db")
 DB_NAME = os.getenv("DB_NAME", "postgres")
 DB_USER = os.getenv("DB_USER", "postgres")
@@ -37,15 +48,180 @@ def get_db_connection():
             retries -= 1
     raise Exception("DB Connection failed")
 
-def clean_int(val):
-    if pd.isna(val) or val == 'NO' or str(val).strip() == '-' or str(val).lower() == 'nan':
-        return 0
-    try:
-        val_str = str(val).replace(',','').replace('.0', '').strip()
-        if not val_str: return 0
-        return int(float(val_str))
-    except:
+def clean_int(values):
+    # Vectorized over a column: '-', 'NO', blanks and unparsable values become 0
+    if values is None:
         return 0
+    val_str = values.astype(str).str.replace(',', '', regex=False).str.replace('.0', '', regex=False).str.strip()
+    nums = pd.to_numeric(val_str, errors='coerce').to_numpy(dtype=float)
+    nums[~np.isfinite(nums)] = 0
+    return np.trunc(nums).astype(int)
+
+# Header names tried in order for each field, per sheet type
+CANDIDATE_NAME_COLS = ['CANDIDATO', 'NOMBRE', 'NOMBRE CANDIDATO', 'CANDIDATOS', 'NOMBRES Y APELLIDOS', 'NOMBRES']
+CANDIDATE_NAME_EXCLUDE = ['CANDIDATO', 'NOMBRE', 'NAN', 'NOMBRES Y APELLIDOS']
+CANDIDATE_FIELDS = {
+    'voto_estimado': (['VOTOS OBTENIDOS', 'VOTOS'], True),
+    'publicidad_compartida': (['PUBLICIDAD COMPARTIDA', 'PUBLICIDAD'], False),
+    'hojas_vida_entregadas': (['HOJAS DE VIDA', 'HOJAS'], True),
+    'verificado': (['VERIFICADO'], False),
+    'damas_gratis': (['NUMERO DE BOLETAS DAMAS GRATIS', 'DAMAS GRATIS', 'DAMAS'], True),
+    'boletas_bingo': (['NUMERO DE BOLETAS BINGO', 'BOLETAS BINGO', 'BINGO', 'NUMERO DE BOLETAS'], True),
+    'pendones_entregados': (['PENDONES'], True),
+    'reunion_info': (['REUNIÓN', 'REUNION'], False),
+}
+
+LEADER_NAME_COLS = ['LIDER', 'NOMBRE', 'NOMBRE LIDER', 'LÍDER', 'LIDERES', 'NOMBRES Y APELLIDOS', 'NOMBRES']
+LEADER_NAME_EXCLUDE = ['LIDER', 'NOMBRE', 'NAN', 'NOMBRES Y APELLIDOS', 'LIDERES', 'LÍDERES']
+LEADER_FIELDS = {
+    'meta_votos': (['VOTOS OBTENIDOS', 'META', 'VOTOS'], True),
+    'verificado': (['VERIFICADO'], False),
+    'hojas_vida_entregadas': (['HOJAS DE VIDA', 'HOJAS'], True),
+    'boletas_bingo': (['NUMERO DE BOLETAS BINGO', 'BINGO'], True),
+    'damas_gratis': (['NUMERO DE BOLETAS DAMAS GRATIS', 'DAMAS'], True),
+    'pendones': (['PENDONES'], True),
+    'reunion_info': (['REUNIÓN', 'REUNION'], False),
+    'comuna': (['COMUNA'], False),
+    'municipio': (['MUNICIPIO', 'CIUDAD'], False),
+}
+
+def resolve_columns(columns, fields):
+    """Maps each field to the first of its candidate headers present in the sheet (or None)."""
+    return {
+        field: next((c for c in candidates if c in columns), None)
+        for field, (candidates, _) in fields.items()
+    }
+
+def parse_sheet(sheet, kind):
+    """Parses one tracking sheet into a DataFrame of DB rows. Runs in a worker process."""
+    messages = []
+    if kind == 'candidates':
+        first_terms, second_terms = ['CANDIDATO', 'NOMBRE'], ['VOTOS', 'PUBLICIDAD', 'COMUNA']
+        name_cols, name_exclude, fields = CANDIDATE_NAME_COLS, CANDIDATE_NAME_EXCLUDE, CANDIDATE_FIELDS
+    else:
+        first_terms, second_terms = ['LIDER', 'NOMBRE'], ['VOTOS', 'META', 'COMUNA']
+        name_cols, name_exclude, fields = LEADER_NAME_COLS, LEADER_NAME_EXCLUDE, LEADER_FIELDS
+
+    header_row_idx = find_header_row(INPUT_FILE, sheet, first_terms, second_terms)
+    if header_row_idx is None:
+        messages.append(f"   ⚠️ Could not find header row in {sheet}, trying default 0")
+        header_row_idx = 0
+    else:
+        messages.append(f"   Found header at row {header_row_idx}")
+
+    df = read_sheet(INPUT_FILE, sheet, header=header_row_idx)
+    df.columns = [str(c).upper().strip() for c in df.columns]
+    messages.append(f"   Columns: {df.columns.tolist()}")
+
+    # Name: first name column holding a value that isn't a repeated header
+    name = pd.Series(np.nan, index=df.index, dtype=object)
+    for col in name_cols:
+        if col in df.columns:
+            val = df[col].iloc[:, 0] if isinstance(df[col], pd.DataFrame) else df[col]
+            val = val.str.strip()
+            name = name.fillna(val.where(~val.str.upper().isin(name_exclude)))
+
+    out = pd.DataFrame({'nombre': name})
+    for field, col in resolve_columns(df.columns, fields).items():
+        values = df[col] if col else None
+        if isinstance(values, pd.DataFrame):
+            values = values.iloc[:, 0]
+        if fields[field][1]:
+            out[field] = clean_int(values)
+        else:
+            out[field] = values.where(values.notna(), None) if values is not None else None
+
+    if 'comuna' in out.columns:
+        # Comuna numbers come back from Excel as floats ('14.0')
+        out['comuna'] = out['comuna'].map(lambda v: None if pd.isna(v) else re.sub(r'\.0$', '', str(v).strip()) or None)
+
+    out = out[out['nombre'].notna() & (out['nombre'] != '')]
+    # Plain Python values (None instead of NaN) for psycopg2
+    return out.astype(object).where(out.notna(), None), messages
+
+CANDIDATE_COLUMNS = [
+    'nombre_candidato', 'partido', 'voto_estimado', 'publicidad_compartida',
+    'hojas_vida_entregadas', 'verificado', 'damas_gratis', 'boletas_bingo',
+    'pendones_entregados', 'reunion_info',
+]
+LEADER_COLUMNS = [
+    'nombre_completo', 'hoja_origen', 'meta_votos', 'verificado',
+    'hojas_vida_entregadas', 'boletas_bingo', 'damas_gratis',
+    'pendones', 'reunion_info', 'comuna', 'cod_municipio',
+]
+
+def assign_leader_geo(cur, df):
+    """Fills cod_municipio with the 5-digit DIVIPOLE code of each leader's municipality:
+    the sheet's municipality column when it has one, else LEADERS_MUNICIPIO for leaders
+    with a comuna (comunas are subdivisions of a single municipality)."""
+    texts = df['municipio'] if 'municipio' in df.columns else pd.Series(None, index=df.index, dtype=object)
+    if LEADERS_MUNICIPIO and 'comuna' in df.columns:
+        texts = texts.where(texts.notna() | df['comuna'].isna(), LEADERS_MUNICIPIO)
+    lookup = resolve_municipalities(cur, texts.dropna().unique())
+
+    def code(text):
+        c_dept, c_muni = lookup.get(normalize_name(text), (None, None))
+        return c_dept + c_muni if c_dept and c_muni else None
+
+    df['cod_municipio'] = texts.map(code)
+    log(f"   🧭 Municipality resolved for {df['cod_municipio'].notna().sum()}/{len(df)} leaders")
+    return df.drop(columns=['municipio'], errors='ignore')
+
+def ensure_sync_columns(cur):
+    # Same columns as database/ddl.sql, for databases created before they existed
+    cur.execute("ALTER TABLE lideres_campana ADD COLUMN IF NOT EXISTS hoja_origen VARCHAR(100);")
+    for table in ('candidatos_gestion', 'lideres_campana'):
+        cur.execute(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS clave_natural VARCHAR(400);")
+        cur.execute(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS row_hash CHAR(32);")
+        cur.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS uq_{table}_clave ON {table} (clave_natural);")
+
+def add_sync_keys(df, name_col, sheet_col, columns):
+    """Natural key (sheet + name, numbered when a name repeats in a sheet) and a content hash per row."""
+    occurrence = df.groupby([sheet_col, name_col]).cumcount()
+    df['clave_natural'] = df[sheet_col] + '|' + df[name_col]
+    repeated = occurrence > 0
+    df.loc[repeated, 'clave_natural'] += '#' + (occurrence[repeated] + 1).astype(str)
+    df['row_hash'] = [
+        hashlib.md5('\x1f'.join('' if v is None else str(v) for v in row).encode('utf-8')).hexdigest()
+        for row in df[columns].itertuples(index=False)
+    ]
+    return df
+
+def sync_table(cur, table, columns, df):
+    """Applies only the inserts/updates/deletes needed to make `table` match `df`.
+    Runs inside the caller's transaction, so readers keep the previous version until commit."""
+    cols = columns + ['clave_natural', 'row_hash']
+    cur.execute(f"CREATE TEMP TABLE stg_{table} ON COMMIT DROP AS SELECT {', '.join(cols)} FROM {table} WITH NO DATA;")
+    psycopg2.extras.execute_values(
+        cur,
+        f"INSERT INTO stg_{table} ({', '.join(cols)}) VALUES %s",
+        [tuple(r) for r in df[cols].itertuples(index=False)],
+        page_size=1000
+    )
+
+    # Rows loaded before keys existed (clave_natural NULL) are replaced as well
+    cur.execute(f"""
+        DELETE FROM {table} t
+        WHERE t.clave_natural IS NULL
+           OR NOT EXISTS (SELECT 1 FROM stg_{table} s WHERE s.clave_natural = t.clave_natural);
+    """)
+    deleted = cur.rowcount
+
+    cur.execute(f"""
+        UPDATE {table} t SET {', '.join(f"{c} = s.{c}" for c in columns)}, row_hash = s.row_hash
+        FROM stg_{table} s
+        WHERE t.clave_natural = s.clave_natural AND t.row_hash IS DISTINCT FROM s.row_hash;
+    """)
+    updated = cur.rowcount
+
+    cur.execute(f"""
+        INSERT INTO {table} ({', '.join(cols)})
+        SELECT {', '.join(cols)} FROM stg_{table} s
+        WHERE NOT EXISTS (SELECT 1 FROM {table} t WHERE t.clave_natural = s.clave_natural);
+    """)
+    inserted = cur.rowcount
+
+    return inserted, updated, deleted, len(df) - inserted - updated
 
 def load_tracking():
     # Clear log
@@ -54,148 +230,58 @@ def load_tracking():
         
     conn = get_db_connection()
     cur = conn.cursor()
-    # TRUNCATE to avoid dupes on re-run
-    log("🗑️ Truncating tables...")
-    cur.execute("TRUNCATE TABLE candidatos_gestion CASCADE;")
-    cur.execute("TRUNCATE TABLE lideres_campana CASCADE;")
+    ensure_sync_columns(cur)
+    conn.commit()
     
     log(f"📂 Reading {INPUT_FILE}...")
     
     try:
-        xl = pd.ExcelFile(INPUT_FILE)
-        log(f"   Sheets found: {xl.sheet_names}")
-        
-        # 1. Process Candidates
-        candidate_sheets = [s for s in xl.sheet_names if "Candidatos" in s or "Otros partidos" in s]
+        # Sheets are parsed once into the shared columnar cache; header sniffing is cached too
+        sheets = sheet_names(INPUT_FILE)
+        log(f"   Sheets found: {sheets}")
         
-        insert_cand_query = """
-            INSERT INTO candidatos_gestion (
-                nombre_candidato, partido, voto_estimado, publicidad_compartida,
-                hojas_vida_entregadas, verificado, damas_gratis, boletas_bingo,
-                pendones_entregados, reunion_info
-            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-        """
-        
-        cand_count = 0
+        candidate_sheets = [s for s in sheets if "Candidatos" in s or "Otros partidos" in s]
+        leader_sheet = next((s for s in sheets if "LIDERES" in s.upper() or "LÍDERES" in s.upper()), None)
+
+        # Parse every sheet concurrently
+        jobs = [(s, 'candidates') for s in candidate_sheets]
+        if leader_sheet:
+            jobs.append((leader_sheet, 'leaders'))
+        with ProcessPoolExecutor(max_workers=MAX_WORKERS) as pool:
+            futures = [pool.submit(parse_sheet, sheet, kind) for sheet, kind in jobs]
+            parsed = {job: future.result() for job, future in zip(jobs, futures)}
+
+        # 1. Candidates
+        cand_frames = []
         for sheet in candidate_sheets:
             log(f"👉 Processing Candidates Sheet: {sheet}")
-            df_raw = pd.read_excel(xl, sheet, header=None, nrows=10, dtype=str)
-            
-            header_row_idx = None
-            for idx, row in df_raw.iterrows():
-                row_str = " ".join([str(x).upper() for x in row.values])
-                if ("CANDIDATO" in row_str or "NOMBRE" in row_str) and ("VOTOS" in row_str or "PUBLICIDAD" in row_str or "COMUNA" in row_str):
-                     header_row_idx = idx
-                     break
-            
-            if header_row_idx is None:
-                log(f"   ⚠️ Could not find header row in {sheet}, trying default 0")
-                header_row_idx = 0
-            else:
-                 log(f"   Found header at row {header_row_idx}")
-
-            df = pd.read_excel(xl, sheet, header=header_row_idx, dtype=str)
-            df.columns = [str(c).upper().strip() for c in df.columns]
-            log(f"   Columns: {df.columns.tolist()}")
-            
-            for idx, row in df.iterrows():
-                name = None
-                for col in ['CANDIDATO', 'NOMBRE', 'NOMBRE CANDIDATO', 'CANDIDATOS', 'NOMBRES Y APELLIDOS', 'NOMBRES']:
-                    if col in df.columns and pd.notna(row[col]):
-                         val = str(row[col]).strip()
-                         if val.upper() not in ['CANDIDATO', 'NOMBRE', 'NAN', 'NOMBRES Y APELLIDOS']:
-                            name = val
-                            break
-                
-                if not name: continue
-                
-                def get_val(possible_cols):
-                    for c in possible_cols:
-                        if c in df.columns:
-                            return row[c]
-                    return None
-
-                votos = clean_int(get_val(['VOTOS OBTENIDOS', 'VOTOS']))
-                pub = get_val(['PUBLICIDAD COMPARTIDA', 'PUBLICIDAD'])
-                hv = clean_int(get_val(['HOJAS DE VIDA', 'HOJAS']))
-                verif = get_val(['VERIFICADO'])
-                damas = clean_int(get_val(['NUMERO DE BOLETAS DAMAS GRATIS', 'DAMAS GRATIS', 'DAMAS']))
-                bingo = clean_int(get_val(['NUMERO DE BOLETAS BINGO', 'BOLETAS BINGO', 'BINGO', 'NUMERO DE BOLETAS']))
-                pend = clean_int(get_val(['PENDONES']))
-                reunion = get_val(['REUNIÓN', 'REUNION'])
-                
-                cur.execute(insert_cand_query, (
-                    name, sheet, votos, pub, hv, verif, damas, bingo, pend, reunion
-                ))
-                cand_count += 1
-                
-        log(f"✅ Loaded {cand_count} candidates.")
-        
-        # 2. Process Leaders
-        leader_sheet = next((s for s in xl.sheet_names if "LIDERES" in s.upper() or "LÍDERES" in s.upper()), None)
+            df, messages = parsed[(sheet, 'candidates')]
+            for m in messages:
+                log(m)
+            cand_frames.append(df.rename(columns={'nombre': 'nombre_candidato'}).assign(partido=sheet))
+
+        cand_df = pd.concat(cand_frames, ignore_index=True) if cand_frames else pd.DataFrame(columns=CANDIDATE_COLUMNS)
+        cand_df = add_sync_keys(cand_df, 'nombre_candidato', 'partido', CANDIDATE_COLUMNS)
         
+        # 2. Leaders
         if leader_sheet:
             log(f"👉 Processing Leaders Sheet: {leader_sheet}")
-            
-            df_raw_l = pd.read_excel(xl, leader_sheet, header=None, nrows=10, dtype=str)
-            header_row_idx_l = None
-            for idx, row in df_raw_l.iterrows():
-                row_str = " ".join([str(x).upper() for x in row.values])
-                if ("LIDER" in row_str or "NOMBRE" in row_str) and ("VOTOS" in row_str or "META" in row_str or "COMUNA" in row_str):
-                     header_row_idx_l = idx
-                     break
-            
-            if header_row_idx_l is None:
-                 log(f"   ⚠️ Could not find header row for Leaders, trying default 0")
-                 header_row_idx_l = 0
-            else:
-                 log(f"   Found Leaders header at row {header_row_idx_l}")
-            
-            df_lid = pd.read_excel(xl, leader_sheet, header=header_row_idx_l, dtype=str)
-            df_lid.columns = [str(c).upper().strip() for c in df_lid.columns]
-            log(f"   Columns: {df_lid.columns.tolist()}")
-            
-            insert_lid_query = """
-                INSERT INTO lideres_campana (
-                    nombre_completo, meta_votos, verificado,
-                    hojas_vida_entregadas, boletas_bingo, damas_gratis,
-                    pendones, reunion_info
-                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-            """
-            
-            lid_count = 0
-            for idx, row in df_lid.iterrows():
-                name = None
-                for col in ['LIDER', 'NOMBRE', 'NOMBRE LIDER', 'LÍDER', 'LIDERES', 'NOMBRES Y APELLIDOS', 'NOMBRES']:
-                    if col in df_lid.columns and pd.notna(row[col]):
-                        val = str(row[col]).strip()
-                        if val.upper() not in ['LIDER', 'NOMBRE', 'NAN', 'NOMBRES Y APELLIDOS', 'LIDERES', 'LÍDERES']:
-                            name = val
-                            break
-                
-                if not name: continue
-                
-                def get_val_l(possible_cols):
-                    for c in possible_cols:
-                        if c in df_lid.columns:
-                            return row[c]
-                    return None
-                
-                votos = clean_int(get_val_l(['VOTOS OBTENIDOS', 'META', 'VOTOS']))
-                verif = get_val_l(['VERIFICADO'])
-                hv = clean_int(get_val_l(['HOJAS DE VIDA', 'HOJAS']))
-                bingo = clean_int(get_val_l(['NUMERO DE BOLETAS BINGO', 'BINGO']))
-                damas = clean_int(get_val_l(['NUMERO DE BOLETAS DAMAS GRATIS', 'DAMAS']))
-                pend = clean_int(get_val_l(['PENDONES']))
-                reunion = get_val_l(['REUNIÓN', 'REUNION'])
-                
-                cur.execute(insert_lid_query, (
-                    name, votos, verif, hv, bingo, damas, pend, reunion
-                ))
-                lid_count += 1
-            log(f"✅ Loaded {lid_count} leaders.")
+            df_lid, messages = parsed[(leader_sheet, 'leaders')]
+            for m in messages:
+                log(m)
+            lid_df = df_lid.rename(columns={'nombre': 'nombre_completo'}).assign(hoja_origen=leader_sheet)
         else:
             log("⚠️ Leader sheet not found!")
+            lid_df = pd.DataFrame(columns=LEADER_COLUMNS)
+        lid_df = assign_leader_geo(cur, lid_df.reset_index(drop=True))
+        lid_df = add_sync_keys(lid_df, 'nombre_completo', 'hoja_origen', LEADER_COLUMNS)
+
+        # 3. Apply only the differences, both tables in one transaction
+        ins, upd, dele, same = sync_table(cur, 'candidatos_gestion', CANDIDATE_COLUMNS, cand_df)
+        log(f"✅ Candidates: {ins} inserted, {upd} updated, {dele} deleted, {same} unchanged.")
+        ins, upd, dele, same = sync_table(cur, 'lideres_campana', LEADER_COLUMNS, lid_df)
+        log(f"✅ Leaders: {ins} inserted, {upd} updated, {dele} deleted, {same} unchanged.")
+        refresh_leader_scorecard(cur)
             
         conn.commit()
         log("🏁 DONE! Tracking data loaded.")
@@ -203,12 +289,14 @@ def load_tracking():
     except Exception as e:
         log(f"❌ Error: {e}")
         conn.rollback()
-    
-    cur.close()
-    conn.close()
+        raise  # Non-zero exit, so run_pipeline.py records the stage as FAILED
+    finally:
+        cur.close()
+        conn.close()
 
 if __name__ == "__main__":
     if os.path.exists(INPUT_FILE):
         load_tracking()
     else:
         log(f"❌ File not found: {INPUT_FILE}")
+        sys.exit(1)
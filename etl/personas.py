@@ -0,0 +1,75 @@
+import time
+
+# Cross-source person index.
+# The same person shows up in several sources with documentos formatted differently
+# ('1.234.567', '1234567.0', '01234567'...). personas keys everyone on doc_key(documento),
+# the digits-only document as BIGINT, and keeps a bitmask of the sources containing them,
+# so overlap counts and per-person lookups are index hits instead of cross-table joins.
+SOURCE_FLAGS = {
+    'censo_electoral': 1,
+    'contactos_hjs': 2,
+    'empleados_empresas': 4,
+    'representantes_legales_contacto': 8,
+}
+
+# Loaders run in parallel under run_pipeline.py; refreshes are serialized so their
+# upserts on personas never interleave (and deadlock)
+LOCK_SQL = "SELECT pg_advisory_xact_lock(hashtext('personas'));"
+
+def ensure_personas(cur):
+    # Same definitions as database/ddl.sql, for databases created before they existed
+    cur.execute(LOCK_SQL)
+    cur.execute("""
+        CREATE OR REPLACE FUNCTION doc_key(doc TEXT) RETURNS BIGINT AS $$
+            SELECT CASE WHEN d ~ '^[0-9]{1,18}$' THEN d::BIGINT END
+            FROM (
+                SELECT regexp_replace(regexp_replace(btrim(doc), '\\.0$', ''), '[\\s.,-]', '', 'g') AS d
+            ) n
+        $$ LANGUAGE sql IMMUTABLE STRICT PARALLEL SAFE;
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS personas (
+            doc_key BIGINT PRIMARY KEY,
+            documento VARCHAR(20),
+            fuentes SMALLINT NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_personas_fuentes ON personas(fuentes);")
+    for table in SOURCE_FLAGS:
+        cur.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_doc_key ON {table} (doc_key(documento));")
+
+def refresh_persons(cur, table):
+    """Syncs the bit of `table` in personas with the documentos currently stored in it.
+    Returns (persons added to the source, persons removed from it)."""
+    flag = SOURCE_FLAGS[table]
+    start = time.time()
+    print(f"🧑 Refreshing person index for {table}...")
+    cur.execute(LOCK_SQL)
+
+    # Rows already carrying the bit are left untouched
+    cur.execute(f"""
+        INSERT INTO personas (doc_key, documento, fuentes)
+        SELECT doc_key(documento), MIN(documento), %s::SMALLINT
+        FROM {table}
+        WHERE doc_key(documento) IS NOT NULL
+        GROUP BY 1
+        ON CONFLICT (doc_key) DO UPDATE SET
+            fuentes = personas.fuentes | EXCLUDED.fuentes,
+            updated_at = CURRENT_TIMESTAMP
+        WHERE personas.fuentes & EXCLUDED.fuentes = 0;
+    """, (flag,))
+    added = cur.rowcount
+
+    cur.execute(f"""
+        UPDATE personas p SET
+            fuentes = p.fuentes & ~%s::SMALLINT,
+            updated_at = CURRENT_TIMESTAMP
+        WHERE p.fuentes & %s::SMALLINT <> 0
+          AND NOT EXISTS (SELECT 1 FROM {table} t WHERE doc_key(t.documento) = p.doc_key);
+    """, (flag, flag))
+    removed = cur.rowcount
+    cur.execute("DELETE FROM personas WHERE fuentes = 0;")
+
+    print(f"   ✅ {table}: +{added} / -{removed} persons ({time.time() - start:.1f}s)")
+    return added, removed
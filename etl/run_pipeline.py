@@ -0,0 +1,370 @@
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+import psycopg2
+
+# Configuration
+ETL_DIR = os.path.dirname(os.path.abspath(__file__))
+MAX_PARALLEL = int(os.getenv("PIPELINE_WORKERS", "3"))
+JOB_POLL_SECONDS = 10
+JOB_HEARTBEAT_SECONDS = 15
+JOB_STALE_SECONDS = 120  # Same as backend/jobs.py
+
+DB_HOST = os.getenv("DB_HOST", "db")
+DB_NAME = os.getenv("DB_NAME", "postgres")
+DB_USER = os.getenv("DB_USER", "postgres")
+DB_PASS = os.getenv("DB_PASS", "postgres")
+
+# Stage -> (script, upstream stages, table whose row count is recorded)
+STAGES = {
+    'extract_divipole':   ('extract_divipole.py',   [],                                     'dim_divipole'),
+    'load_censo':         ('load_censo.py',         ['extract_divipole'],                   'censo_electoral'),
+    'load_empresas':      ('load_empresas.py',      ['extract_divipole'],                   'core_empresas'),
+    'load_empleados':     ('load_empleados.py',     ['load_empresas'],                      'empleados_empresas'),
+    'load_representantes':('load_representantes.py',['load_empresas'],                     'representantes_legales_contacto'),
+    'load_hjs':           ('load_hjs.py',           ['extract_divipole'],                   'contactos_hjs'),
+    'generar_dim_grupos': ('generar_dim_grupos.py', [],                                     'dim_grupos'),
+    'load_relaciones':    ('load_relaciones.py',    ['generar_dim_grupos', 'load_hjs'],     'rel_contacto_grupo'),
+    'load_seguimiento':   ('load_seguimiento.py',   ['extract_divipole'],                   'lideres_campana'),
+    'build_geo_aggregates': ('build_geo_aggregates.py',
+                           ['extract_divipole', 'load_censo', 'load_hjs', 'load_empresas', 'load_empleados'],
+                                                                                            'agg_geo_municipio'),
+    'build_segments':     ('build_segments.py',
+                           ['load_censo', 'load_hjs', 'load_empleados', 'load_representantes', 'load_relaciones'],
+                                                                                            'segment_personas'),
+}
+
+def get_db_connection():
+    retries = 5
+    while retries > 0:
+        try:
+            conn = psycopg2.connect(
+                host=DB_HOST,
+                database=DB_NAME,
+                user=DB_USER,
+                password=DB_PASS
+            )
+            conn.autocommit = True
+            return conn
+        except psycopg2.OperationalError as e:
+            print(f"DB not ready, retrying... {e}")
+            time.sleep(5)
+            retries -= 1
+    raise Exception("DB Connection failed")
+
+def ensure_load_runs(cur):
+    # Same definition as database/ddl.sql, for databases created before it existed
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS load_runs (
+            load_run_id SERIAL PRIMARY KEY,
+            run_id VARCHAR(36) NOT NULL,
+            stage VARCHAR(50) NOT NULL,
+            status VARCHAR(20) NOT NULL,
+            target_table VARCHAR(100),
+            rows_before BIGINT,
+            rows_after BIGINT,
+            started_at TIMESTAMP,
+            finished_at TIMESTAMP,
+            duration_seconds NUMERIC(10, 2),
+            exit_code INTEGER
+        );
+    """)
+
+def ensure_jobs(cur):
+    # Same definition as database/ddl.sql, for databases created before it existed
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS jobs (
+            job_id BIGSERIAL PRIMARY KEY,
+            tipo VARCHAR(50) NOT NULL,
+            parametros JSONB DEFAULT '{}',
+            estado VARCHAR(20) NOT NULL DEFAULT 'pendiente',
+            progreso NUMERIC(5, 2) DEFAULT 0,
+            mensaje TEXT,
+            resultado JSONB,
+            intentos SMALLINT NOT NULL DEFAULT 0,
+            max_intentos SMALLINT NOT NULL DEFAULT 3,
+            worker VARCHAR(100),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            started_at TIMESTAMP,
+            heartbeat_at TIMESTAMP,
+            finished_at TIMESTAMP
+        );
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_jobs_pendientes ON jobs (tipo, job_id) WHERE estado = 'pendiente';")
+
+def count_rows(cur, table):
+    try:
+        cur.execute(f'SELECT COUNT(*) FROM "{table}"')
+        return cur.fetchone()[0]
+    except psycopg2.Error:
+        return None
+
+def with_upstream(stages):
+    selected = set()
+    pending = list(stages)
+    while pending:
+        stage = pending.pop()
+        if stage not in selected:
+            selected.add(stage)
+            pending.extend(STAGES[stage][1])
+    return selected
+
+def last_run_state(cur):
+    """Returns (run_id, stages that finished OK) for the most recent run."""
+    cur.execute("SELECT run_id FROM load_runs ORDER BY load_run_id DESC LIMIT 1")
+    row = cur.fetchone()
+    if not row:
+        return None, set()
+    run_id = row[0]
+    cur.execute("SELECT stage FROM load_runs WHERE run_id = %s AND status = 'OK'", (run_id,))
+    return run_id, {r[0] for r in cur.fetchall()}
+
+def run_stage(stage):
+    script = STAGES[stage][0]
+    start = time.time()
+    proc = subprocess.Popen(
+        [sys.executable, '-u', script],
+        cwd=ETL_DIR,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True,
+        encoding='utf-8',
+        errors='replace'
+    )
+    # Prefix output so concurrent stages stay readable
+    for line in proc.stdout:
+        print(f"[{stage}] {line.rstrip()}", flush=True)
+    return proc.wait(), time.time() - start
+
+def run_pipeline(selected, run_id, done, cancelled=None):
+    """cancelled: optional fn checked before starting stages; once it returns True no new
+    stage is started, the running ones are waited for and the rest recorded as CANCELLED."""
+    conn = get_db_connection()
+    cur = conn.cursor()
+    ensure_load_runs(cur)
+
+    pending = {s for s in selected if s not in done}
+    failed = set()
+    running = {}
+    stopped = False
+
+    print(f"🚀 Pipeline run {run_id}: {len(pending)} stages, up to {MAX_PARALLEL} in parallel")
+    if done:
+        print(f"   ⏭️ Already completed: {', '.join(sorted(done))}")
+
+    def record(stage, status, rows_before=None, rows_after=None, started=None, duration=None, exit_code=None):
+        cur.execute("""
+            INSERT INTO load_runs (
+                run_id, stage, status, target_table, rows_before, rows_after,
+                started_at, finished_at, duration_seconds, exit_code
+            ) VALUES (%s, %s, %s, %s, %s, %s, to_timestamp(%s), CURRENT_TIMESTAMP, %s, %s)
+        """, (
+            run_id, stage, status, STAGES[stage][2], rows_before, rows_after,
+            started, round(duration, 2) if duration is not None else None, exit_code
+        ))
+
+    with ThreadPoolExecutor(max_workers=MAX_PARALLEL) as pool:
+        while pending or running:
+            if pending and cancelled and not stopped and cancelled():
+                print(f"🛑 Run {run_id} cancelled: not starting {', '.join(sorted(pending))}")
+                stopped = True
+                for stage in sorted(pending):
+                    record(stage, 'CANCELLED')
+                failed |= pending
+                pending.clear()
+
+            # Downstream of a failure can never run
+            for stage in sorted(pending):
+                if any(dep in failed for dep in STAGES[stage][1]):
+                    print(f"⏭️ Skipping {stage}: upstream stage failed")
+                    record(stage, 'SKIPPED')
+                    pending.discard(stage)
+                    failed.add(stage)
+
+            # Upstream stages outside the selection are assumed already loaded
+            ready = [
+                s for s in sorted(pending)
+                if all(dep in done or dep not in selected for dep in STAGES[s][1])
+            ]
+            for stage in ready:
+                if len(running) >= MAX_PARALLEL:
+                    break
+                print(f"▶️ Starting {stage}")
+                rows_before = count_rows(cur, STAGES[stage][2])
+                future = pool.submit(run_stage, stage)
+                running[future] = (stage, rows_before, time.time())
+                pending.discard(stage)
+
+            if not running:
+                break
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                stage, rows_before, started = running.pop(future)
+                try:
+                    exit_code, duration = future.result()
+                except Exception as e:
+                    print(f"❌ {stage} could not be started: {e}")
+                    exit_code, duration = -1, time.time() - started
+                rows_after = count_rows(cur, STAGES[stage][2])
+                status = 'OK' if exit_code == 0 else 'FAILED'
+                record(stage, status, rows_before, rows_after, started, duration, exit_code)
+                if status == 'OK':
+                    done.add(stage)
+                    print(f"✅ {stage} finished in {duration:.1f}s ({STAGES[stage][2]}: {rows_before} -> {rows_after} rows)")
+                else:
+                    failed.add(stage)
+                    print(f"❌ {stage} failed with exit code {exit_code} after {duration:.1f}s")
+
+    cur.close()
+    conn.close()
+
+    if stopped:
+        print(f"🏁 Run {run_id} cancelled. Re-run with --resume to continue.")
+        return False
+    if failed:
+        print(f"🏁 Run {run_id} finished with failures: {', '.join(sorted(failed))}. Re-run with --resume to continue.")
+        return False
+    print(f"🏁 Run {run_id} completed successfully.")
+    return True
+
+def send_heartbeats(job_id, stop):
+    conn = get_db_connection()
+    cur = conn.cursor()
+    while not stop.wait(JOB_HEARTBEAT_SECONDS):
+        cur.execute("UPDATE jobs SET heartbeat_at = CURRENT_TIMESTAMP WHERE job_id = %s", (job_id,))
+    cur.close()
+    conn.close()
+
+def job_cancelled(cur, job_id):
+    # POST /api/jobs/{id}/cancel only flags the job; the worker checks between stages
+    cur.execute("SELECT estado FROM jobs WHERE job_id = %s", (job_id,))
+    row = cur.fetchone()
+    return row is not None and row[0] == 'cancelado'
+
+def run_worker():
+    """Runs 'pipeline' jobs submitted through the backend (POST /api/jobs), one at a time."""
+    conn = get_db_connection()
+    cur = conn.cursor()
+    ensure_jobs(cur)
+    ensure_load_runs(cur)
+    worker = f"{socket.gethostname()}:{os.getpid()}"
+
+    # Jobs left running by a worker that died
+    cur.execute(f"""
+        UPDATE jobs SET
+            estado = CASE WHEN intentos >= max_intentos THEN 'fallido' ELSE 'pendiente' END,
+            mensaje = 'Interrumpido: el proceso que lo ejecutaba se detuvo',
+            finished_at = CASE WHEN intentos >= max_intentos THEN CURRENT_TIMESTAMP END
+        WHERE estado = 'ejecutando' AND tipo = 'pipeline'
+          AND heartbeat_at < CURRENT_TIMESTAMP - INTERVAL '{JOB_STALE_SECONDS} seconds'
+    """)
+    print(f"👷 Pipeline worker {worker} waiting for jobs...")
+
+    while True:
+        cur.execute("""
+            UPDATE jobs SET
+                estado = 'ejecutando', worker = %s, intentos = intentos + 1,
+                started_at = CURRENT_TIMESTAMP, heartbeat_at = CURRENT_TIMESTAMP
+            WHERE job_id = (
+                SELECT job_id FROM jobs
+                WHERE estado = 'pendiente' AND tipo = 'pipeline'
+                ORDER BY job_id
+                FOR UPDATE SKIP LOCKED
+                LIMIT 1
+            )
+            RETURNING job_id, parametros
+        """, (worker,))
+        job = cur.fetchone()
+        if not job:
+            time.sleep(JOB_POLL_SECONDS)
+            continue
+
+        job_id, params = job[0], job[1] or {}
+        stages = params.get('stages') or list(STAGES)
+        unknown = [s for s in stages if s not in STAGES]
+        if unknown:
+            cur.execute("""
+                UPDATE jobs SET estado = 'fallido', mensaje = %s, finished_at = CURRENT_TIMESTAMP
+                WHERE job_id = %s
+            """, (f"Etapas desconocidas: {', '.join(unknown)}", job_id))
+            continue
+
+        selected = with_upstream(stages) if params.get('with_deps') else set(stages)
+        run_id = str(uuid.uuid4())
+        print(f"📥 Job {job_id}: stages {', '.join(sorted(selected))}")
+        cur.execute("UPDATE jobs SET mensaje = %s WHERE job_id = %s", (f"Ejecución {run_id}", job_id))
+
+        stop = threading.Event()
+        beats = threading.Thread(target=send_heartbeats, args=(job_id, stop), daemon=True)
+        beats.start()
+        try:
+            ok = run_pipeline(selected, run_id, set(), cancelled=lambda: job_cancelled(cur, job_id))
+        except Exception as e:
+            print(f"❌ Job {job_id}: {e}")
+            ok = False
+        finally:
+            stop.set()
+            beats.join()
+
+        # Per-stage outcome is in load_runs under run_id
+        cur.execute("""
+            UPDATE jobs SET
+                estado = CASE WHEN estado = 'cancelado' THEN 'cancelado' ELSE %s END,
+                progreso = CASE WHEN %s THEN 100 ELSE progreso END,
+                resultado = %s,
+                finished_at = CURRENT_TIMESTAMP
+            WHERE job_id = %s
+        """, ('completado' if ok else 'fallido', ok, json.dumps({'run_id': run_id, 'stages': sorted(selected)}), job_id))
+
+def main():
+    parser = argparse.ArgumentParser(description="Runs the HJS ETL scripts as a dependency-aware pipeline.")
+    parser.add_argument('stages', nargs='*', help="Stages to run (default: all). Upstream stages are not included unless --with-deps is given.")
+    parser.add_argument('--with-deps', action='store_true', help="Also run the upstream stages of the selected ones.")
+    parser.add_argument('--resume', action='store_true', help="Continue the last run, skipping the stages it completed.")
+    parser.add_argument('--list', action='store_true', help="Print the stages and their dependencies and exit.")
+    parser.add_argument('--worker', action='store_true', help="Keep running 'pipeline' jobs from the jobs table instead.")
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker()
+        return 0
+
+    if args.list:
+        for stage, (script, deps, table) in STAGES.items():
+            print(f"{stage:<20} -> {table:<32} after: {', '.join(deps) or '-'}")
+        return 0
+
+    unknown = [s for s in args.stages if s not in STAGES]
+    if unknown:
+        parser.error(f"unknown stages: {', '.join(unknown)}")
+
+    selected = set(args.stages or STAGES)
+    if args.with_deps:
+        selected = with_upstream(selected)
+
+    run_id, done = str(uuid.uuid4()), set()
+    if args.resume:
+        conn = get_db_connection()
+        cur = conn.cursor()
+        ensure_load_runs(cur)
+        last_id, last_done = last_run_state(cur)
+        cur.close()
+        conn.close()
+        if last_id:
+            run_id, done = last_id, last_done & selected
+        else:
+            print("⚠️ No previous run to resume, starting a new one.")
+
+    return 0 if run_pipeline(selected, run_id, done) else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
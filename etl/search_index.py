@@ -0,0 +1,57 @@
+import time
+
+# Normalized search columns behind /api/search.
+# Each searchable table gets nombre_busqueda, a stored generated column holding the name
+# upper-cased, without accents and with only letters/digits separated by single spaces,
+# so the database keeps it in sync on every insert/update. Two indexes serve it:
+#   - btree text_pattern_ops: "name starts with" (LIKE 'JUAN P%'), read in index order
+#   - GIN gin_trgm_ops: "some word starts with" (LIKE '%PEREZ%' then a word-boundary check)
+# table -> (source column, extra prefix-searchable columns)
+SEARCH_COLUMNS = {
+    'contactos_hjs': ('nombre_completo', []),
+    'empleados_empresas': ('nombre_completo', []),
+    'core_empresas': ('razon_social', ['nit']),
+}
+
+# Loaders run in parallel under run_pipeline.py; DDL on the shared function is serialized
+LOCK_SQL = "SELECT pg_advisory_xact_lock(hashtext('search_norm'));"
+
+# Lower and upper case, so the result does not depend on the database locale's upper()
+ACCENTED = 'áàäâéèëêíìïîóòöôúùüûñçÁÀÄÂÉÈËÊÍÌÏÎÓÒÖÔÚÙÜÛÑÇ'
+UNACCENTED = 'aaaaeeeeiiiioooouuuuncAAAAEEEEIIIIOOOOUUUUNC'
+
+def ensure_search_columns(cur, table):
+    # Same definitions as database/ddl.sql, for databases created before they existed
+    source, prefix_columns = SEARCH_COLUMNS[table]
+    cur.execute(LOCK_SQL)
+    cur.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm;")
+    # Never replaced once created: stored columns computed with an older body would
+    # silently disagree with new rows
+    cur.execute("SELECT to_regprocedure('search_norm(text)') IS NOT NULL;")
+    if not cur.fetchone()[0]:
+        cur.execute(f"""
+            CREATE FUNCTION search_norm(t TEXT) RETURNS TEXT AS $$
+                SELECT NULLIF(btrim(regexp_replace(
+                    upper(translate(t, '{ACCENTED}', '{UNACCENTED}')),
+                    '[^A-Z0-9]+', ' ', 'g'
+                )), '')
+            $$ LANGUAGE sql IMMUTABLE STRICT PARALLEL SAFE;
+        """)
+
+    cur.execute("""
+        SELECT 1 FROM information_schema.columns
+        WHERE table_name = %s AND column_name = 'nombre_busqueda'
+    """, (table,))
+    if not cur.fetchone():
+        start = time.time()
+        print(f"🔤 Adding search column to {table} (one-off table rewrite)...")
+        cur.execute(f"""
+            ALTER TABLE {table}
+            ADD COLUMN nombre_busqueda TEXT GENERATED ALWAYS AS (search_norm({source})) STORED;
+        """)
+        print(f"   ✅ Done in {time.time() - start:.1f}s")
+
+    cur.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_busqueda_prefijo ON {table} (nombre_busqueda text_pattern_ops);")
+    cur.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_busqueda_trgm ON {table} USING gin (nombre_busqueda gin_trgm_ops);")
+    for column in prefix_columns:
+        cur.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_{column}_prefijo ON {table} ({column} text_pattern_ops);")
@@ -0,0 +1,207 @@
+import os
+import numpy as np
+import pandas as pd
+import psycopg2.extras
+from io import StringIO
+
+# Declarative data-quality rules, evaluated column-wise over whole chunks.
+#   tipo:      requerido | formato | longitud_max | fecha | telefono | geo | en_conjunto
+#   severidad: 'rechazar' drops the row from the load; 'advertir' keeps it.
+# Every failure (either severity) is counted in validation_summary and written to
+# validation_rejects, up to MAX_REJECTS_PER_RULE rows per rule and run; the failures
+# past the cap are counted in validation_summary.filas_no_guardadas.
+# 'geo' rules are skipped (with a notice) while dim_divipole is empty, since every
+# row would fail them.
+DOCUMENTO_REGEX = r'^\d{4,15}$'
+NIT_REGEX = r'^\d{5,15}(-\d)?$'
+MAX_REJECTS_PER_RULE = int(os.getenv("VALIDATION_MAX_REJECTS_PER_RULE", "10000"))
+
+RULES = {
+    'CENSO.csv': [
+        {'regla': 'documento_requerido', 'tipo': 'requerido', 'columnas': ['identification_number'], 'severidad': 'rechazar'},
+        {'regla': 'documento_longitud', 'tipo': 'longitud_max', 'columnas': ['identification_number'], 'max': 20, 'severidad': 'rechazar'},
+        {'regla': 'documento_formato', 'tipo': 'formato', 'columnas': ['identification_number'], 'patron': DOCUMENTO_REGEX, 'severidad': 'advertir'},
+        {'regla': 'geo_en_divipole', 'tipo': 'geo', 'columnas': ['department_code', 'municipality_code'], 'severidad': 'advertir'},
+        {'regla': 'fecha_registro_valida', 'tipo': 'fecha', 'columnas': ['register_date'], 'severidad': 'advertir'},
+    ],
+    'EMPRESAS.csv': [
+        {'regla': 'empresa_id_requerido', 'tipo': 'requerido', 'columnas': ['company_id'], 'severidad': 'rechazar'},
+        {'regla': 'empresa_id_longitud', 'tipo': 'longitud_max', 'columnas': ['company_id'], 'max': 20, 'severidad': 'rechazar'},
+        {'regla': 'nit_requerido', 'tipo': 'requerido', 'columnas': ['identification_number'], 'severidad': 'rechazar'},
+        {'regla': 'nit_formato', 'tipo': 'formato', 'columnas': ['identification_number'], 'patron': NIT_REGEX, 'severidad': 'advertir'},
+        {'regla': 'nit_longitud', 'tipo': 'longitud_max', 'columnas': ['identification_number'], 'max': 20, 'severidad': 'rechazar'},
+        {'regla': 'razon_social_requerida', 'tipo': 'requerido', 'columnas': ['legal_name'], 'severidad': 'rechazar'},
+        {'regla': 'razon_social_longitud', 'tipo': 'longitud_max', 'columnas': ['legal_name', 'legal_representative'], 'max': 255, 'severidad': 'rechazar'},
+        {'regla': 'tipo_estado_longitud', 'tipo': 'longitud_max', 'columnas': ['status'], 'max': 50, 'severidad': 'rechazar'},
+        {'regla': 'tipo_empresa_longitud', 'tipo': 'longitud_max', 'columnas': ['company_type'], 'max': 100, 'severidad': 'rechazar'},
+        {'regla': 'extension_longitud', 'tipo': 'longitud_max', 'columnas': ['phone_extension'], 'max': 10, 'severidad': 'rechazar'},
+        {'regla': 'fecha_constitucion_valida', 'tipo': 'fecha', 'columnas': ['created_time'], 'severidad': 'advertir'},
+        {'regla': 'telefono_longitud', 'tipo': 'telefono', 'columnas': ['phone_number'], 'min': 7, 'max': 10, 'severidad': 'advertir'},
+        {'regla': 'geo_en_divipole', 'tipo': 'geo', 'columnas': ['department_code', 'municipality_code'], 'severidad': 'advertir'},
+    ],
+    'EMPLEADOS_EMPRESAS.csv': [
+        {'regla': 'empleado_id_requerido', 'tipo': 'requerido', 'columnas': ['nominated_citizen_id'], 'severidad': 'rechazar'},
+        {'regla': 'documento_formato', 'tipo': 'formato', 'columnas': ['identification_number'], 'patron': DOCUMENTO_REGEX, 'severidad': 'advertir'},
+        {'regla': 'empresa_existe', 'tipo': 'en_conjunto', 'columnas': ['company_id'], 'conjunto': 'empresas', 'severidad': 'advertir'},
+        {'regla': 'fecha_nacimiento_valida', 'tipo': 'fecha', 'columnas': ['birthday'], 'severidad': 'advertir'},
+        {'regla': 'celular_longitud', 'tipo': 'telefono', 'columnas': ['mobile_number'], 'min': 10, 'max': 10, 'severidad': 'advertir'},
+        {'regla': 'geo_en_divipole', 'tipo': 'geo', 'columnas': ['department_code', 'municipality_code'], 'severidad': 'advertir'},
+    ],
+    'REP_LEGAL_EMPRESA.csv': [
+        {'regla': 'contacto_id_requerido', 'tipo': 'requerido', 'columnas': ['company_contact_id'], 'severidad': 'rechazar'},
+        {'regla': 'empresa_requerida', 'tipo': 'requerido', 'columnas': ['company_id'], 'severidad': 'rechazar'},
+        {'regla': 'empresa_existe', 'tipo': 'en_conjunto', 'columnas': ['company_id'], 'conjunto': 'empresas', 'severidad': 'rechazar'},
+        {'regla': 'documento_formato', 'tipo': 'formato', 'columnas': ['document'], 'patron': DOCUMENTO_REGEX, 'severidad': 'advertir'},
+        {'regla': 'fecha_creacion_valida', 'tipo': 'fecha', 'columnas': ['created_time', 'discarted_time'], 'severidad': 'advertir'},
+        {'regla': 'telefono_longitud', 'tipo': 'telefono', 'columnas': ['phone_number'], 'min': 7, 'max': 10, 'severidad': 'advertir'},
+        {'regla': 'celular_longitud', 'tipo': 'telefono', 'columnas': ['mobile_number'], 'min': 10, 'max': 10, 'severidad': 'advertir'},
+    ],
+}
+
+def geo_key(dept, muni):
+    # Sources differ in zero padding ('1' vs '01'), so compare padded codes
+    return dept.astype('string').str.strip().str.zfill(2) + '|' + muni.astype('string').str.strip().str.zfill(3)
+
+def load_geo_keys(cur):
+    cur.execute("SELECT DISTINCT cod_departamento, cod_municipio FROM dim_divipole")
+    codes = pd.DataFrame(cur.fetchall(), columns=['dept', 'muni'])
+    if codes.empty:
+        print("⚠️ dim_divipole is empty: skipping the geo_en_divipole rule (run extract_divipole first)")
+    return set(geo_key(codes['dept'], codes['muni']).dropna())
+
+def failing_rows(df, rule, context):
+    """Boolean Series: True where the row breaks the rule. Missing values only fail 'requerido'
+    (and 'formato', whose columns are mandatory identifiers)."""
+    cols = [c for c in rule['columnas'] if c in df.columns]
+    fails = pd.Series(False, index=df.index)
+    if not cols:
+        return fails
+    tipo = rule['tipo']
+
+    if tipo == 'geo':
+        dept, muni = df[cols[0]], df[cols[1]]
+        present = dept.notna() & muni.notna()
+        return (present & ~geo_key(dept, muni).isin(context['geo']).fillna(False).astype(bool)).astype(bool)
+
+    for col in cols:
+        values = df[col].astype('string').str.strip()
+        present = (values.notna() & (values != '')).fillna(False).astype(bool)
+        if tipo == 'requerido':
+            fails |= ~present
+        elif tipo == 'formato':
+            fails |= ~(present & values.str.match(rule['patron']).fillna(False).astype(bool))
+        elif tipo == 'longitud_max':
+            fails |= present & (values.str.len() > rule['max']).fillna(False).astype(bool)
+        elif tipo == 'fecha':
+            fails |= present & pd.to_datetime(values, errors='coerce').isna()
+        elif tipo == 'telefono':
+            digits = values.str.replace(r'\.0$', '', regex=True).str.replace(r'\D', '', regex=True).str.len()
+            fails |= present & ~digits.between(rule['min'], rule['max']).fillna(False).astype(bool)
+        elif tipo == 'en_conjunto':
+            fails |= present & ~values.isin(context[rule['conjunto']]).fillna(False).astype(bool)
+    return fails.astype(bool)
+
+def validate_chunk(df, source, context, row_offset=0, key_column=None, stats=None):
+    """Evaluates every rule of `source` over the chunk.
+    Returns (mask of rows to keep, DataFrame of rejects). Per-rule counts accumulate in `stats`."""
+    keep = pd.Series(True, index=df.index)
+    rejects = []
+    stats = stats if stats is not None else {}
+
+    for rule in RULES[source]:
+        entry = stats.setdefault(rule['regla'], {'severidad': rule['severidad'], 'evaluadas': 0, 'fallidas': 0, 'no_guardadas': 0})
+        if rule['tipo'] == 'geo' and not context['geo']:
+            entry['omitida'] = True  # No DIVIPOLE codes to check against
+            continue
+        fails = failing_rows(df, rule, context)
+        entry['evaluadas'] += len(df)
+        n_fails = int(fails.sum())
+        if not n_fails:
+            continue
+
+        if rule['severidad'] == 'rechazar':
+            keep &= ~fails
+
+        room = max(MAX_REJECTS_PER_RULE - entry['fallidas'], 0)
+        entry['fallidas'] += n_fails
+        entry['no_guardadas'] += max(n_fails - room, 0)
+        if not room:
+            continue
+        positions = np.flatnonzero(fails.to_numpy())[:room]
+        failed = df.iloc[positions]
+        cols = [c for c in rule['columnas'] if c in df.columns]
+        rejects.append(pd.DataFrame({
+            'source': source,
+            'regla': rule['regla'],
+            'severidad': rule['severidad'],
+            'fila': positions + row_offset + 1, # 1-based data row in the source file
+            'clave': failed[key_column].astype('string').str.slice(0, 100).to_numpy() if key_column else None,
+            'valor': failed[cols].astype('string').fillna('').agg(' | '.join, axis=1).str.slice(0, 500).to_numpy(),
+        }))
+
+    rejects = pd.concat(rejects, ignore_index=True) if rejects else pd.DataFrame()
+    return keep, rejects
+
+def ensure_validation_tables(cur):
+    # Same definitions as database/ddl.sql, for databases created before they existed
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS validation_rejects (
+            reject_id BIGSERIAL PRIMARY KEY,
+            source VARCHAR(100) NOT NULL,
+            regla VARCHAR(100) NOT NULL,
+            severidad VARCHAR(20) NOT NULL,
+            fila BIGINT,
+            clave VARCHAR(100),
+            valor TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_validation_rejects_source ON validation_rejects(source, regla);")
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS validation_summary (
+            summary_id SERIAL PRIMARY KEY,
+            source VARCHAR(100) NOT NULL,
+            regla VARCHAR(100) NOT NULL,
+            severidad VARCHAR(20) NOT NULL,
+            filas_evaluadas BIGINT DEFAULT 0,
+            filas_fallidas BIGINT DEFAULT 0,
+            validated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+    """)
+    cur.execute("ALTER TABLE validation_summary ADD COLUMN IF NOT EXISTS filas_no_guardadas BIGINT DEFAULT 0;")
+
+def clear_rejects(cur, source):
+    # Only the latest run of each source is kept
+    cur.execute("DELETE FROM validation_rejects WHERE source = %s", (source,))
+
+def write_rejects(cur, rejects):
+    if rejects.empty:
+        return
+    buffer = StringIO()
+    rejects[['source', 'regla', 'severidad', 'fila', 'clave', 'valor']].to_csv(buffer, index=False, header=False)
+    buffer.seek(0)
+    cur.copy_expert(
+        "COPY validation_rejects (source, regla, severidad, fila, clave, valor) FROM STDIN WITH (FORMAT csv)",
+        buffer
+    )
+
+def record_summary(cur, source, stats):
+    if not stats:
+        return
+    psycopg2.extras.execute_values(cur, """
+        INSERT INTO validation_summary (source, regla, severidad, filas_evaluadas, filas_fallidas, filas_no_guardadas)
+        VALUES %s
+    """, [
+        (source, regla, s['severidad'], s['evaluadas'], s['fallidas'], s.get('no_guardadas', 0))
+        for regla, s in stats.items() if not s.get('omitida')
+    ])
+
+def print_summary(source, stats):
+    print(f"🧪 Validation summary for {source}:")
+    for regla, s in stats.items():
+        if s.get('omitida'):
+            print(f"   ⏭️ {regla:<28} skipped (dim_divipole empty)")
+            continue
+        icon = '✅' if not s['fallidas'] else ('❌' if s['severidad'] == 'rechazar' else '⚠️')
+        capped = f", {s['no_guardadas']} not stored in validation_rejects" if s.get('no_guardadas') else ""
+        print(f"   {icon} {regla:<28} {s['fallidas']:>9} / {s['evaluadas']} ({s['severidad']}{capped})")
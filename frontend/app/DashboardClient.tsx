@@ -66,6 +66,7 @@ export default function DashboardClient({ summary: initialSummary }: { summary:
     const [municipiosData, setMunicipiosData] = useState<any[]>([]);
     const [puestosDrillData, setPuestosDrillData] = useState<any[]>([]);
     const [selectedMunicipio, setSelectedMunicipio] = useState<string | null>(null);
+    const [mapMetric, setMapMetric] = useState('cobertura_pct');
 
     const [mounted, setMounted] = useState(false);
     useEffect(() => { setMounted(true); }, []);
@@ -120,17 +121,20 @@ export default function DashboardClient({ summary: initialSummary }: { summary:
         const fetchDeptData = async () => {
             if (activeRegionCode) {
                 try {
-                    const [summaryRes, mesasRes, empresasRes, municipiosRes] = await Promise.all([
+                    const [summaryRes, mesasRes, empresasRes, municipiosRes, topCompaniesRes] = await Promise.all([
                         fetch(`${API_BASE}/api/geo/summary?cod_dept=${activeRegionCode}`),
                         fetch(`${API_BASE}/api/analytics/mesas-by-dept?cod_dept=${activeRegionCode}`),
                         fetch(`${API_BASE}/api/analytics/empresas-by-dept?cod_dept=${activeRegionCode}`),
-                        fetch(`${API_BASE}/api/analytics/municipios-by-dept?cod_dept=${activeRegionCode}`)
+                        fetch(`${API_BASE}/api/analytics/municipios-by-dept?cod_dept=${activeRegionCode}`),
+                        fetch(`${API_BASE}/api/analytics/top-companies?cod_dept=${activeRegionCode}&limit=10`)
                     ]);
 
                     if (summaryRes.ok) setSummary(await summaryRes.json());
                     if (mesasRes.ok) setMesasData(await mesasRes.json());
                     if (empresasRes.ok) setEmpresasByDeptData(await empresasRes.json());
                     if (municipiosRes.ok) setMunicipiosData(await municipiosRes.json());
+                    // The national top 50 rarely holds ten companies of a given department
+                    if (topCompaniesRes.ok) setTopCompaniesData(await topCompaniesRes.json());
                     setPuestosDrillData([]);
                     setSelectedMunicipio(null);
                 } catch (error) {
@@ -143,12 +147,14 @@ export default function DashboardClient({ summary: initialSummary }: { summary:
                 setPuestosDrillData([]);
                 setSelectedMunicipio(null);
                 // Refetch all data
-                const [mesasRes, empresasRes] = await Promise.all([
+                const [mesasRes, empresasRes, topCompaniesRes] = await Promise.all([
                     fetch(`${API_BASE}/api/analytics/mesas-by-dept`),
-                    fetch(`${API_BASE}/api/analytics/empresas-by-dept`)
+                    fetch(`${API_BASE}/api/analytics/empresas-by-dept`),
+                    fetch(`${API_BASE}/api/analytics/top-companies`)
                 ]);
                 if (mesasRes.ok) setMesasData(await mesasRes.json());
                 if (empresasRes.ok) setEmpresasByDeptData(await empresasRes.json());
+                if (topCompaniesRes.ok) setTopCompaniesData(await topCompaniesRes.json());
             }
         };
         fetchDeptData();
@@ -346,11 +352,27 @@ export default function DashboardClient({ summary: initialSummary }: { summary:
                 <div className="lg:col-span-4 space-y-5">
                     {/* Map */}
                     <div className="glass-panel rounded-2xl p-4">
-                        <h3 className="text-white font-bold text-sm mb-2">Mapa de Colombia</h3>
+                        <div className="flex items-center justify-between mb-2">
+                            <h3 className="text-white font-bold text-sm">Mapa de Colombia</h3>
+                            <select
+                                value={mapMetric}
+                                onChange={(e) => setMapMetric(e.target.value)}
+                                className="bg-black/40 border border-gray-800 rounded px-2 py-1 text-xs text-gray-300"
+                            >
+                                <option value="cobertura_pct">Cobertura %</option>
+                                <option value="censo">Censo</option>
+                                <option value="contactos">Contactos</option>
+                                <option value="empleados">Empleados</option>
+                                <option value="empresas">Empresas</option>
+                                <option value="mesas">Mesas</option>
+                            </select>
+                        </div>
                         <div className="h-[350px]">
                             <ColombiaMap
                                 onRegionClick={handleRegionClick}
                                 activeRegionId={activeRegionCode || ''}
+                                apiBase={API_BASE}
+                                metric={mapMetric}
                             />
                         </div>
                     </div>
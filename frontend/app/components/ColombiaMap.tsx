@@ -1,22 +1,86 @@
 import { useEffect, useRef, useState } from 'react';
 import * as d3 from 'd3-geo';
-import { feature } from 'topojson-client'; // Note: using raw geojson, no topojson needed, but d3 handles it.
+import { feature } from 'topojson-client';
+
+// Levels built by build_map_assets.py: the coarse one paints almost immediately on slow
+// connections, then the detailed one replaces it. Both are cached by the browser forever.
+const MAP_LAYERS = { departamento: 'departamentos', municipio: 'municipios' };
+const MAP_LEVELS = ['low', 'medium'];
 
 interface ColombiaMapProps {
     onRegionClick: (regionName: string, regionId: string) => void;
     activeRegionId?: string; // We use ID (Divipole code) for selection
+    // Choropleth: colors each region by /api/geo/choropleth. Without a metric the map is plain.
+    apiBase?: string;
+    level?: 'departamento' | 'municipio';
+    metric?: string;
 }
 
-export default function ColombiaMap({ onRegionClick, activeRegionId }: ColombiaMapProps) {
+export default function ColombiaMap({ onRegionClick, activeRegionId, apiBase, level = 'departamento', metric }: ColombiaMapProps) {
     const [geoData, setGeoData] = useState<any>(null);
+    const [geoLevel, setGeoLevel] = useState<string>('departamento');
     const [hoveredRegion, setHoveredRegion] = useState<string | null>(null);
+    const [choropleth, setChoropleth] = useState<{ values: Map<string, number>, min: number, max: number } | null>(null);
 
     useEffect(() => {
-        fetch('/maps/colombia.json')
+        let cancelled = false;
+
+        const loadLevels = async () => {
+            const manifest = await fetch('/geo/manifest.json').then(res => {
+                if (!res.ok) throw new Error(`manifest: HTTP ${res.status}`);
+                return res.json();
+            });
+            // Municipality geometry is optional (needs an external source): fall back to departments
+            const drawn = manifest.layers[MAP_LAYERS[level]] ? level : 'departamento';
+            const layer = manifest.layers[MAP_LAYERS[drawn]];
+            for (const level of MAP_LEVELS) {
+                const asset = layer.levels[level];
+                if (!asset) continue;
+                const topology = await fetch(`/geo/${asset.file}`).then(res => res.json());
+                if (cancelled) return;
+                setGeoData(feature(topology, topology.objects[layer.object]));
+                setGeoLevel(drawn);
+            }
+        };
+
+        loadLevels().catch(err => {
+            // Assets not built: fall back to the full-resolution GeoJSON
+            console.warn("Map assets unavailable, loading full GeoJSON", err);
+            fetch('/maps/colombia.json')
+                .then(res => res.json())
+                .then(data => { if (!cancelled) { setGeoData(data); setGeoLevel('departamento'); } })
+                .catch(err => console.error("Failed to load map data", err));
+        });
+
+        return () => { cancelled = true; };
+    }, [level]);
+
+    useEffect(() => {
+        if (!apiBase || !metric) {
+            setChoropleth(null);
+            return;
+        }
+        let cancelled = false;
+        fetch(`${apiBase}/api/geo/choropleth?level=${geoLevel}&metric=${metric}`)
             .then(res => res.json())
-            .then(data => setGeoData(data))
-            .catch(err => console.error("Failed to load map data", err));
-    }, []);
+            .then(data => {
+                if (cancelled) return;
+                const values = new Map<string, number>();
+                data.codes.forEach((code: string, i: number) => values.set(code, data.values[i]));
+                setChoropleth({ values, min: data.min, max: data.max });
+            })
+            .catch(err => console.error("Failed to load choropleth", err));
+        return () => { cancelled = true; };
+    }, [apiBase, geoLevel, metric]);
+
+    // Opacity of the accent fill, 0.1 for the lowest value to 0.9 for the highest
+    const fillOpacity = (id: string) => {
+        const value = choropleth?.values.get(id);
+        if (!choropleth || value === undefined) return undefined;
+        const span = choropleth.max - choropleth.min;
+        return 0.1 + 0.8 * (span > 0 ? (value - choropleth.min) / span : 1);
+    };
+    const regionName = (f: any) => f.properties.NOMBRE_MPIO || f.properties.NOMBRE_DPT;
 
     if (!geoData) return <div className="flex items-center justify-center h-full text-brand-accent animate-pulse">Cargando mapa...</div>;
 
@@ -41,9 +105,10 @@ export default function ColombiaMap({ onRegionClick, activeRegionId }: ColombiaM
 
                 {geoData.features.map((feature: any) => {
                     const id = feature.id || feature.properties.DPTO;
-                    const name = feature.properties.NOMBRE_DPT;
+                    const name = regionName(feature);
                     const isActive = activeRegionId === id || activeRegionId === name;
                     const isHovered = hoveredRegion === id;
+                    const opacity = isActive ? undefined : fillOpacity(id);
 
                     return (
                         <path
@@ -53,17 +118,20 @@ export default function ColombiaMap({ onRegionClick, activeRegionId }: ColombiaM
                                 cursor-pointer transition-all duration-300 stroke-[0.5]
                                 ${isActive
                                     ? 'fill-brand-accent stroke-white stroke-2 active-region-glow'
-                                    : 'fill-white/10 stroke-white/20 hover:fill-brand-accent/60'
+                                    : opacity !== undefined
+                                        ? 'fill-brand-accent stroke-white/20 hover:stroke-white'
+                                        : 'fill-white/10 stroke-white/20 hover:fill-brand-accent/60'
                                 }
                             `}
                             style={{
-                                filter: isActive || isHovered ? 'url(#glow)' : 'none'
+                                filter: isActive || isHovered ? 'url(#glow)' : 'none',
+                                fillOpacity: opacity
                             }}
                             onMouseEnter={() => setHoveredRegion(id)}
                             onMouseLeave={() => setHoveredRegion(null)}
                             onClick={() => onRegionClick(name, id)}
                         >
-                            <title>{name}</title>
+                            <title>{name}{choropleth?.values.has(id) ? `: ${choropleth.values.get(id)!.toLocaleString()}` : ''}</title>
                         </path>
                     );
                 })}
@@ -72,7 +140,8 @@ export default function ColombiaMap({ onRegionClick, activeRegionId }: ColombiaM
             {/* Tooltip Effect for Hovered Region Name */}
             {hoveredRegion && (
                 <div className="absolute bottom-4 left-4 pointer-events-none bg-black/80 backdrop-blur px-3 py-1 rounded border border-brand-accent/50 text-white text-xs font-bold tracking-wider">
-                    {geoData.features.find((f: any) => (f.id || f.properties.DPTO) === hoveredRegion)?.properties.NOMBRE_DPT}
+                    {regionName(geoData.features.find((f: any) => (f.id || f.properties.DPTO) === hoveredRegion) || { properties: {} })}
+                    {choropleth?.values.has(hoveredRegion) && ` · ${choropleth.values.get(hoveredRegion)!.toLocaleString()}`}
                 </div>
             )}
         </div>
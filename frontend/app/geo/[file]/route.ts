@@ -0,0 +1,57 @@
+import { readFile } from 'fs/promises';
+import path from 'path';
+
+// Serves the map geometry built by build_map_assets.py from map-assets/.
+// Hashed files are immutable and served precompressed (brotli > gzip > identity);
+// manifest.json is revalidated on every load so new builds are picked up.
+export const runtime = 'nodejs';
+
+const ASSET_DIR = path.join(process.cwd(), 'map-assets');
+const HASHED_FILE = /^[a-z0-9-]+\.[a-z]+\.[0-9a-f]{12}\.topo\.json$/;
+
+const ENCODINGS: [string, string][] = [['br', '.br'], ['gzip', '.gz']];
+const fileCache = new Map<string, Buffer | null>();
+
+async function readAsset(name: string): Promise<Buffer | null> {
+    if (!fileCache.has(name)) {
+        const data = await readFile(path.join(ASSET_DIR, name)).catch(() => null);
+        fileCache.set(name, data);
+    }
+    return fileCache.get(name) ?? null;
+}
+
+export async function GET(request: Request, { params }: { params: { file: string } }) {
+    const name = params.file;
+
+    if (name === 'manifest.json') {
+        // Not cached in memory: a rebuild must be visible without restarting
+        const data = await readFile(path.join(ASSET_DIR, name)).catch(() => null);
+        if (!data) return new Response('Not found', { status: 404 });
+        return new Response(data, {
+            headers: { 'Content-Type': 'application/json', 'Cache-Control': 'no-cache' },
+        });
+    }
+
+    // Only hashed asset names: no path traversal, and the hash doubles as ETag
+    if (!HASHED_FILE.test(name)) return new Response('Not found', { status: 404 });
+    const etag = `"${name.split('.')[2]}"`;
+    const headers: Record<string, string> = {
+        'Content-Type': 'application/json',
+        'Cache-Control': 'public, max-age=31536000, immutable',
+        'ETag': etag,
+        'Vary': 'Accept-Encoding',
+    };
+    if (request.headers.get('if-none-match') === etag) {
+        return new Response(null, { status: 304, headers });
+    }
+
+    const accepted = request.headers.get('accept-encoding') || '';
+    for (const [encoding, suffix] of ENCODINGS) {
+        if (!accepted.includes(encoding)) continue;
+        const data = await readAsset(name + suffix);
+        if (data) return new Response(data, { headers: { ...headers, 'Content-Encoding': encoding } });
+    }
+    const data = await readAsset(name);
+    if (!data) return new Response('Not found', { status: 404 });
+    return new Response(data, { headers });
+}
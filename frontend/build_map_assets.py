@@ -0,0 +1,321 @@
+import os
+import re
+import csv
+import json
+import gzip
+import glob
+import hashlib
+import argparse
+import unicodedata
+
+try:
+    import brotli # Optional: pip install brotli
+except ImportError:
+    brotli = None
+
+# Builds the map geometry served at /geo/<file> (app/geo/[file]/route.ts).
+# For each layer (departamentos, optionally municipios) and level of detail it writes:
+#   - TopoJSON with shared borders (arcs) and quantized, delta-encoded coordinates.
+#     Shared arcs are simplified once, so neighbouring polygons never get gaps.
+#   - .gz and .br variants next to it, so the server never compresses on the fly.
+#   - Content-hashed file names, listed in manifest.json, so they can be cached forever.
+# Feature ids are DIVIPOLE codes: 2 digits for departments, 5 (dept + muni) for
+# municipalities, the same codes /api/geo/choropleth returns.
+#
+# Usage:
+#   python build_map_assets.py
+#   python build_map_assets.py --municipios MGN_MPIO_POLITICO.geojson --divipole divipole_municipios.csv
+# The divipole CSV maps municipality names to DIVIPOLE codes (DANE codes differ):
+#   \copy (SELECT DISTINCT cod_departamento, cod_municipio, nom_departamento, nom_municipio
+#          FROM dim_divipole) TO 'divipole_municipios.csv' CSV HEADER
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_INPUT = os.path.join(BASE_DIR, 'public', 'maps', 'colombia.json')
+DEFAULT_OUTPUT = os.path.join(BASE_DIR, 'map-assets')
+
+# level -> (quantization grid size, simplification tolerance in degrees)
+# At the dashboard's projection 1 degree is ~30 px, so 'low' is already sub-pixel there.
+LEVELS = {
+    'low': (10000, 0.02),
+    'medium': (100000, 0.005),
+    'high': (100000, 0.0),
+}
+
+def iter_polygons(geometry):
+    if geometry is None:
+        return []
+    if geometry['type'] == 'Polygon':
+        return [geometry['coordinates']]
+    if geometry['type'] == 'MultiPolygon':
+        return geometry['coordinates']
+    return []
+
+def normalize_name(text):
+    # Same normalization as etl/geo_resolver.py
+    text = ''.join(
+        c for c in unicodedata.normalize('NFD', str(text or '').upper())
+        if unicodedata.category(c) != 'Mn'
+    )
+    return re.sub(r'[^A-Z0-9]+', ' ', text).strip()
+
+def prepare_departamentos(features):
+    prepared = []
+    for f in features:
+        props = f['properties']
+        prepared.append({
+            'id': f.get('id') or props.get('DPTO'),
+            'properties': {'DPTO': props.get('DPTO'), 'NOMBRE_DPT': props.get('NOMBRE_DPT')},
+            'geometry': f['geometry'],
+        })
+    return prepared
+
+def prepare_municipios(features, divipole_csv, code_field, dept_field, name_field):
+    """Keys municipality features by DIVIPOLE code: taken from code_field when the source
+    has it, otherwise matched by (department name, municipality name) against divipole_csv."""
+    by_dept_name, by_name = {}, {}
+    if divipole_csv:
+        with open(divipole_csv, 'r', encoding='utf-8') as f:
+            for row in csv.DictReader(f):
+                code = row['cod_departamento'].zfill(2) + row['cod_municipio'].zfill(3)
+                dept, name = normalize_name(row['nom_departamento']), normalize_name(row['nom_municipio'])
+                by_dept_name[(dept, name)] = code
+                by_dept_name[(dept, name.replace(' ', ''))] = code
+                by_name.setdefault(name, set()).add(code)
+
+    prepared, unmatched = [], []
+    for f in features:
+        props = f['properties']
+        name = props.get(name_field)
+        if code_field:
+            raw = str(props.get(code_field) or '').strip()
+            code = raw.zfill(5) if raw else None
+        else:
+            dept, muni = normalize_name(props.get(dept_field)), normalize_name(name)
+            code = by_dept_name.get((dept, muni)) or by_dept_name.get((dept, muni.replace(' ', '')))
+            if not code and len(by_name.get(muni, ())) == 1:
+                code = next(iter(by_name[muni])) # Unique name nationwide: department spelled differently
+        if not code:
+            unmatched.append(f"{props.get(dept_field)} / {name}")
+        prepared.append({
+            'id': code,
+            'properties': {'DPTO': code[:2] if code else None, 'NOMBRE_MPIO': name},
+            'geometry': f['geometry'],
+        })
+
+    if unmatched:
+        print(f"⚠️ {len(unmatched)} municipalities without DIVIPOLE code (drawn, not colorable):")
+        for item in unmatched[:20]:
+            print(f"   {item}")
+    return prepared
+
+def compute_bbox(features):
+    xs, ys = [], []
+    for feature in features:
+        for polygon in iter_polygons(feature['geometry']):
+            for ring in polygon:
+                xs.extend(p[0] for p in ring)
+                ys.extend(p[1] for p in ring)
+    return min(xs), min(ys), max(xs), max(ys)
+
+def quantize_ring(ring, x0, y0, kx, ky):
+    points = []
+    for x, y in ring:
+        point = (round((x - x0) * kx), round((y - y0) * ky))
+        if not points or point != points[-1]:
+            points.append(point)
+    if points[0] != points[-1]:
+        points.append(points[0])
+    return points
+
+def find_junctions(rings):
+    """Points where borders meet or split: reached from different neighbours by different rings."""
+    neighbours = {}
+    junctions = set()
+    for ring in rings:
+        n = len(ring) - 1
+        for i in range(n):
+            pair = frozenset((ring[i - 1], ring[i + 1]))
+            seen = neighbours.setdefault(ring[i], pair)
+            if seen != pair:
+                junctions.add(ring[i])
+    return junctions
+
+def split_ring(ring, junctions):
+    """Cuts a closed ring into arcs that start and end at junctions."""
+    body = ring[:-1]
+    cuts = [i for i, p in enumerate(body) if p in junctions]
+    if not cuts:
+        # Closed arc: start at the smallest point so identical rings map to the same arc
+        start = body.index(min(body))
+        rotated = body[start:] + body[:start]
+        return [rotated + [rotated[0]]]
+    rotated = body[cuts[0]:] + body[:cuts[0]]
+    offsets = [i - cuts[0] for i in cuts] + [len(body)]
+    rotated.append(rotated[0])
+    return [rotated[a:b + 1] for a, b in zip(offsets, offsets[1:])]
+
+def douglas_peucker(points, tolerance):
+    if tolerance <= 0 or len(points) <= 2:
+        return points
+    keep = [False] * len(points)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    tol2 = tolerance * tolerance
+    while stack:
+        first, last = stack.pop()
+        (ax, ay), (bx, by) = points[first], points[last]
+        dx, dy = bx - ax, by - ay
+        seg2 = dx * dx + dy * dy
+        max_d2, index = 0, None
+        for i in range(first + 1, last):
+            px, py = points[i]
+            if seg2 == 0:
+                d2 = (px - ax) ** 2 + (py - ay) ** 2
+            else:
+                t = max(0, min(1, ((px - ax) * dx + (py - ay) * dy) / seg2))
+                d2 = (px - ax - t * dx) ** 2 + (py - ay - t * dy) ** 2
+            if d2 > max_d2:
+                max_d2, index = d2, i
+        if index is not None and max_d2 > tol2:
+            keep[index] = True
+            stack.extend([(first, index), (index, last)])
+    return [p for p, k in zip(points, keep) if k]
+
+def simplify_arc(arc, tolerance):
+    if arc[0] != arc[-1]:
+        return douglas_peucker(arc, tolerance)
+    # Closed arc: anchor at the point farthest from the start so both halves keep shape
+    far = max(range(len(arc)), key=lambda i: (arc[i][0] - arc[0][0]) ** 2 + (arc[i][1] - arc[0][1]) ** 2)
+    simplified = douglas_peucker(arc[:far + 1], tolerance) + douglas_peucker(arc[far:], tolerance)[1:]
+    if len(simplified) < 4:
+        # Keep small islands as (at least) triangles instead of dropping them
+        step = max(1, (len(arc) - 1) // 3)
+        simplified = [arc[0], arc[step], arc[min(2 * step, len(arc) - 2)], arc[0]]
+    return simplified
+
+def delta_encode(arc):
+    encoded = [list(arc[0])]
+    for (px, py), (x, y) in zip(arc, arc[1:]):
+        encoded.append([x - px, y - py])
+    return encoded
+
+def build_topology(features, layer, quantization, tolerance_degrees):
+    x0, y0, x1, y1 = compute_bbox(features)
+    kx, ky = (quantization - 1) / (x1 - x0), (quantization - 1) / (y1 - y0)
+
+    quantized = [
+        [[quantize_ring(ring, x0, y0, kx, ky) for ring in polygon] for polygon in iter_polygons(f['geometry'])]
+        for f in features
+    ]
+    junctions = find_junctions([ring for polygons in quantized for polygon in polygons for ring in polygon])
+
+    arcs, arc_index = [], {}
+    def arc_ref(arc):
+        key = tuple(arc)
+        if key in arc_index:
+            return arc_index[key]
+        reverse = tuple(reversed(arc))
+        if reverse in arc_index:
+            return ~arc_index[reverse]
+        arc_index[key] = len(arcs)
+        arcs.append(arc)
+        return arc_index[key]
+
+    geometries = []
+    for feature, polygons in zip(features, quantized):
+        polygon_refs = [[[arc_ref(a) for a in split_ring(ring, junctions)] for ring in polygon] for polygon in polygons]
+        geometry = {'id': feature['id'], 'properties': feature['properties']}
+        if len(polygon_refs) == 1:
+            geometry.update(type='Polygon', arcs=polygon_refs[0])
+        else:
+            geometry.update(type='MultiPolygon', arcs=polygon_refs)
+        geometries.append(geometry)
+
+    tolerance = tolerance_degrees * min(kx, ky)
+    simplified = [simplify_arc(arc, tolerance) for arc in arcs]
+
+    return {
+        'type': 'Topology',
+        'bbox': [x0, y0, x1, y1],
+        'transform': {'scale': [1 / kx, 1 / ky], 'translate': [x0, y0]},
+        'objects': {layer: {'type': 'GeometryCollection', 'geometries': geometries}},
+        'arcs': [delta_encode(arc) for arc in simplified],
+    }
+
+def write_variants(output_dir, name, payload):
+    """Writes name plus its .gz/.br variants. Returns the sizes."""
+    sizes = {'bytes': len(payload)}
+    with open(os.path.join(output_dir, name), 'wb') as f:
+        f.write(payload)
+    # mtime=0 keeps the .gz byte-identical across builds of the same content
+    gz = gzip.compress(payload, compresslevel=9, mtime=0)
+    with open(os.path.join(output_dir, name + '.gz'), 'wb') as f:
+        f.write(gz)
+    sizes['gzip_bytes'] = len(gz)
+    if brotli:
+        br = brotli.compress(payload, quality=11)
+        with open(os.path.join(output_dir, name + '.br'), 'wb') as f:
+            f.write(br)
+        sizes['brotli_bytes'] = len(br)
+    return sizes
+
+def build_layer(layer, features, output_dir):
+    """Writes every level of one layer. Returns (manifest entry, file names written)."""
+    entry = {'object': layer, 'levels': {}}
+    written = set()
+    for level, (quantization, tolerance) in LEVELS.items():
+        topology = build_topology(features, layer, quantization, tolerance)
+        payload = json.dumps(topology, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        digest = hashlib.sha256(payload).hexdigest()[:12]
+        name = f"colombia-{layer}.{level}.{digest}.topo.json"
+        sizes = write_variants(output_dir, name, payload)
+        written.update({name, name + '.gz', name + '.br'})
+        entry['levels'][level] = dict(file=name, **sizes)
+        print(f"🗺️ {layer} {level:<6} {name}: {sizes['bytes'] / 1024:.0f} KB, gzip {sizes['gzip_bytes'] / 1024:.0f} KB"
+              + (f", brotli {sizes['brotli_bytes'] / 1024:.0f} KB" if 'brotli_bytes' in sizes else ''))
+
+    # Drop assets from previous builds of this layer
+    for path in glob.glob(os.path.join(output_dir, f"colombia-{layer}.*")):
+        if os.path.basename(path) not in written:
+            os.remove(path)
+    return entry
+
+def read_features(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)['features']
+
+def main():
+    parser = argparse.ArgumentParser(description="Builds simplified, precompressed map geometry for the dashboard.")
+    parser.add_argument('--departamentos', default=DEFAULT_INPUT, help="Department GeoJSON (normalize_map.py output).")
+    parser.add_argument('--municipios', help="Municipality GeoJSON, e.g. DANE MGN_MPIO_POLITICO. Layer kept as is if omitted.")
+    parser.add_argument('--divipole', help="CSV with cod_departamento, cod_municipio, nom_departamento, nom_municipio.")
+    parser.add_argument('--code-field', help="Property already holding the 5-digit DIVIPOLE code (skips name matching).")
+    parser.add_argument('--dept-field', default='DPTO_CNMBR', help="Department name property of the municipality source.")
+    parser.add_argument('--name-field', default='MPIO_CNMBR', help="Municipality name property of the municipality source.")
+    parser.add_argument('--output', default=DEFAULT_OUTPUT)
+    args = parser.parse_args()
+    if args.municipios and not (args.divipole or args.code_field):
+        parser.error("--municipios needs --divipole or --code-field to key features by DIVIPOLE code")
+
+    os.makedirs(args.output, exist_ok=True)
+    manifest_path = os.path.join(args.output, 'manifest.json')
+    manifest = {'layers': {}}
+    if os.path.exists(manifest_path):
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+
+    manifest['layers']['departamentos'] = build_layer(
+        'departamentos', prepare_departamentos(read_features(args.departamentos)), args.output
+    )
+    if args.municipios:
+        features = prepare_municipios(
+            read_features(args.municipios), args.divipole, args.code_field, args.dept_field, args.name_field
+        )
+        manifest['layers']['municipios'] = build_layer('municipios', features, args.output)
+
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    if not brotli:
+        print("⚠️ brotli not installed: only gzip variants were written (pip install brotli)")
+
+if __name__ == "__main__":
+    main()
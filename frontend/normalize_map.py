@@ -1,8 +1,13 @@
+import os
+import sys
 import json
 
-# Path matches where we copied it
-input_path = '/mnt/e/Data_Horacio/Dashboard/frontend/public/maps/colombia.json'
-output_path = '/mnt/e/Data_Horacio/Dashboard/frontend/public/maps/colombia.json'
+# Defaults to the map served by the frontend, relative to this script (any OS/checkout).
+# Usage: python normalize_map.py [input.geojson] [output.geojson]
+# Afterwards run build_map_assets.py to regenerate the simplified/compressed variants.
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'public', 'maps', 'colombia.json')
+input_path = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_PATH
+output_path = sys.argv[2] if len(sys.argv) > 2 else input_path
 
 with open(input_path, 'r', encoding='utf-8') as f:
     data = json.load(f)
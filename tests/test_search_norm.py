@@ -0,0 +1,42 @@
+import os
+import re
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'backend'))
+sys.path.insert(0, os.path.join(ROOT, 'etl'))
+
+import search_index
+from search_norm import ACCENTED, UNACCENTED, search_text
+
+SAMPLES = [
+    'José  Pérez-G.', 'MARÍA ÁNGELES NÚÑEZ', 'Françoise Müller', 'peña & cía. s.a.s',
+    'JOÃO CONCEIÇÃO', 'Ãngela Õliveira', 'Åsa Ýñiguez', 'Straße 12', 'ǅuro', '  ', '123.456-7',
+    'Iıstanbul', 'ſanta', 'ﬁesta',
+]
+
+def sql_search_norm(text, accented, unaccented):
+    """search_norm() as the database runs it: translate(), upper() one character at a time,
+    then everything but A-Z/0-9 to single spaces (NULLIF(..., '') aside)."""
+    text = text.translate(str.maketrans(accented, unaccented))
+    text = ''.join(c.upper() if len(c.upper()) == 1 else c for c in text)
+    return re.sub(r'[^A-Z0-9]+', ' ', text).strip()
+
+class SearchNormTest(unittest.TestCase):
+    def test_same_table_everywhere(self):
+        with open(os.path.join(ROOT, 'database', 'ddl.sql'), encoding='utf-8') as f:
+            ddl = f.read()
+        function = ddl[ddl.index('CREATE FUNCTION search_norm'):]
+        self.assertEqual(
+            re.search(r"translate\(t, '([^']*)', '([^']*)'\)", function).groups(), (ACCENTED, UNACCENTED)
+        )
+        self.assertEqual((search_index.ACCENTED, search_index.UNACCENTED), (ACCENTED, UNACCENTED))
+
+    def test_search_text_matches_sql(self):
+        for sample in SAMPLES:
+            with self.subTest(sample=sample):
+                self.assertEqual(search_text(sample), sql_search_norm(sample, ACCENTED, UNACCENTED))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,13 @@
+import os
+import sys
 import json
 
+# Usage: python update_geojson_codes.py [path.geojson] (defaults to the bundled department map)
+GEOJSON_PATH = sys.argv[1] if len(sys.argv) > 1 else os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    'frontend', 'mapa_departamentos_colombia', 'colombia.geo.json'
+)
+
 # DANE to DIVIPOLE mapping
 DANE_TO_DIVIPOLE = {
     "05": "01", # Antioquia
@@ -38,7 +46,7 @@ DANE_TO_DIVIPOLE = {
 }
 
 # Read the GeoJSON file
-with open(r'E:\Data_Horacio\Dashboard\frontend\mapa_departamentos_colombia\colombia.geo.json', 'r', encoding='utf-8') as f:
+with open(GEOJSON_PATH, 'r', encoding='utf-8') as f:
     geojson = json.load(f)
 
 # Update DPTO codes
@@ -53,7 +61,7 @@ for feature in geojson['features']:
         print(f"WARNING: No mapping for DANE code {old_code} ({feature['properties'].get('NOMBRE_DPT', 'Unknown')})")
 
 # Write updated GeoJSON
-with open(r'E:\Data_Horacio\Dashboard\frontend\mapa_departamentos_colombia\colombia.geo.json', 'w', encoding='utf-8') as f:
+with open(GEOJSON_PATH, 'w', encoding='utf-8') as f:
     json.dump(geojson, f, ensure_ascii=False)
 
 print(f"\nTotal features updated: {updated_count}")